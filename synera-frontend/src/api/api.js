@@ -20,4 +20,26 @@ API.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// List endpoints are cursor-paginated ({ next, previous, results }).
+// Fetch one page; pass its `next` back in to load the following one
+export const fetchPage = async (url, config) => {
+  const response = await API.get(url, config);
+  return { items: response.data.results, next: response.data.next };
+};
+
+// One request for a multi-select action on "leads" or "customers":
+// method is "post" (create), "patch" (items carry an id) or "delete" (ids).
+// Resolves to one { id, status, data | errors } result per item.
+export const bulk = async (resource, method, items) => {
+  const response = await API.request({ url: `${resource}/bulk/`, method, data: items });
+  return response.data.results;
+};
+
+// Start the Gmail OAuth flow. The redirects to Google and back carry no
+// JWT, so ask the API (which has it) for a consent URL bound to this user
+export const connectGmail = async () => {
+  const response = await API.get("gmail/auth-url/");
+  window.location.href = response.data.url;
+};
+
 export default API;
@@ -1,5 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import api from '../api/api';
+import CustomerPicker from './CustomerPicker';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import {
@@ -36,7 +37,7 @@ const getSentimentChip = (sentiment) => {
 };
 
 function AddLead() {
-  const [customers, setCustomers] = useState([]);
+  const [customer, setCustomer] = useState(null);
   const [formData, setFormData] = useState({
     title: '',
     description: '',
@@ -48,18 +49,6 @@ function AddLead() {
 
   const navigate = useNavigate();
 
-  useEffect(() => {
-    const fetchCustomers = async () => {
-      try {
-        const response = await api.get('customers/');
-        setCustomers(response.data);
-      } catch {
-        toast.error('Failed to load customers.');
-      }
-    };
-    fetchCustomers();
-  }, []);
-
   const handleChange = (e) => {
     const { name, value } = e.target;
     setFormData((prev) => ({ ...prev, [name]: value }));
@@ -92,6 +81,7 @@ function AddLead() {
         status: 'new',
         customer_id: '',
       });
+      setCustomer(null);
     } catch (error) {
       if (error.response?.data) {
         toast.error('Error: ' + JSON.stringify(error.response.data));
@@ -144,25 +134,14 @@ function AddLead() {
                 <MenuItem value="won">Won</MenuItem>
               </Select>
             </FormControl>
-            <FormControl fullWidth required>
-              <InputLabel id="customer-label">Customer</InputLabel>
-              <Select
-                labelId="customer-label"
-                label="Customer"
-                name="customer_id"
-                value={formData.customer_id}
-                onChange={handleChange}
-              >
-                <MenuItem value="">
-                  <em>Select Customer</em>
-                </MenuItem>
-                {customers.map((customer) => (
-                  <MenuItem key={customer.id} value={customer.id}>
-                    {customer.name}
-                  </MenuItem>
-                ))}
-              </Select>
-            </FormControl>
+            <CustomerPicker
+              value={customer}
+              required
+              onChange={(selected) => {
+                setCustomer(selected);
+                setFormData((prev) => ({ ...prev, customer_id: selected?.id || '' }));
+              }}
+            />
             <Button variant="contained" type="submit" fullWidth disabled={loading}>
               {loading ? <CircularProgress size={24} /> : 'Add Lead'}
             </Button>
@@ -0,0 +1,48 @@
+import React, { useEffect, useState } from 'react';
+import { Autocomplete, TextField } from '@mui/material';
+import { fetchPage } from '../api/api';
+
+// Customer select that searches on the server (?search=) as the user types,
+// so it loads one small page instead of every customer
+function CustomerPicker({ value, onChange, required = false }) {
+  const [options, setOptions] = useState([]);
+  const [input, setInput] = useState('');
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    let active = true;
+    const timer = setTimeout(async () => {
+      setLoading(true);
+      try {
+        const params = { fields: 'id,name', page_size: 20 };
+        if (input.trim()) params.search = input.trim();
+        const page = await fetchPage('customers/', { params });
+        if (active) setOptions(page.items);
+      } catch (error) {
+        console.error('Error searching customers:', error);
+      } finally {
+        if (active) setLoading(false);
+      }
+    }, 300);
+    return () => {
+      active = false;
+      clearTimeout(timer);
+    };
+  }, [input]);
+
+  return (
+    <Autocomplete
+      value={value}
+      options={value && !options.some((option) => option.id === value.id) ? [value, ...options] : options}
+      getOptionLabel={(option) => option.name || ''}
+      isOptionEqualToValue={(option, selected) => option.id === selected.id}
+      filterOptions={(x) => x}
+      loading={loading}
+      onChange={(_event, customer) => onChange(customer)}
+      onInputChange={(_event, text) => setInput(text)}
+      renderInput={(params) => <TextField {...params} label="Customer" required={required} />}
+    />
+  );
+}
+
+export default CustomerPicker;
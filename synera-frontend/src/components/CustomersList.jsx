@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import axios from '../api/api';
+import axios, { fetchPage } from '../api/api';
 import { Link } from 'react-router-dom';
 import {
   Box,
@@ -28,22 +28,42 @@ import {
 
 function CustomersList() {
   const [customers, setCustomers] = useState([]);
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [search, setSearch] = useState('');
   const [expanded, setExpanded] = useState({});
 
   useEffect(() => {
-    fetchCustomers();
-  }, []);
+    // Search runs on the server; wait for typing to pause
+    const timer = setTimeout(fetchCustomers, 300);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [search]);
 
   const fetchCustomers = async () => {
     try {
-      const response = await axios.get('/customers/');
-      setCustomers(response.data);
+      const params = search.trim() ? { search: search.trim() } : {};
+      const page = await fetchPage('/customers/', { params });
+      setCustomers(page.items);
+      setNext(page.next);
     } catch (error) {
       console.error('Error fetching customers:', error);
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(next);
+      setCustomers((prev) => [...prev, ...page.items]);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching customers:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const deleteCustomer = async (id) => {
     try {
       await axios.delete(`/customers/${id}/`);
@@ -57,12 +77,6 @@ function CustomersList() {
     setExpanded((prev) => ({ ...prev, [id]: !prev[id] }));
   };
 
-  const filteredCustomers = customers.filter((c) =>
-    c.name.toLowerCase().includes(search.toLowerCase()) ||
-    c.email.toLowerCase().includes(search.toLowerCase()) ||
-    c.phone.toLowerCase().includes(search.toLowerCase())
-  );
-
   return (
     <Box sx={{ p: 3 }}>
       <Stack
@@ -107,7 +121,7 @@ function CustomersList() {
             </TableRow>
           </TableHead>
           <TableBody>
-            {filteredCustomers.map((customer) => (
+            {customers.map((customer) => (
               <React.Fragment key={customer.id}>
                 <TableRow hover>
                   <TableCell>{customer.name}</TableCell>
@@ -162,6 +176,14 @@ function CustomersList() {
           </TableBody>
         </Table>
       </TableContainer>
+
+      {next && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+          <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading…' : 'Load more'}
+          </Button>
+        </Box>
+      )}
     </Box>
   );
 }
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import api from "../api/api";
+import API, { fetchPage } from "../api/api";
 import {
   Box,
   Typography,
@@ -46,39 +46,32 @@ function Dashboard() {
   useEffect(() => {
     const fetchDashboardData = async () => {
       try {
-        // Fetch all leads
-        const leadRes = await api.get("/leads/");
-        const leads = leadRes.data;
-
-        // Fetch all customers
-        const custRes = await api.get("/customers/");
-        const customers = custRes.data;
+        // Counts come from one aggregate request; the charts need only a page each
+        const [summaryResponse, leadsPage, customersPage, highPriorityResponse] = await Promise.all([
+          API.get("dashboard/"),
+          fetchPage("leads/", { params: { fields: "id,title,score,status", page_size: 20 } }),
+          fetchPage("customers/", { params: { fields: "id,name", page_size: 5 } }),
+          API.get("high-priority-leads/"),
+        ]);
+        const summary = summaryResponse.data;
 
         // ------------------
-        // Chart Data
+        // Chart Data (latest leads)
         // ------------------
-        const chartData = leads.map((lead) => ({
+        const chartData = leadsPage.items.map((lead) => ({
           title: lead.title || "Untitled",
           score: lead.score || 0,
         }));
 
-        const statusCounts = {};
-        leads.forEach((lead) => {
-          const status = lead.status || "unknown";
-          statusCounts[status] = (statusCounts[status] || 0) + 1;
-        });
-        const pieData = Object.entries(statusCounts).map(([status, count]) => ({
+        const pieData = Object.entries(summary.status_counts).map(([status, count]) => ({
           status,
           count,
         }));
 
-        const topCustomers = customers
-          .map((c) => ({
-            name: c.name,
-            value: c.value || 0,
-          }))
-          .sort((a, b) => b.value - a.value)
-          .slice(0, 5);
+        const topCustomers = customersPage.items.map((c) => ({
+          name: c.name,
+          value: c.value || 0,
+        }));
 
         // Dummy Revenue Data (replace with backend later)
         const revData = [
@@ -90,25 +83,23 @@ function Dashboard() {
         ];
 
         // ------------------
-        // Follow-ups (filter high-score leads)
+        // Follow-ups (high-score open leads, filtered on the server)
         // ------------------
-        const followUpList = leads
-          .filter((lead) => (lead.score || 0) >= 80 && !["won", "lost"].includes(lead.status))
-          .map((lead) => ({
-            id: lead.id,
-            title: lead.title,
-            score: lead.score,
-            status: lead.status,
-          }));
+        const followUpList = highPriorityResponse.data.map((lead) => ({
+          id: lead.id,
+          title: lead.title,
+          score: lead.score,
+          status: lead.status,
+        }));
 
         // ------------------
         // Quick Stats
         // ------------------
         const statsData = {
-          totalLeads: leads.length,
-          totalCustomers: customers.length,
-          wonLeads: leads.filter((l) => l.status === "won").length,
-          highScoreLeads: leads.filter((l) => (l.score || 0) >= 80).length,
+          totalLeads: summary.total_leads,
+          totalCustomers: summary.total_customers,
+          wonLeads: summary.won_leads,
+          highScoreLeads: summary.high_score_leads,
         };
 
         setLeadsData(chartData);
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
 import api from '../api/api';
+import CustomerPicker from './CustomerPicker';
 import { toast } from 'react-toastify';
 import {
   Box,
@@ -39,7 +40,7 @@ function EditLead() {
   const { id } = useParams();
   const navigate = useNavigate();
 
-  const [customers, setCustomers] = useState([]);
+  const [customer, setCustomer] = useState(null);
   const [formData, setFormData] = useState({
     title: '',
     description: '',
@@ -50,14 +51,6 @@ function EditLead() {
   const [loading, setLoading] = useState(false);
 
   useEffect(() => {
-    const fetchCustomers = async () => {
-      try {
-        const response = await api.get('customers/');
-        setCustomers(response.data);
-      } catch {
-        toast.error('Failed to load customers.');
-      }
-    };
 
     const fetchLead = async () => {
       try {
@@ -69,13 +62,13 @@ function EditLead() {
           status: lead.status || 'new',
           customer_id: lead.customer?.id || '',
         });
+        setCustomer(lead.customer ? { id: lead.customer.id, name: lead.customer.name } : null);
         setLeadInfo(lead); // store lead info to show Score & Sentiment
       } catch {
         toast.error('Failed to load lead.');
       }
     };
 
-    fetchCustomers();
     fetchLead();
   }, [id]);
 
@@ -153,25 +146,14 @@ function EditLead() {
                 <MenuItem value="won">Won</MenuItem>
               </Select>
             </FormControl>
-            <FormControl fullWidth required>
-              <InputLabel id="customer-label">Customer</InputLabel>
-              <Select
-                labelId="customer-label"
-                label="Customer"
-                name="customer_id"
-                value={formData.customer_id}
-                onChange={handleChange}
-              >
-                <MenuItem value="">
-                  <em>Select Customer</em>
-                </MenuItem>
-                {customers.map((customer) => (
-                  <MenuItem key={customer.id} value={customer.id}>
-                    {customer.name}
-                  </MenuItem>
-                ))}
-              </Select>
-            </FormControl>
+            <CustomerPicker
+              value={customer}
+              required
+              onChange={(selected) => {
+                setCustomer(selected);
+                setFormData((prev) => ({ ...prev, customer_id: selected?.id || '' }));
+              }}
+            />
             <Button variant="contained" type="submit" fullWidth disabled={loading}>
               {loading ? <CircularProgress size={24} /> : 'Update Lead'}
             </Button>
@@ -1,8 +1,9 @@
 import React, { useEffect } from "react";
+import { connectGmail } from "../api/api";
 
 const GmailAuth = () => {
   useEffect(() => {
-    window.location.href = "http://127.0.0.1:8000/gmail-auth/"; // redirect to backend for OAuth
+    connectGmail(); // redirect to Google with a consent URL bound to the logged-in user
   }, []);
 
   return <p>Redirecting to Gmail...</p>;
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from "react";
 import axios from "axios";
+import { connectGmail } from "../api/api";
 import {
   Button,
   Typography,
@@ -30,10 +31,6 @@ const GmailIntegration = () => {
       .catch(() => setConnected(false));
   }, []);
 
-  const connectGmail = () => {
-    window.location.href = "/gmail-auth/";
-  };
-
   const fetchEmails = () => {
     setLoading(true);
     setError("");
@@ -22,12 +22,9 @@ function HighPriorityLeads() {
   useEffect(() => {
     const fetchLeads = async () => {
       try {
-        const response = await api.get('/leads/');
-        const allLeads = response.data;
-        const highPriorityLeads = allLeads.filter(
-          (lead) => (lead.score || 0) >= 80 && !['won', 'lost'].includes(lead.status)
-        );
-        setLeads(highPriorityLeads);
+        // Filtered (score >= 80, not won/lost) and cached per user on the server
+        const response = await api.get('high-priority-leads/');
+        setLeads(response.data);
       } catch (err) {
         console.error('Error fetching leads:', err);
       } finally {
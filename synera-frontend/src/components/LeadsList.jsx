@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import api from '../api/api';
+import api, { fetchPage } from '../api/api';
 import { useNavigate } from 'react-router-dom';
 import {
   Box,
@@ -16,37 +16,60 @@ import {
   MenuItem,
   IconButton,
   TextField,
+  Button,
 } from '@mui/material';
 import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
 import { Edit, Delete } from '@mui/icons-material';
 import AddIcon from '@mui/icons-material/Add';
 
+// Only the columns this list shows
+const LEAD_FIELDS = 'id,title,status,score,sentiment,enrichment_status,customer.name';
+
 function LeadsList() {
-  const [leadsByCustomer, setLeadsByCustomer] = useState({});
+  const [leads, setLeads] = useState([]);
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [statusFilter, setStatusFilter] = useState('all');
   const [sentimentFilter, setSentimentFilter] = useState('all');
   const [search, setSearch] = useState('');
   const navigate = useNavigate();
 
+  // Filters and search run on the server, so each page is already filtered
   const fetchLeads = async () => {
+    const params = { fields: LEAD_FIELDS };
+    if (statusFilter !== 'all') params.status = statusFilter;
+    if (sentimentFilter !== 'all') params.sentiment = sentimentFilter;
+    if (search.trim()) params.search = search.trim();
+    try {
+      const page = await fetchPage('leads/', { params });
+      setLeads(page.items);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching leads:', error);
+    }
+  };
+
+  const loadMore = async () => {
+    setLoadingMore(true);
     try {
-      const response = await api.get('leads/');
-      const leads = response.data;
-
-      // Group by customer
-      const grouped = leads.reduce((acc, lead) => {
-        const customerName = lead.customer?.name || 'Unknown';
-        if (!acc[customerName]) acc[customerName] = [];
-        acc[customerName].push(lead);
-        return acc;
-      }, {});
-
-      setLeadsByCustomer(grouped);
+      const page = await fetchPage(next);
+      setLeads((prev) => [...prev, ...page.items]);
+      setNext(page.next);
     } catch (error) {
       console.error('Error fetching leads:', error);
+    } finally {
+      setLoadingMore(false);
     }
   };
 
+  // Group the loaded leads by customer
+  const leadsByCustomer = leads.reduce((acc, lead) => {
+    const customerName = lead.customer?.name || 'Unknown';
+    if (!acc[customerName]) acc[customerName] = [];
+    acc[customerName].push(lead);
+    return acc;
+  }, {});
+
   const handleDelete = async (id) => {
     if (window.confirm('Are you sure you want to delete this lead?')) {
       try {
@@ -89,17 +112,11 @@ function LeadsList() {
   };
 
   useEffect(() => {
-    fetchLeads();
-  }, []);
-
-  const filterLeads = (leads) =>
-    leads.filter(
-      (lead) =>
-        (statusFilter === 'all' || lead.status === statusFilter) &&
-        (sentimentFilter === 'all' || lead.sentiment?.toLowerCase() === sentimentFilter) &&
-        (lead.customer?.name?.toLowerCase().includes(search.toLowerCase()) ||
-          lead.title?.toLowerCase().includes(search.toLowerCase()))
-    );
+    // Wait for typing to pause before searching
+    const timer = setTimeout(fetchLeads, 300);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [statusFilter, sentimentFilter, search]);
 
   // Sort customers by highest average score
   const sortedCustomers = Object.entries(leadsByCustomer).sort(([aName, aLeads], [bName, bLeads]) => {
@@ -158,14 +175,11 @@ function LeadsList() {
       </Stack>
 
       {sortedCustomers.map(([customer, leads]) => {
-        const filteredLeads = filterLeads(leads);
-        if (!filteredLeads.length) return null;
-
         const avgScore = Math.round(
-          filteredLeads.reduce((sum, l) => sum + (l.score || 0), 0) / filteredLeads.length
+          leads.reduce((sum, l) => sum + (l.score || 0), 0) / leads.length
         );
 
-        const sentiments = filteredLeads.map((l) => l.sentiment?.toLowerCase());
+        const sentiments = leads.map((l) => l.sentiment?.toLowerCase());
         let overallSentiment = 'Neutral';
         if (sentiments.filter((s) => s === 'positive').length > sentiments.filter((s) => s === 'negative').length) {
           overallSentiment = 'Positive';
@@ -173,7 +187,7 @@ function LeadsList() {
           overallSentiment = 'Negative';
         }
 
-        const sortedLeads = filteredLeads.sort((a, b) => (b.score || 0) - (a.score || 0));
+        const sortedLeads = leads.sort((a, b) => (b.score || 0) - (a.score || 0));
 
         return (
           <Accordion key={customer} sx={{ mb: 2 }}>
@@ -203,9 +217,15 @@ function LeadsList() {
                 >
                   <Typography sx={{ width: '25%' }}>{lead.title}</Typography>
                   {getStatusChip(lead.status)}
-                  <Tooltip title={`Score: ${lead.score}`}>
-                    <Chip label={lead.score} color={getScoreColor(lead.score)} size="small" />
-                  </Tooltip>
+                  {lead.enrichment_status === 'pending' ? (
+                    <Tooltip title="Score is being calculated">
+                      <Chip label="Scoring…" size="small" variant="outlined" />
+                    </Tooltip>
+                  ) : (
+                    <Tooltip title={`Score: ${lead.score}`}>
+                      <Chip label={lead.score} color={getScoreColor(lead.score)} size="small" />
+                    </Tooltip>
+                  )}
                   {getSentimentChip(lead.sentiment)}
                   <Stack direction="row" spacing={1} sx={{ ml: 'auto' }}>
                     <IconButton color="primary" onClick={() => navigate(`/edit-lead/${lead.id}`)}>
@@ -221,6 +241,14 @@ function LeadsList() {
           </Accordion>
         );
       })}
+
+      {next && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+          <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading…' : 'Load more'}
+          </Button>
+        </Box>
+      )}
     </Box>
   );
 }
@@ -35,7 +35,7 @@ import ShoppingBagIcon from "@mui/icons-material/ShoppingBag";
 import LogoutIcon from "@mui/icons-material/Logout";
 import LoginIcon from "@mui/icons-material/Login";
 import AppRegistrationIcon from "@mui/icons-material/AppRegistration";
-import api from "../api/api";
+import api, { connectGmail } from "../api/api";
 
 /* ------------------------------- Styled UI ------------------------------- */
 
@@ -246,8 +246,6 @@ const Navbar = () => {
     }
   };
 
-  const connectGmail = () => (window.location.href = "/gmail-auth/");
-
   const handleMailClick = (event) => {
     setAnchorEl(event.currentTarget);
     fetchEmails();
@@ -21,13 +21,14 @@ import {
 } from "@mui/material";
 import { Edit, Delete, Search } from "@mui/icons-material";
 import { toast } from "react-toastify";
-import API from "../api/api";
+import API, { fetchPage } from "../api/api";
 import { AuthContext } from "../context/AuthContext";
 
 const Products = () => {
   const { user, loading } = useContext(AuthContext);
   const [products, setProducts] = useState([]);
-  const [filteredProducts, setFilteredProducts] = useState([]);
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [open, setOpen] = useState(false);
   const [editingProduct, setEditingProduct] = useState(null);
   const [formData, setFormData] = useState({
@@ -38,39 +39,41 @@ const Products = () => {
   });
   const [searchTerm, setSearchTerm] = useState("");
 
-  // ---------------- Fetch products ----------------
+  // ---------------- Fetch products (one page; search runs on the server) ----------------
   const fetchProducts = async () => {
     try {
-      const response = await API.get("products/");
-      setProducts(response.data);
-      setFilteredProducts(response.data);
+      const params = searchTerm.trim() ? { search: searchTerm.trim() } : {};
+      const page = await fetchPage("products/", { params });
+      setProducts(page.items);
+      setNext(page.next);
     } catch (error) {
       console.error("Failed to load products:", error);
       toast.error("Failed to load products");
     }
   };
 
-  useEffect(() => {
-    if (user) {
-      fetchProducts();
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(next);
+      setProducts((prev) => [...prev, ...page.items]);
+      setNext(page.next);
+    } catch (error) {
+      console.error("Failed to load products:", error);
+      toast.error("Failed to load products");
+    } finally {
+      setLoadingMore(false);
     }
-  }, [user]);
+  };
 
   // ---------------- Search ----------------
   useEffect(() => {
-    if (!searchTerm) {
-      setFilteredProducts(products);
-    } else {
-      const term = searchTerm.toLowerCase();
-      setFilteredProducts(
-        products.filter(
-          (p) =>
-            p.name.toLowerCase().includes(term) ||
-            (p.description && p.description.toLowerCase().includes(term))
-        )
-      );
-    }
-  }, [searchTerm, products]);
+    if (!user) return undefined;
+    // Wait for typing to pause before searching
+    const timer = setTimeout(fetchProducts, 300);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [user, searchTerm]);
 
   // ---------------- Form change handler ----------------
   const handleChange = (e) => {
@@ -164,7 +167,7 @@ const Products = () => {
             </TableRow>
           </TableHead>
           <TableBody>
-            {filteredProducts.map((product) => (
+            {products.map((product) => (
               <TableRow key={product.id}>
                 <TableCell>{product.name}</TableCell>
                 <TableCell>{product.description}</TableCell>
@@ -184,6 +187,14 @@ const Products = () => {
         </Table>
       </TableContainer>
 
+      {next && (
+        <Box sx={{ display: "flex", justifyContent: "center", mt: 2 }}>
+          <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? "Loading…" : "Load more"}
+          </Button>
+        </Box>
+      )}
+
       {/* Add/Edit Dialog */}
       <Dialog open={open} onClose={handleClose} maxWidth="sm" fullWidth>
         <DialogTitle>{editingProduct ? "Edit Product" : "Add Product"}</DialogTitle>
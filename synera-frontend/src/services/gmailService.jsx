@@ -1,9 +1,7 @@
 import axios from "../api"; // your existing API helper
 
-export const connectGmail = () => {
-  // Opens OAuth in a new tab
-  window.open(`${axios.defaults.baseURL}/gmail-auth/`, "_blank");
-};
+// Consent URL bound to the logged-in user (see api.js)
+export { connectGmail } from "../api/api";
 
 export const fetchGmailEmails = async () => {
   const res = await axios.get("/api/gmail-conversations/");
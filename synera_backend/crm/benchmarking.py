@@ -0,0 +1,94 @@
+"""
+Shared scaffolding for the benchmark_* management commands.
+
+Benchmarks seed their data inside rolled_back(), so nothing they create
+outlives the run, and collect timings in a Timings list for the summary
+stats they print. Each command keeps only its own measurement.
+"""
+import itertools
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from crm.models import Customer, Lead
+
+STATUSES = ['new', 'contacted', 'qualified', 'lost', 'won']
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is rolled back however it exits"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def _row_fields(fields, i):
+    # A callable value is evaluated per row with the row's index
+    return {name: value(i) if callable(value) else value for name, value in fields.items()}
+
+
+def seed_customers(owner, count, batch_size=5000, **fields):
+    """
+    Bulk-create `count` customers of `owner` named "Customer <i>". Extra
+    `fields` are set on every row; callables are called with the row index.
+    """
+    return Customer.objects.bulk_create([
+        Customer(owner=owner, name=f'Customer {i}', email=f'c{i}@example.com', **_row_fields(fields, i))
+        for i in range(count)
+    ], batch_size=batch_size)
+
+
+def seed_leads(customer_ids, count, rng, statuses=STATUSES, batch_size=10_000, **fields):
+    """
+    Bulk-insert `count` leads titled "Lead <i>", each on a random customer
+    from `customer_ids` with a random status and score. Rows are generated
+    lazily and inserted in batches, so seeding never holds the whole table.
+    bulk_create skips Lead.save(), so no NLP or model scoring runs here.
+    """
+    leads = (
+        Lead(
+            customer_id=rng.choice(customer_ids), title=f'Lead {i}',
+            status=rng.choice(statuses), score=round(rng.uniform(0, 100), 2),
+            **_row_fields(fields, i),
+        )
+        for i in range(count)
+    )
+    while batch := list(itertools.islice(leads, batch_size)):
+        Lead.objects.bulk_create(batch)
+
+
+class Timings(list):
+    """Elapsed seconds of repeated runs of one measurement"""
+
+    def __init__(self, clock=time.perf_counter):
+        super().__init__()
+        self.clock = clock
+
+    @contextmanager
+    def measure(self):
+        start = self.clock()
+        yield
+        self.append(self.clock() - start)
+
+    def percentile(self, fraction):
+        ordered = sorted(self)
+        return ordered[max(int(len(ordered) * fraction) - 1, 0)]
+
+    @property
+    def median(self):
+        return statistics.median(self)
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+    @property
+    def mean(self):
+        return statistics.mean(self)
+
+    @property
+    def per_second(self):
+        return len(self) / sum(self)
@@ -0,0 +1,267 @@
+"""
+Batch endpoints: POST / PATCH / DELETE <list url>/bulk/.
+
+POST takes a list of objects to create, PATCH a list of partial updates
+that each carry an "id", DELETE a list of ids. Every item is validated
+by the regular serializer, but the rows and related customers a batch
+refers to are loaded with one query each, valid items are written in one
+transaction with bulk_create / bulk_update, and leads that need it are
+enriched in one batch (Lead.enrich), so a batch costs the same handful of
+queries whatever its size.
+
+The response lists one result per item, in request order:
+{"id": ..., "status": 200|201|204, "data": ...} or
+{"id": ..., "status": 400|404, "errors": ...}. Invalid items do not stop
+the valid ones from being applied.
+"""
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .caching import invalidate_owner
+from .models import Customer, EnrichmentJob, Lead
+from .signals import batched_tombstones, known_customer_owners
+
+NOT_FOUND = {'detail': 'Not found.'}
+
+
+def _ok(instance_id, code, data=None):
+    result = {'id': instance_id, 'status': code}
+    if data is not None:
+        result['data'] = data
+    return result
+
+
+def _error(instance_id, code, errors):
+    return {'id': instance_id, 'status': code, 'errors': errors}
+
+
+def _item_id(item):
+    """The integer id of a bulk item (an object with "id", or a bare id for DELETE)"""
+    value = item.get('id') if isinstance(item, dict) else item
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkMixin:
+    """
+    Adds the bulk/ action to a ModelViewSet. Subclasses implement
+    bulk_create_items(items), bulk_update_items(items) and
+    bulk_delete_items(ids), each returning the list of item results.
+    """
+
+    def bulk_max_items(self):
+        return getattr(settings, 'BULK_MAX_ITEMS', 500)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'non_field_errors': ['Expected a non-empty list of items.']})
+        if len(items) > self.bulk_max_items():
+            raise ValidationError({'non_field_errors': [f'At most {self.bulk_max_items()} items per request.']})
+
+        if request.method == 'POST':
+            results = self.bulk_create_items(items)
+        elif request.method == 'PATCH':
+            results = self.bulk_update_items(items)
+        else:
+            results = self.bulk_delete_items(items)
+        return Response({'results': results})
+
+    def bulk_validate(self, items, instances=None):
+        """
+        Run the serializer over `items`. With `instances` (id -> instance)
+        items are partial updates of those instances. Returns the results
+        list, with None in place of each valid item, and the valid
+        (index, instance or None, validated_data) triples.
+        """
+        context = self.get_serializer_context()
+        context.update(self.bulk_serializer_context(items))
+        results, valid, seen = [], [], set()
+        for index, item in enumerate(items):
+            instance = None
+            if instances is not None:
+                instance_id = _item_id(item)
+                instance = instances.get(instance_id)
+                if instance is None or not isinstance(item, dict):
+                    results.append(_error(instance_id, status.HTTP_404_NOT_FOUND, NOT_FOUND))
+                    continue
+                if instance_id in seen:
+                    results.append(_error(instance_id, status.HTTP_400_BAD_REQUEST, {
+                        'id': ['Appears more than once in this batch.']
+                    }))
+                    continue
+                seen.add(instance_id)
+            if not isinstance(item, dict):
+                results.append(_error(None, status.HTTP_400_BAD_REQUEST, {'non_field_errors': ['Expected an object.']}))
+                continue
+            serializer = self.get_serializer_class()(
+                instance, data=item, partial=instances is not None, context=context
+            )
+            if serializer.is_valid():
+                results.append(None)
+                valid.append((index, instance, serializer.validated_data))
+            else:
+                results.append(_error(instance.pk if instance else None, status.HTTP_400_BAD_REQUEST, serializer.errors))
+        return results, valid
+
+    def bulk_serializer_context(self, items):
+        return {}
+
+    def bulk_delete_items(self, items):
+        ids = [_item_id(item) for item in items]
+        with transaction.atomic():
+            instances = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+            # Collector sends the same signals as Model.delete() (tombstones,
+            # cache invalidation) and cascades, with one query per relation
+            collector = Collector(using=router.db_for_write(self.get_queryset().model))
+            collector.collect(list(instances.values()))
+            # Leads deleted by cascade find their owner here, not with a query each
+            owners = {obj.pk: obj.owner_id for obj in instances.values() if isinstance(obj, Customer)}
+            with batched_tombstones(), known_customer_owners(owners):
+                collector.delete()
+        return [
+            _ok(pk, status.HTTP_204_NO_CONTENT) if pk in instances
+            else _error(pk, status.HTTP_404_NOT_FOUND, NOT_FOUND)
+            for pk in ids
+        ]
+
+    def bulk_results(self, results, valid, instances, code):
+        """Fill the valid items' slots of `results` with their serialized instances"""
+        data = self.get_serializer(instances, many=True).data
+        for (index, _instance, _validated), instance, item in zip(valid, instances, data):
+            results[index] = _ok(instance.pk, code, item)
+        return results
+
+
+class LeadBulkMixin(BulkMixin):
+    def bulk_serializer_context(self, items):
+        ids = {_item_id(item.get('customer_id')) for item in items if isinstance(item, dict)} - {None}
+        # Ownership is still checked by LeadSerializer.validate_customer_id
+        return {'customers': Customer.objects.in_bulk(ids) if ids else {}}
+
+    def bulk_create_items(self, items):
+        results, valid = self.bulk_validate(items)
+        leads = [Lead(**validated, updated_by=self.request.user) for _index, _instance, validated in valid]
+        with transaction.atomic():
+            if self.enrich_later():
+                for lead in leads:
+                    lead.enrichment_status = Lead.ENRICHMENT_PENDING
+                Lead.objects.bulk_create(leads)
+                EnrichmentJob.enqueue_many(leads)
+            else:
+                Lead.enrich(leads)
+                Lead.objects.bulk_create(leads)
+            if leads:
+                invalidate_owner(self.request.user.pk)  # bulk writes send no post_save
+        return self.bulk_results(results, valid, leads, status.HTTP_201_CREATED)
+
+    def bulk_update_items(self, items):
+        ids = [pk for pk in map(_item_id, items) if pk is not None]
+        leads = self.get_queryset().in_bulk(ids)
+        results, valid = self.bulk_validate(items, leads)
+
+        fields, affected, updated = set(), {}, {}
+        now = timezone.now()
+        for _index, lead, validated in valid:
+            rescore = any(
+                name in ('status', 'description') and getattr(lead, name) != value
+                for name, value in validated.items()
+            )
+            for name, value in validated.items():
+                setattr(lead, name, value)
+            fields.update(validated)
+            lead.updated_by = self.request.user
+            lead.updated_at = now  # bulk_update skips auto_now
+            updated[lead.pk] = lead
+            if rescore:
+                affected[lead.pk] = lead
+
+        affected = list(affected.values())
+        with transaction.atomic():
+            if affected:
+                # Only leads whose status or description changed are re-scored, in one batch
+                if self.enrich_later():
+                    for lead in affected:
+                        lead.enrichment_status = Lead.ENRICHMENT_PENDING
+                else:
+                    Lead.enrich(affected)
+                fields.update(Lead.ENRICHMENT_FIELDS)
+            if updated:
+                Lead.objects.bulk_update(list(updated.values()), sorted(fields | {'updated_by', 'updated_at'}))
+                invalidate_owner(self.request.user.pk)
+            if affected and self.enrich_later():
+                EnrichmentJob.enqueue_many(affected)
+        return self.bulk_results(results, valid, [lead for _index, lead, _validated in valid], status.HTTP_200_OK)
+
+    @staticmethod
+    def enrich_later():
+        return getattr(settings, 'LEAD_ENRICHMENT_MODE', 'sync') == 'async'
+
+
+class CustomerBulkMixin(BulkMixin):
+    def bulk_create_items(self, items):
+        results, valid = self.bulk_validate(items)
+        customers = [Customer(owner=self.request.user, **validated) for _index, _instance, validated in valid]
+        return self.bulk_write(results, valid, customers, created=True)
+
+    def bulk_update_items(self, items):
+        ids = [pk for pk in map(_item_id, items) if pk is not None]
+        customers = self.get_queryset().in_bulk(ids)
+        results, valid = self.bulk_validate(items, customers)
+        now = timezone.now()
+        fields = set()
+        for _index, customer, validated in valid:
+            for name, value in validated.items():
+                setattr(customer, name, value)
+            fields.update(validated)
+            customer.updated_at = now  # bulk_update skips auto_now
+        return self.bulk_write(results, valid, [customer for _index, customer, _validated in valid],
+                               created=False, fields=sorted(fields | {'updated_at'}))
+
+    def bulk_write(self, results, valid, customers, created, fields=()):
+        # Emails are unique per owner: reject items whose email belongs to
+        # another customer, or repeats one earlier in the batch
+        taken = dict(
+            Customer.objects.filter(owner=self.request.user, email__in={c.email for c in customers})
+            .values_list('email', 'pk')
+        )
+        accepted, seen = [], set()
+        for item, customer in zip(valid, customers):
+            if customer.email in seen or taken.get(customer.email, customer.pk) != customer.pk:
+                results[item[0]] = _error(customer.pk, status.HTTP_400_BAD_REQUEST, {
+                    'email': ['A customer with this email already exists.']
+                })
+            else:
+                seen.add(customer.email)
+                accepted.append((item, customer))
+        valid = [item for item, _customer in accepted]
+        customers = [customer for _item, customer in accepted]
+
+        try:
+            with transaction.atomic():
+                if created:
+                    Customer.objects.bulk_create(customers)
+                elif customers:
+                    Customer.objects.bulk_update(customers, fields)
+                if customers:
+                    invalidate_owner(self.request.user.pk)  # bulk writes send no post_save
+        except IntegrityError:
+            # e.g. two customers swapping emails; nothing was written
+            for (index, _instance, _validated), customer in zip(valid, customers):
+                results[index] = _error(customer.pk, status.HTTP_409_CONFLICT, {
+                    'detail': 'The batch conflicts with existing customers and was not applied.'
+                })
+            return results
+        code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        return self.bulk_results(results, valid, customers, code)
@@ -0,0 +1,93 @@
+"""
+Per-owner response caching.
+
+Cached responses live in Django's cache framework (CRM_CACHE_ALIAS,
+default "default") under the owner's current version number. Saving or
+deleting one of an owner's leads or customers bumps only that owner's
+version (crm.signals), so their old entries stop being read and simply
+expire; nobody else's cache is touched. Bulk writes that skip model
+signals call invalidate_lead_owners() themselves.
+
+Any backend works. LocMemCache (Django's default) is per process, so
+with several workers use a shared one: FileBasedCache needs no extra
+services, Redis or Memcached scale further.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+
+def get_cache():
+    return caches[getattr(settings, 'CRM_CACHE_ALIAS', 'default')]
+
+
+def _version_key(owner_id):
+    return f'crm:owner-version:{owner_id}'
+
+
+def _initial_version():
+    # Versions start from the clock, so a version key that was evicted (or
+    # lost in a cache restart) comes back above every number used before it
+    return time.time_ns() // 1000
+
+
+def owner_version(owner_id):
+    """Current cache version of `owner_id`'s data"""
+    cache = get_cache()
+    key = _version_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, timeout=None)
+        version = cache.get(key, initial)
+    return version
+
+
+def bump_owner_version(owner_id):
+    """Invalidate everything cached for `owner_id` right away"""
+    cache = get_cache()
+    key = _version_key(owner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Never read yet, or evicted: a fresh clock value is already past the old ones
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def invalidate_owner(owner_id):
+    """Bump `owner_id`'s version once the current transaction commits"""
+    if owner_id is not None:
+        # After commit, so a concurrent request cannot re-cache the old rows under the new version
+        transaction.on_commit(lambda: bump_owner_version(owner_id))
+
+
+def invalidate_lead_owners(leads):
+    """Invalidate the owners of `leads` (for bulk paths that bypass model signals)"""
+    from .models import Customer
+
+    customer_ids = {lead.customer_id for lead in leads}
+    if not customer_ids:
+        return
+    owner_ids = Customer.objects.filter(pk__in=customer_ids).values_list('owner_id', flat=True).distinct()
+    for owner_id in owner_ids:
+        invalidate_owner(owner_id)
+
+
+def cached_for_owner(owner_id, name, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the cached value `name` for `owner_id`, calling `compute()` and
+    caching its result on a miss.
+    """
+    cache = get_cache()
+    # Read the version before computing: a write that lands meanwhile bumps
+    # past it, so the possibly stale result is never served again
+    version = owner_version(owner_id)
+    key = f'crm:{name}:{owner_id}'
+    value = cache.get(key, version=version)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=timeout, version=version)
+    return value
@@ -0,0 +1,78 @@
+"""
+Conditional GET for the CRM viewsets.
+
+List ETags come from one aggregate per queryset, (count, max(updated_at),
+max(id)), so a client revalidating an unchanged list gets a 304 after a
+single cheap query and no serialization. Any insert, delete or save moves
+one of the three: a save bumps updated_at, an insert raises max(id) and a
+delete lowers the count. Bulk writes must therefore set updated_at
+themselves (see Lead.ENRICHMENT_FIELDS).
+
+Last-Modified is not sent: deleting a row does not move max(updated_at),
+so If-Modified-Since would answer 304 for a list that changed.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    Adds weak ETags to list() and retrieve() of a ModelViewSet and answers
+    304 Not Modified when the request's If-None-Match still matches.
+    """
+
+    def etag_querysets(self):
+        """Querysets whose changes must change the list ETag"""
+        return [self.filter_queryset(self.get_queryset())]
+
+    def etag_extra(self):
+        """Anything else the representation depends on (e.g. the scoring model)"""
+        return ()
+
+    def object_etag_parts(self, instance):
+        return (instance.pk, instance.updated_at)
+
+    def list(self, request, *args, **kwargs):
+        parts = [
+            tuple(queryset.order_by().aggregate(Count('pk'), Max('updated_at'), Max('pk')).values())
+            for queryset in self.etag_querysets()
+        ]
+        # The query string selects the page (cursor, page_size)
+        etag = self.make_etag(request, parts, request.META.get('QUERY_STRING', ''))
+        if self.not_modified(request, etag):
+            return self.with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        return self.with_etag(super().list(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.make_etag(request, self.object_etag_parts(instance))
+        if self.not_modified(request, etag):
+            return self.with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        return self.with_etag(Response(self.get_serializer(instance).data), etag)
+
+    def make_etag(self, request, *parts):
+        # Responses differ per user and per renderer (JSON vs browsable API)
+        key = repr((request.user.pk, request.META.get('HTTP_ACCEPT', ''), self.etag_extra()) + parts)
+        return 'W/' + quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def not_modified(request, etag):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        # If-None-Match uses weak comparison: W/"x" matches "x"
+        tags = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+        return '*' in tags or etag.removeprefix('W/') in tags
+
+    @staticmethod
+    def with_etag(response, etag):
+        response['ETag'] = etag
+        # Browsers keep the body but must revalidate on every request
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+        return response
@@ -0,0 +1,116 @@
+"""
+Background enrichment of leads (LEAD_ENRICHMENT_MODE = "async").
+
+Lead.save() queues an EnrichmentJob instead of running sentiment analysis
+and scoring inline. Workers claim due jobs in batches (row-locked with
+SKIP LOCKED where the database supports it), enrich the leads with the
+batch sentiment and scoring paths, and retry failures with exponential
+backoff.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .caching import invalidate_lead_owners
+from .models import EnrichmentJob, Lead
+from .sentiment import content_hash
+
+
+def claim_jobs(batch_size, lease_seconds=300):
+    """
+    Mark up to `batch_size` due jobs as running and return them. Jobs left
+    running longer than `lease_seconds` (crashed worker) are claimed again.
+    """
+    now = timezone.now()
+    due = Q(status=EnrichmentJob.STATUS_PENDING, available_at__lte=now) | Q(
+        status=EnrichmentJob.STATUS_RUNNING, claimed_at__lt=now - timedelta(seconds=lease_seconds)
+    )
+    with transaction.atomic():
+        jobs = EnrichmentJob.objects.filter(due).order_by('available_at')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        else:
+            jobs = jobs.select_for_update()
+        jobs = list(jobs[:batch_size])
+        if jobs:
+            EnrichmentJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=EnrichmentJob.STATUS_RUNNING, claimed_at=now, attempts=F('attempts') + 1
+            )
+    for job in jobs:
+        job.status, job.claimed_at, job.attempts = EnrichmentJob.STATUS_RUNNING, now, job.attempts + 1
+    return jobs
+
+
+def process_jobs(jobs, max_attempts=5):
+    """
+    Enrich the leads of claimed `jobs` in one batch. If the batch fails, each
+    job is retried on its own so one bad lead cannot block the rest.
+    Returns (succeeded, failed) counts.
+    """
+    if not jobs:
+        return 0, 0
+    try:
+        _enrich(jobs)
+        return len(jobs), 0
+    except Exception as e:
+        if len(jobs) == 1:
+            _record_failure(jobs[0], e, max_attempts)
+            return 0, 1
+
+    succeeded = failed = 0
+    for job in jobs:
+        try:
+            _enrich([job])
+            succeeded += 1
+        except Exception as e:
+            _record_failure(job, e, max_attempts)
+            failed += 1
+    return succeeded, failed
+
+
+def _enrich(jobs):
+    leads = list(Lead.objects.filter(pk__in=[job.lead_id for job in jobs]))
+    read_at = {lead.pk: lead.updated_at for lead in leads}
+    Lead.enrich(leads)
+    with transaction.atomic():
+        current = {
+            pk: (description, updated_at)
+            for pk, description, updated_at in Lead.objects.select_for_update()
+            .filter(pk__in=read_at).values_list('pk', 'description', 'updated_at')
+        }
+        # Skip leads saved again while we worked: their newer save re-queued
+        # the job, and writing back would overwrite it with stale results
+        fresh = [
+            lead for lead in leads
+            if lead.pk in current
+            and content_hash(current[lead.pk][0]) == lead.description_hash
+            and current[lead.pk][1] == read_at[lead.pk]
+        ]
+        Lead.objects.bulk_update(fresh, Lead.ENRICHMENT_FIELDS, batch_size=500)
+        invalidate_lead_owners(fresh)
+        # A job re-queued by a newer save while we worked stays pending
+        EnrichmentJob.objects.filter(
+            pk__in=[job.pk for job in jobs],
+            status=EnrichmentJob.STATUS_RUNNING,
+            claimed_at=jobs[0].claimed_at,
+        ).update(status=EnrichmentJob.STATUS_DONE, last_error='')
+
+
+def _record_failure(job, error, max_attempts):
+    claimed = EnrichmentJob.objects.filter(
+        pk=job.pk, status=EnrichmentJob.STATUS_RUNNING, claimed_at=job.claimed_at
+    )
+    if job.attempts >= max_attempts:
+        claimed.update(status=EnrichmentJob.STATUS_FAILED, last_error=str(error))
+        failed = Lead.objects.filter(pk=job.lead_id)
+        failed.update(enrichment_status=Lead.ENRICHMENT_FAILED, updated_at=timezone.now())
+        invalidate_lead_owners(failed.only('customer_id'))
+    else:
+        backoff = timedelta(seconds=2 ** job.attempts)
+        claimed.update(
+            status=EnrichmentJob.STATUS_PENDING,
+            available_at=timezone.now() + backoff,
+            last_error=str(error),
+        )
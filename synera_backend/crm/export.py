@@ -0,0 +1,128 @@
+"""
+Streaming CSV / NDJSON export.
+
+Rows are read with values_list().iterator(chunk_size=...), so the database
+driver fetches them in chunks instead of materializing the queryset, and
+each chunk is encoded and handed to StreamingHttpResponse before the next
+one is read. Memory stays bounded by the chunk size whatever the number
+of rows. No model instances or serializers are involved, so exported
+scores are the stored ones (see Lead.refresh_stale_scores).
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+LEAD_COLUMNS = [
+    ('id', 'id'),
+    ('customer_id', 'customer_id'),
+    ('customer_name', 'customer__name'),
+    ('customer_email', 'customer__email'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('status', 'status'),
+    ('score', 'score'),
+    ('sentiment', 'sentiment'),
+    ('sentiment_score', 'sentiment_score'),
+    ('enrichment_status', 'enrichment_status'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('updated_by', 'updated_by__username'),
+]
+
+CUSTOMER_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('company', 'company'),
+    ('address', 'address'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def iter_rows(queryset, columns):
+    """Yield lists of value tuples, one list per database chunk"""
+    size = chunk_size()
+    rows = queryset.order_by('pk').values_list(*(lookup for _name, lookup in columns))
+    chunk = []
+    for row in rows.iterator(chunk_size=size):
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(queryset, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _lookup in columns])
+    dates = [i for i, (_name, lookup) in enumerate(columns) if lookup.endswith('_at')]
+    for chunk in iter_rows(queryset, columns):
+        for row in chunk:
+            if dates:
+                row = list(row)
+                for i in dates:
+                    row[i] = _isoformat(row[i])
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(queryset, columns):
+    names = [name for name, _lookup in columns]
+    encoder = json.JSONEncoder(default=_isoformat, ensure_ascii=False)
+    for chunk in iter_rows(queryset, columns):
+        yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
+
+
+def export_response(queryset, columns, fmt, filename):
+    """StreamingHttpResponse of `queryset` as `fmt` ('csv' or 'ndjson')"""
+    stream = iter_csv(queryset, columns) if fmt == 'csv' else iter_ndjson(queryset, columns)
+    response = StreamingHttpResponse(stream, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    # Always the current data; never store a possibly huge body in a cache
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class ExportMixin:
+    """
+    Adds GET <list url>/export/?fmt=csv|ndjson to a ModelViewSet, streaming
+    every row of get_queryset(). (`fmt`, not `format`: DRF reserves
+    ?format= for picking a renderer.)
+    """
+    export_columns = ()
+    export_filename = 'export'
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        fmt = request.query_params.get('fmt', 'csv')
+        if fmt not in FORMATS:
+            raise ValidationError({'fmt': f"Choose one of: {', '.join(FORMATS)}."})
+        return export_response(self.get_queryset(), self.export_columns, fmt, self.export_filename)
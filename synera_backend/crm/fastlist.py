@@ -0,0 +1,221 @@
+"""
+Fast read path for list endpoints.
+
+DRF serializes a page field by field: for every row and every field it
+resolves the source through the model instance, checks for None and calls
+the field's to_representation(). For the list actions of the lead and
+customer viewsets this module compiles the (possibly sparse) serializer
+once per request into a flat plan: one values_list() lookup per field and
+a converter that produces the same primitive the field would. Each page
+is then read as tuples and turned into plain dicts without building model
+instances or walking serializer fields.
+
+The output is the serializer's own, key for key and value for value, so
+the rendered bytes do not change. Serializers whose fields the plan cannot
+reproduce (method fields, non-model sources, other related fields) keep
+the regular path, as do retrieve and every write. CRM_FAST_LIST = False
+turns the fast path off.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework import relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .renderers import FastJSONRenderer
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _identity(value):
+    return value
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != drf_fields.ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        # DateTimeField.to_representation for aware values and ISO 8601
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _converter(field):
+    """Callable turning a non-None database value into field.to_representation(value)"""
+    if isinstance(field, drf_fields.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, drf_fields.FloatField):
+        return float
+    if isinstance(field, drf_fields.ChoiceField):
+        if all(key == value for key, value in field.choice_strings_to_values.items()):
+            return str
+        return field.to_representation
+    if isinstance(field, drf_fields.CharField):
+        return str
+    if isinstance(field, drf_fields.IntegerField):
+        return int
+    if isinstance(field, relations.RelatedField):
+        raise Unsupported(field.field_name)
+    return field.to_representation
+
+
+def _model_path(model, source_attrs):
+    """
+    ORM lookup for a dotted serializer source and the lookup of the
+    relation it goes through ('' when it does not leave `model`).
+    """
+    path = []
+    for attr in source_attrs[:-1]:
+        try:
+            relation = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise Unsupported(attr)
+        if not relation.many_to_one and not relation.one_to_one:
+            raise Unsupported(attr)
+        path.append(attr)
+        model = relation.related_model
+    try:
+        field = model._meta.get_field(source_attrs[-1])
+    except FieldDoesNotExist:
+        raise Unsupported(source_attrs[-1])
+    if not getattr(field, 'concrete', False):
+        raise Unsupported(source_attrs[-1])
+    return field, '__'.join(path + [source_attrs[-1]]), '__'.join(path)
+
+
+class ListPlan:
+    """
+    Compiled form of a serializer: values_list() lookups plus the steps
+    that turn each row tuple into the serializer's dict.
+    """
+
+    def __init__(self, serializer, extra_lookups=()):
+        self.lookups = []
+        self._index = {}
+        self.steps = self._compile(serializer, serializer.Meta.model, '')
+        for lookup in extra_lookups:
+            self.index(lookup)
+
+    def index(self, lookup):
+        """Position of `lookup` in the row, adding it if needed"""
+        if lookup not in self._index:
+            self._index[lookup] = len(self.lookups)
+            self.lookups.append(lookup)
+        return self._index[lookup]
+
+    def _compile(self, serializer, model, prefix):
+        steps = []
+        for field in serializer._readable_fields:
+            if field.source == '*':
+                raise Unsupported(field.field_name)
+            if isinstance(field, serializers.BaseSerializer):
+                # Nested serializer over a forward relation; None when the FK is null
+                if isinstance(field, serializers.ListSerializer) or len(field.source_attrs) != 1:
+                    raise Unsupported(field.field_name)
+                relation, lookup, _ = _model_path(model, field.source_attrs)
+                if not relation.is_relation:
+                    raise Unsupported(field.field_name)
+                nested = self._compile(field, relation.related_model, f'{prefix}{lookup}__')
+                steps.append(('nested', field.field_name, self.index(prefix + lookup), nested))
+            elif isinstance(field, relations.PrimaryKeyRelatedField) and not field.pk_field:
+                # Rendered as the related pk, which is the FK column's value
+                _, lookup, _ = _model_path(model, field.source_attrs)
+                steps.append(('value', field.field_name, self.index(prefix + lookup), _identity))
+            else:
+                model_field, lookup, relation = _model_path(model, field.source_attrs)
+                if model_field.is_relation:
+                    raise Unsupported(field.field_name)
+                convert = _converter(field)
+                if relation:
+                    # What DRF does when the relation itself is missing
+                    if field.default is not drf_fields.empty:
+                        missing = 'default'
+                    elif field.allow_null:
+                        missing = 'null'
+                    elif not field.required:
+                        missing = 'skip'
+                    else:
+                        raise Unsupported(field.field_name)
+                    steps.append(('through', field.field_name, self.index(prefix + lookup), convert,
+                                  self.index(prefix + relation), missing, field))
+                else:
+                    steps.append(('value', field.field_name, self.index(prefix + lookup), convert))
+        return steps
+
+    def build(self, row, steps=None):
+        out = {}
+        for step in self.steps if steps is None else steps:
+            kind, name, index = step[0], step[1], step[2]
+            value = row[index]
+            if kind == 'value':
+                out[name] = None if value is None else step[3](value)
+            elif kind == 'nested':
+                out[name] = None if value is None else self.build(row, step[3])
+            elif row[step[4]] is None:
+                if step[5] == 'default':
+                    out[name] = step[6].get_default()
+                elif step[5] == 'null':
+                    out[name] = None
+            else:
+                out[name] = None if value is None else step[3](value)
+        return out
+
+
+def compile_plan(serializer, extra_lookups=()):
+    """ListPlan for `serializer`, or None if it needs the regular path"""
+    try:
+        return ListPlan(serializer, extra_lookups)
+    except Unsupported:
+        return None
+
+
+class FastListMixin:
+    """
+    Serves list() through a ListPlan. fast_list_lookups names extra
+    columns a page needs (the pagination cursor, fast_list_page_ok()).
+    """
+    fast_list_lookups = ('created_at',)
+
+    def get_renderers(self):
+        return [
+            FastJSONRenderer() if type(renderer) is JSONRenderer else renderer
+            for renderer in super().get_renderers()
+        ]
+
+    def fast_list_page_ok(self, plan, rows):
+        """False sends the page through the regular serializer"""
+        return True
+
+    def serialize_rows(self, queryset, rows):
+        """The regular serializer's output for the instances behind `rows`, in their order"""
+        instances = queryset.in_bulk([row.pk for row in rows])
+        return self.get_serializer([instances[row.pk] for row in rows if row.pk in instances], many=True).data
+
+    def list(self, request, *args, **kwargs):
+        plan = None
+        if getattr(settings, 'CRM_FAST_LIST', True):
+            plan = compile_plan(self.get_serializer(), tuple(self.fast_list_lookups) + ('pk',))
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*plan.lookups, named=True)
+        page = self.paginate_queryset(rows)
+        rows = rows if page is None else page
+        if self.fast_list_page_ok(plan, rows):
+            data = [plan.build(row) for row in rows]
+        else:
+            # Serialize the page already fetched: one query for its instances,
+            # not the count and page queries again
+            data = self.serialize_rows(queryset, rows)
+        return Response(data) if page is None else self.get_paginated_response(data)
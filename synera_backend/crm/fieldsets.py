@@ -0,0 +1,94 @@
+"""
+Sparse fieldsets for the CRM viewsets.
+
+list() and retrieve() accept ?fields=id,title,status to return only those
+fields, and ?expand=customer (or a nested name such as customer.name in
+?fields=) to embed a related object. The queryset follows the selection:
+only() loads the columns the chosen fields read, and a relation is joined
+with select_related() only when one of its columns is needed. Without
+either parameter the full, legacy representation is returned.
+
+With ?fields=, an unexpanded relation is rendered as its id.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    # Relations ?expand= may name
+    expandable_fields = ()
+    # Columns always loaded: the pagination cursor and anything the
+    # serializer reads besides its fields
+    sparse_required_fields = ('created_at',)
+
+    def sparse_options(self):
+        """Serializer kwargs selecting the requested fields; {} for the full representation"""
+        if self.action not in ('list', 'retrieve'):
+            return {}
+        params = self.request.query_params
+        fields, expand = params.get('fields'), params.get('expand')
+        if not fields and not expand:
+            return {}
+
+        expanded = {name: None for name in _names(expand or '')}
+        top = None
+        if fields:
+            top = []
+            for name in _names(fields):
+                relation, dot, sub = name.partition('.')
+                if dot:
+                    nested = expanded.get(relation) or []
+                    expanded[relation] = nested + [sub]
+                if relation not in top:
+                    top.append(relation)
+
+        unknown = set(expanded) - set(self.expandable_fields)
+        if unknown:
+            raise ValidationError({'expand': [f"Cannot expand: {', '.join(sorted(unknown))}."]})
+        available = {
+            name: field for name, field in self.get_serializer_class()().fields.items() if not field.write_only
+        }
+        unknown = set(top or ()) - set(available)
+        for relation, nested in expanded.items():
+            unknown |= {f'{relation}.{sub}' for sub in nested or () if sub not in available[relation].fields}
+        if unknown:
+            raise ValidationError({'fields': [f"Unknown fields: {', '.join(sorted(unknown))}."]})
+
+        options = {'fields': top}
+        if self.expandable_fields:
+            options['expand'] = expanded
+        return options
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **{**self.sparse_options(), **kwargs})
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        options = self.sparse_options()
+        if not options.get('fields'):
+            return queryset
+
+        columns, relations = set(self.sparse_required_fields), set()
+        for field in self.get_serializer_class()(**options).fields.values():
+            if field.write_only or field.source == '*':
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                # Expanded relation: join it, loading just the nested fields' columns
+                relations.add(field.source)
+                columns.update(
+                    f'{field.source}__{nested.source}'
+                    for nested in field.fields.values() if nested.source != '*'
+                )
+            else:
+                path = field.source.split('.')
+                if len(path) > 1:
+                    relations.add('__'.join(path[:-1]))
+                columns.add('__'.join(path))
+        queryset = queryset.select_related(None)
+        if relations:  # select_related() without arguments would follow every FK
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns)
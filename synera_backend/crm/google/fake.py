@@ -0,0 +1,298 @@
+"""
+In-memory stand-in for the Gmail API, for tests and benchmarks.
+
+FakeGmail holds a mailbox and answers the REST calls the CRM makes
+(users.getProfile, history.list, messages.list, messages.get and batch
+requests of them) from it; delete_message() and modify_labels() change
+the mailbox and record history as Gmail does. http()
+is an httplib2.Http look-alike to pass to the client library, as in
+service(); fake_session() is a requests.Session for PooledHttp. Either
+way no request leaves the process. Setting `tokens` makes requests
+without one of those bearer tokens fail with 401.
+
+Each round trip can be slowed down with `latency` (plus `item_latency`
+per request inside a batch) to model the network; fail() makes the
+next calls for a message return an error status, fail_requests() the
+next round trips. The transport is safe
+to share between threads.
+"""
+import base64
+import email.parser
+import json
+import threading
+import time
+import urllib.parse
+from email.utils import format_datetime
+
+from django.utils import timezone
+
+API_ROOT = '/gmail/v1/users/me/'
+BATCH_PATHS = ('/batch', '/batch/gmail/v1')
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 429: 'Too Many Requests',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+class FakeResponse(dict):
+    """What httplib2.Http.request() returns as its response: a dict of lowercase headers"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+        self.reason = REASONS.get(status, '')
+        self['status'] = str(status)
+
+
+class FakeGmail:
+
+    def __init__(self, latency=0.0, item_latency=0.0):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.messages = {}
+        self.history_id = 1000
+        self.requests = []  # (method, path) per round trip
+        self.tokens = None  # accepted access tokens; None accepts any request
+        self.history = []  # history records, oldest first
+        self.history_floor = 0  # history.list() answers 404 for older start ids
+        self.email_address = 'me@example.com'
+        self._failures = {}
+        self._request_failures = []
+        self._lock = threading.Lock()
+
+    def add_message(self, subject='', sender='sender@example.com', body='', html=None,
+                    labels=('INBOX',), thread_id=None, to='me@example.com'):
+        """Deliver a message; returns its full (format=full) resource"""
+        with self._lock:
+            self.history_id += 1
+            msg_id = f'{len(self.messages) + 1:016x}'
+            date = timezone.now()
+            headers = [
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': to},
+                {'name': 'Subject', 'value': subject},
+                {'name': 'Date', 'value': format_datetime(date)},
+            ]
+            text = {'mimeType': 'text/plain', 'body': {'size': len(body), 'data': _b64(body)}}
+            if html is None:
+                payload = {**text, 'headers': headers}
+            else:
+                payload = {'mimeType': 'multipart/alternative', 'headers': headers, 'body': {'size': 0}, 'parts': [
+                    {**text, 'partId': '0'},
+                    {'partId': '1', 'mimeType': 'text/html', 'body': {'size': len(html), 'data': _b64(html)}},
+                ]}
+            message = {
+                'id': msg_id, 'threadId': thread_id or msg_id, 'labelIds': list(labels),
+                'snippet': body[:100], 'historyId': str(self.history_id),
+                'internalDate': str(int(date.timestamp() * 1000)), 'sizeEstimate': len(body) + len(html or ''),
+                'payload': payload,
+            }
+            self.messages[msg_id] = message
+            self._record('messagesAdded', message)
+            return message
+
+    def _record(self, kind, message, **extra):
+        ref = {'id': message['id'], 'threadId': message['threadId']}
+        self.history.append({
+            'id': str(self.history_id), 'messages': [ref],
+            kind: [{'message': {**ref, 'labelIds': list(message['labelIds'])}, **extra}],
+        })
+
+    def delete_message(self, msg_id):
+        with self._lock:
+            self.history_id += 1
+            self._record('messagesDeleted', self.messages.pop(msg_id))
+
+    def modify_labels(self, msg_id, add=(), remove=()):
+        with self._lock:
+            self.history_id += 1
+            message = self.messages[msg_id]
+            message['labelIds'] = [label for label in message['labelIds'] if label not in remove] + [
+                label for label in add if label not in message['labelIds']]
+            message['historyId'] = str(self.history_id)
+            if add:
+                self._record('labelsAdded', message, labelIds=list(add))
+            if remove:
+                self._record('labelsRemoved', message, labelIds=list(remove))
+
+    def expire_history(self):
+        """Forget the history so far, as Gmail does after about a week"""
+        with self._lock:
+            self.history_floor = self.history_id + 1
+
+    def fail(self, msg_id, status, times=1):
+        """Answer the next `times` requests for `msg_id` with `status`"""
+        with self._lock:
+            self._failures.setdefault(msg_id, []).extend([status] * times)
+
+    def fail_requests(self, status, times=1, retry_after=None):
+        """Answer the next `times` round trips (batches included) with `status`"""
+        with self._lock:
+            self._request_failures.extend([(status, retry_after)] * times)
+
+    def http(self):
+        return FakeGmailHttp(self)
+
+    def service(self):
+        from googleapiclient.discovery import build
+
+        return build('gmail', 'v1', http=self.http(), static_discovery=True, cache_discovery=False)
+
+    # Request handling
+
+    def respond(self, method, uri, body=None, headers=None):
+        """(status, headers, content) for one HTTP round trip"""
+        url = urllib.parse.urlsplit(uri)
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if isinstance(body, bytes):
+            body = body.decode()
+        with self._lock:
+            self.requests.append((method, url.path))
+            failure = self._request_failures.pop(0) if self._request_failures else None
+        if failure is not None:
+            time.sleep(self.latency)
+            status, retry_after = failure
+            headers = {'content-type': 'application/json'}
+            if retry_after is not None:
+                headers['retry-after'] = str(retry_after)
+            return status, headers, json.dumps(self._error(status, 'Injected failure')[1]).encode()
+        if self.tokens is not None and headers.get('authorization') not in {f'Bearer {t}' for t in self.tokens}:
+            time.sleep(self.latency)
+            status, payload = self._error(401, 'Invalid Credentials')
+        elif url.path in BATCH_PATHS:
+            return self._batch(body, headers['content-type'])
+        else:
+            time.sleep(self.latency)
+            status, payload = self.handle(method, url.path, urllib.parse.parse_qs(url.query), body)
+        return status, {'content-type': 'application/json'}, json.dumps(payload).encode()
+
+    def _batch(self, body, content_type):
+        mime = email.parser.Parser().parsestr(f'Content-Type: {content_type}\r\n\r\n{body}')
+        parts = mime.get_payload()
+        time.sleep(self.latency + self.item_latency * len(parts))
+
+        boundary = 'fake_batch_boundary'
+        out = []
+        for part in parts:
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, target, _ = request_line.split(' ', 2)
+            url = urllib.parse.urlsplit(target)
+            request_body = rest.split('\n\n', 1)[1] if '\n\n' in rest else None
+            status, payload = self.handle(method, url.path, urllib.parse.parse_qs(url.query), request_body)
+            content_id = part['Content-ID'][1:-1]
+            out.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\nContent-Type: application/json\r\n\r\n'
+                f'{json.dumps(payload)}\r\n'
+            )
+        out.append(f'--{boundary}--\r\n')
+        return 200, {'content-type': f'multipart/mixed; boundary={boundary}'}, ''.join(out).encode()
+
+    def handle(self, method, path, params, body=None):
+        """(status, payload) for one REST call"""
+        if not path.startswith(API_ROOT):
+            return 404, {'error': {'code': 404, 'message': f'Unknown path {path}'}}
+        resource = path[len(API_ROOT):].split('/')
+        with self._lock:
+            if method == 'GET' and resource == ['profile']:
+                return 200, {'emailAddress': self.email_address, 'messagesTotal': len(self.messages),
+                             'historyId': str(self.history_id)}
+            if method == 'GET' and resource == ['history']:
+                return self._history(params)
+            if method == 'GET' and resource == ['messages']:
+                return 200, self._list(params)
+            if method == 'GET' and len(resource) == 2 and resource[0] == 'messages':
+                return self._get(resource[1], params)
+        return 404, {'error': {'code': 404, 'message': f'Unknown method {method} {path}'}}
+
+    def _error(self, status, message):
+        return status, {'error': {'code': status, 'message': message}}
+
+    def _list(self, params):
+        labels = set(params.get('labelIds', []))
+        ids = [
+            msg_id for msg_id, message in reversed(self.messages.items())
+            if labels <= set(message['labelIds'])
+        ]
+        start = int(params.get('pageToken', ['0'])[0])
+        size = min(int(params.get('maxResults', ['100'])[0]), 500)
+        page = ids[start:start + size]
+        response = {'resultSizeEstimate': len(ids)}
+        if page:
+            response['messages'] = [{'id': i, 'threadId': self.messages[i]['threadId']} for i in page]
+        if start + size < len(ids):
+            response['nextPageToken'] = str(start + size)
+        return response
+
+    def _history(self, params):
+        start = int(params['startHistoryId'][0])
+        if start < self.history_floor:
+            return self._error(404, 'Requested entity was not found.')
+        # historyTypes=messageAdded selects records with messagesAdded, etc.
+        kinds = {kind.replace('message', 'messages').replace('label', 'labels')
+                 for kind in params.get('historyTypes', [])}
+        records = [
+            record for record in self.history
+            if int(record['id']) > start and (not kinds or kinds & set(record))
+        ]
+        offset = int(params.get('pageToken', ['0'])[0])
+        size = min(int(params.get('maxResults', ['100'])[0]), 500)
+        response = {'historyId': str(self.history_id)}
+        if records[offset:offset + size]:
+            response['history'] = records[offset:offset + size]
+        if offset + size < len(records):
+            response['nextPageToken'] = str(offset + size)
+        return 200, response
+
+    def _get(self, msg_id, params):
+        failures = self._failures.get(msg_id)
+        if failures:
+            return self._error(failures.pop(0), 'Injected failure')
+        message = self.messages.get(msg_id)
+        if message is None:
+            return self._error(404, 'Requested entity was not found.')
+        fmt = params.get('format', ['full'])[0]
+        if fmt == 'minimal':
+            return 200, {k: v for k, v in message.items() if k != 'payload'}
+        if fmt == 'metadata':
+            payload = message['payload']
+            return 200, {**message, 'payload': {'mimeType': payload['mimeType'], 'headers': payload['headers']}}
+        return 200, message
+
+
+class FakeGmailHttp:
+    """httplib2.Http look-alike serving a FakeGmail"""
+    thread_safe = True
+
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        status, response_headers, content = self.gmail.respond(method, uri, body, headers)
+        return FakeResponse(status, response_headers), content
+
+
+def fake_session(gmail):
+    """requests.Session whose requests to Google are answered by `gmail`"""
+    import requests
+
+    class FakeGmailAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            status, headers, content = gmail.respond(request.method, request.url, request.body, request.headers)
+            response = requests.Response()
+            response.status_code = status
+            response.reason = REASONS.get(status, '')
+            response.headers.update(headers)
+            response._content = content
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    session = requests.Session()
+    session.mount('https://', FakeGmailAdapter())
+    return session
@@ -0,0 +1,144 @@
+"""
+Batched message fetching for the Gmail API.
+
+Listing returns only message ids, and fetching them one messages.get() at
+a time costs a round trip per message. get_messages() sends the gets in
+batch requests of up to `batch_size` (Gmail recommends no more than 50),
+so N messages cost ceil(N / batch_size) round trips, and with workers > 1
+the batches go out concurrently over a bounded thread pool, each thread
+on its own HTTP connection.
+
+A failing message does not fail the others: items answered with 429 or
+5xx are retried in a follow-up batch with backoff, and whatever still
+fails ends up in FetchResult.errors keyed by message id.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_BATCH_SIZE = 100  # Gmail's own limit; the client library allows 1000
+
+
+@dataclass
+class FetchResult:
+    messages: list = field(default_factory=list)  # in the order the ids were given
+    errors: dict = field(default_factory=dict)  # message id -> exception
+
+
+def _status(exception):
+    resp = getattr(exception, 'resp', None)
+    return getattr(resp, 'status', None)
+
+
+def list_message_ids(service, max_results=100, label_ids=None, query=None, user_id='me'):
+    """Ids of the newest `max_results` messages, following nextPageToken"""
+    ids = []
+    page_token = None
+    while len(ids) < max_results:
+        kwargs = {'userId': user_id, 'maxResults': min(max_results - len(ids), 500)}
+        if label_ids:
+            kwargs['labelIds'] = label_ids
+        if query:
+            kwargs['q'] = query
+        if page_token:
+            kwargs['pageToken'] = page_token
+        response = service.users().messages().list(**kwargs).execute()
+        ids.extend(message['id'] for message in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return ids[:max_results]
+
+
+def _http_factory(service):
+    """Callable returning an HTTP object a worker thread may use on its own"""
+    http = service._http
+    if getattr(http, 'thread_safe', False):
+        return lambda: http
+
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+
+    credentials = getattr(http, 'credentials', None)
+    if credentials is None:
+        return build_http
+    return lambda: AuthorizedHttp(credentials, http=build_http())
+
+
+def _fetch_batch(service, ids, request_kwargs, http, retries, backoff, user_id):
+    fetched, failed = {}, {}
+    pending = ids
+    for attempt in range(retries + 1):
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif _status(exception) in RETRYABLE_STATUSES and attempt < retries:
+                retry.append(request_id)
+            else:
+                failed[request_id] = exception
+
+        batch = service.new_batch_http_request(callback=callback)
+        for msg_id in pending:
+            batch.add(service.users().messages().get(userId=user_id, id=msg_id, **request_kwargs), request_id=msg_id)
+        try:
+            batch.execute(http=http)
+        except Exception as e:
+            # The batch request itself failed: every item in it did
+            if _status(e) not in RETRYABLE_STATUSES or attempt == retries:
+                failed.update((msg_id, e) for msg_id in pending)
+                break
+            retry = pending
+        if not retry:
+            break
+        time.sleep(backoff * 2 ** attempt)
+        pending = retry
+    return fetched, failed
+
+
+def get_messages(service, ids, format='full', metadata_headers=None, batch_size=None, workers=None,
+                 http_factory=None, retries=2, backoff=0.5, user_id='me'):
+    """
+    Fetch `ids` with batched messages.get() calls. `workers` > 1 sends
+    batches concurrently; http_factory() must then return an HTTP object
+    per thread (by default derived from the service's credentials).
+    """
+    batch_size = min(batch_size or getattr(settings, 'GMAIL_BATCH_SIZE', 50), MAX_BATCH_SIZE)
+    workers = workers or getattr(settings, 'GMAIL_FETCH_WORKERS', 1)
+    request_kwargs = {'format': format}
+    if metadata_headers:
+        request_kwargs['metadataHeaders'] = metadata_headers
+
+    unique = list(dict.fromkeys(ids))  # request ids must be unique within a batch
+    chunks = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+    fetched, failed = {}, {}
+
+    if workers > 1 and len(chunks) > 1:
+        http_factory = http_factory or _http_factory(service)
+        local = threading.local()
+
+        def run(chunk):
+            if not hasattr(local, 'http'):
+                local.http = http_factory()
+            return _fetch_batch(service, chunk, request_kwargs, local.http, retries, backoff, user_id)
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = list(pool.map(run, chunks))
+    else:
+        results = [_fetch_batch(service, chunk, request_kwargs, None, retries, backoff, user_id) for chunk in chunks]
+
+    for chunk_fetched, chunk_failed in results:
+        fetched.update(chunk_fetched)
+        failed.update(chunk_failed)
+    return FetchResult(messages=[fetched[i] for i in unique if i in fetched], errors=failed)
+
+
+def fetch_recent(service, max_results=10, label_ids=None, query=None, **kwargs):
+    """list_message_ids() followed by get_messages()"""
+    ids = list_message_ids(service, max_results=max_results, label_ids=label_ids, query=query)
+    return get_messages(service, ids, **kwargs)
@@ -1,35 +1,193 @@
+"""
+Gmail API services, one per credential per process.
+
+build("gmail", "v1", ...) reads and parses the discovery document and
+creates a fresh transport, with a new TLS connection, every time. Services
+here are built once per credential from a discovery document parsed once
+per process, over a PooledHttp transport that keeps connections open and
+may be shared between threads, and their nested resources (users(),
+messages(), ...) are built once too. Each account's traffic is rate
+limited and retried by crm.google.throttle. The cache is keyed by OAuth client,
+refresh token and scopes, so requests from the same account share one set
+of credentials and an expired token is refreshed once, not once per request.
+"""
+import functools
+import json
 import os
 import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import threading
+from collections import OrderedDict
+
 from django.conf import settings
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
+_services = OrderedDict()
+_services_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def discovery_document(name="gmail", version="v1"):
+    from googleapiclient.discovery_cache import get_static_doc
+
+    return json.loads(get_static_doc(name, version))
+
+
+def credentials_key(credentials):
+    """Identity of the account behind `credentials`, and what they may access"""
+    refresh_token = getattr(credentials, "refresh_token", None)
+    scopes = tuple(sorted(getattr(credentials, "scopes", None) or ()))
+    return (getattr(credentials, "client_id", None), refresh_token or credentials.token, scopes)
+
+
+def default_transport(credentials):
+    """PooledHttp for `credentials`, rate limited and retried per account"""
+    from .throttle import ThrottledHttp
+    from .transport import PooledHttp
+
+    return ThrottledHttp(PooledHttp(credentials))
+
+
+def gmail_service_for(credentials, transport=None, on_refresh=None):
+    """
+    Cached Gmail service for `credentials`. A service built earlier for the
+    same account and scopes is reused; it keeps the token it refreshed
+    itself, but takes `credentials` over if they changed since it last saw
+    them (a token stored elsewhere, a rotated client secret). `transport` builds the
+    HTTP object from the credentials; default_transport() by default. on_refresh(),
+    if given, is called with the credentials whenever they are refreshed.
+    """
+    key = credentials_key(credentials)
+    with _services_lock:
+        service = _services.get(key)
+        if service is not None:
+            _services.move_to_end(key)
+    if service is not None:
+        if hasattr(service._http, "update_credentials"):
+            service._http.update_credentials(credentials)
+        if on_refresh is not None:
+            service._http.on_refresh = on_refresh
+        return service
+
+    from googleapiclient.discovery import build_from_document
+
+    http = (transport or default_transport)(credentials)
+    if on_refresh is not None:
+        http.on_refresh = on_refresh
+    service = _memoize_resources(build_from_document(discovery_document(), http=http))
+    with _services_lock:
+        # Another thread may have built one meanwhile; keep the first
+        service = _services.setdefault(key, service)
+        _services.move_to_end(key)
+        evicted = []
+        while len(_services) > getattr(settings, "GMAIL_SERVICE_CACHE_SIZE", 256):
+            evicted.append(_services.popitem(last=False)[1])
+    if service._http is not http and hasattr(http, "close"):
+        http.close()
+    for old in evicted:
+        if hasattr(old._http, "close"):
+            old._http.close()
+    return service
+
+
+def _memoize_resources(resource):
+    """
+    Make service.users(), .messages() etc. return the same object every
+    time. The client library otherwise builds a new resource, generating
+    all of its methods, on each call. Resources hold no per-call state.
+    """
+    for name in resource._resourceDesc.get("resources", {}):
+        def nested(build=getattr(resource, name), memo=[]):
+            if not memo:
+                child = build()
+                _memoize_resources(child)
+                memo.append(child)
+            return memo[0]
+        setattr(resource, name, nested)
+    return resource
+
+
+def clear_service_cache():
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        if hasattr(service._http, "close"):
+            service._http.close()
+
+
+def session_credentials(request):
+    """Credentials stored in the session by the OAuth callback"""
+    from google.oauth2.credentials import Credentials
+
+    if not request.session.get("gmail_token"):
+        raise Exception("Gmail not authenticated. Call /api/gmail/init/ first.")
+    return Credentials(
+        token=request.session.get("gmail_token"),
+        refresh_token=request.session.get("refresh_token"),
+        token_uri=request.session.get("token_uri"),
+        client_id=request.session.get("client_id"),
+        client_secret=request.session.get("client_secret"),
+        scopes=request.session.get("scopes"),
+    )
+
+
+def profile_credentials(profile):
+    """Credentials stored on a Profile by the OAuth callback, or None"""
+    from google.oauth2.credentials import Credentials
+
+    if not profile.gmail_token and not profile.gmail_refresh_token:
+        return None
+    return Credentials(
+        token=profile.gmail_token,
+        refresh_token=profile.gmail_refresh_token,
+        token_uri=profile.gmail_token_uri,
+        client_id=profile.gmail_client_id,
+        client_secret=profile.gmail_client_secret,
+        scopes=profile.gmail_scopes,
+    )
+
+
+def store_credentials(profile, credentials):
+    """Save `credentials` on `profile` (after the OAuth flow or a refresh)"""
+    from crm.models import Profile
+
+    fields = {
+        "gmail_token": credentials.token,
+        "gmail_refresh_token": credentials.refresh_token or profile.gmail_refresh_token,
+        "gmail_token_uri": credentials.token_uri,
+        "gmail_client_id": credentials.client_id,
+        "gmail_client_secret": credentials.client_secret,
+        "gmail_scopes": list(credentials.scopes) if credentials.scopes else profile.gmail_scopes,
+    }
+    for name, value in fields.items():
+        setattr(profile, name, value)
+    Profile.objects.filter(pk=profile.pk).update(**fields)
+
+
+def get_profile_service(profile):
+    """Gmail service for the account connected to `profile`; refreshed tokens are stored back"""
+    credentials = profile_credentials(profile)
+    if credentials is None:
+        raise Exception(f"Gmail not connected for {profile.user}.")
+    return gmail_service_for(credentials, on_refresh=lambda creds: store_credentials(profile, creds))
+
+
 def get_gmail_service(request=None):
     """
     Returns a Gmail API service object.
     If `request` is provided, uses session-based credentials.
     Otherwise, falls back to local pickle token (installed app flow).
     """
+    # Google client libraries are imported on first use to keep startup fast
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
 
     creds = None
 
     # Session-based credentials
     if request:
-        if request.session.get("gmail_token"):
-            from google.oauth2.credentials import Credentials
-            creds = Credentials(
-                token=request.session.get("gmail_token"),
-                refresh_token=request.session.get("refresh_token"),
-                token_uri=request.session.get("token_uri"),
-                client_id=request.session.get("client_id"),
-                client_secret=request.session.get("client_secret"),
-                scopes=request.session.get("scopes"),
-            )
-        else:
-            raise Exception("Gmail not authenticated. Call /api/gmail/init/ first.")
+        creds = session_credentials(request)
 
     # Fallback to local pickle token (for development/testing)
     else:
@@ -49,5 +207,4 @@ def get_gmail_service(request=None):
             with open(token_path, "wb") as token_file:
                 pickle.dump(creds, token_file)
 
-    service = build("gmail", "v1", credentials=creds)
-    return service
+    return gmail_service_for(creds)
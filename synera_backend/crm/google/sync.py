@@ -0,0 +1,239 @@
+"""
+Gmail to EmailMessage sync.
+
+The first sync of an account stores its newest `limit` messages (what
+messages.list returns: everything but spam and trash) and remembers the
+mailbox's historyId from before the listing. Every later sync replays
+users.history from that cursor: added messages are fetched in batches and
+stored, deleted ones removed, label changes applied (a message moved to
+spam or trash is removed, matching the first sync, and a labelled message
+not stored here, e.g. one moved back out of them, is fetched and stored).
+
+Progress is checkpointed so a crashed run resumes where it stopped: a full
+sync commits its messages chunk by chunk and a rerun skips the stored
+ones; an incremental sync applies each history page in one transaction
+together with the cursor moved past it. Applying a change twice is
+harmless.
+
+Gmail keeps history for about a week; when the cursor is older than that
+history.list answers 404 and the account gets a fresh bounded sync.
+"""
+import logging
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crm.models import EmailMessage, Profile
+
+from .fetch import get_messages, list_message_ids
+from .utils import parse_message
+
+logger = logging.getLogger(__name__)
+
+HIDDEN_LABELS = {'SPAM', 'TRASH'}
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+_sqlite_lock = threading.Lock()
+
+
+class SyncError(Exception):
+    pass
+
+
+@dataclass
+class SyncResult:
+    mode: str  # 'full' or 'incremental'
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    history_id: str = ''
+
+
+def _database():
+    """
+    Guard for a sync's database work. SQLite has a single writer and fails
+    concurrent ones with "database is locked" instead of waiting, so syncs
+    running in threads (crm.google.worker) take turns there; the Gmail
+    round trips in between still overlap.
+    """
+    return _sqlite_lock if connection.vendor == 'sqlite' else nullcontext()
+
+
+def _status(exception):
+    return getattr(getattr(exception, 'resp', None), 'status', None)
+
+
+def email_from_resource(owner, message):
+    """Unsaved EmailMessage for a format=full message resource"""
+    parsed = parse_message(message)
+    return EmailMessage(
+        owner=owner,
+        gmail_id=message['id'],
+        thread_id=message.get('threadId', ''),
+        sender=(parsed['sender'] or '')[:255],
+        subject=parsed['subject'] or '',
+        snippet=parsed['snippet'] or '',
+        body=parsed['body'] or '',
+        label_ids=message.get('labelIds', []),
+        internal_date=datetime.fromtimestamp(int(message.get('internalDate', 0)) / 1000, tz=dt_timezone.utc),
+        history_id=message.get('historyId', ''),
+    )
+
+
+def store_messages(owner, messages):
+    """Upsert fetched message resources; returns how many were written"""
+    rows = [email_from_resource(owner, message) for message in messages
+            if not HIDDEN_LABELS & set(message.get('labelIds', []))]
+    EmailMessage.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['owner', 'gmail_id'],
+        update_fields=['thread_id', 'sender', 'subject', 'snippet', 'body', 'label_ids', 'history_id', 'synced_at'],
+    )
+    return len(rows)
+
+
+def _fetch(service, ids):
+    """Full resources for `ids`; messages deleted meanwhile are skipped"""
+    result = get_messages(service, ids, format='full')
+    failed = {msg_id: e for msg_id, e in result.errors.items() if _status(e) != 404}
+    if failed:
+        msg_id, error = next(iter(failed.items()))
+        raise SyncError(f"{len(failed)} messages could not be fetched, e.g. {msg_id}: {error}")
+    return result.messages
+
+
+def _save_cursor(profile, history_id):
+    profile.gmail_history_id = history_id
+    profile.gmail_synced_at = timezone.now()
+    Profile.objects.filter(pk=profile.pk).update(
+        gmail_history_id=profile.gmail_history_id, gmail_synced_at=profile.gmail_synced_at,
+    )
+
+
+def full_sync(profile, service, limit=None):
+    """Store the newest `limit` messages and start the history cursor"""
+    limit = limit or getattr(settings, 'GMAIL_INITIAL_SYNC_LIMIT', 500)
+    chunk_size = getattr(settings, 'GMAIL_SYNC_CHUNK_SIZE', 200)
+    # Taken first: changes made while listing are replayed by the next sync
+    history_id = service.users().getProfile(userId='me').execute()['historyId']
+    ids = list_message_ids(service, max_results=limit)
+    with _database():
+        known = set(
+            EmailMessage.objects.filter(owner=profile.user, gmail_id__in=ids).values_list('gmail_id', flat=True)
+        )
+    missing = [msg_id for msg_id in ids if msg_id not in known]
+    added = 0
+    for i in range(0, len(missing), chunk_size):
+        messages = _fetch(service, missing[i:i + chunk_size])
+        # Committed chunk by chunk: a rerun after a crash skips what is stored
+        with _database():
+            added += store_messages(profile.user, messages)
+    with _database():
+        _save_cursor(profile, history_id)
+    return SyncResult('full', added=added, history_id=history_id)
+
+
+def _history_pages(service, start_history_id):
+    page_token = None
+    while True:
+        kwargs = {'userId': 'me', 'startHistoryId': start_history_id, 'historyTypes': HISTORY_TYPES,
+                  'maxResults': getattr(settings, 'GMAIL_HISTORY_PAGE_SIZE', 500)}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        response = service.users().history().list(**kwargs).execute()
+        yield response
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _apply_history(profile, service, records, cursor):
+    """Apply one page of history records and move the cursor past them, atomically"""
+    added, deleted, labels = {}, set(), {}
+    for record in records:
+        for change in record.get('messagesAdded', []):
+            added[change['message']['id']] = change['message']
+            deleted.discard(change['message']['id'])
+        for change in record.get('messagesDeleted', []):
+            added.pop(change['message']['id'], None)
+            deleted.add(change['message']['id'])
+        for change in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+            labels[change['message']['id']] = change['message'].get('labelIds', [])
+
+    for msg_id, label_ids in labels.items():
+        if msg_id in added:
+            added[msg_id] = {**added[msg_id], 'labelIds': label_ids}
+        elif HIDDEN_LABELS & set(label_ids):
+            deleted.add(msg_id)
+    added = {msg_id: ref for msg_id, ref in added.items() if not HIDDEN_LABELS & set(ref.get('labelIds', []))}
+    relabeled_ids = [msg_id for msg_id in labels if msg_id not in added and msg_id not in deleted]
+    if relabeled_ids:
+        with _database():
+            stored = set(
+                EmailMessage.objects.filter(owner=profile.user, gmail_id__in=relabeled_ids)
+                .values_list('gmail_id', flat=True)
+            )
+        # Not stored, e.g. moved out of spam or trash: fetch it like an added message
+        for msg_id in relabeled_ids:
+            if msg_id not in stored:
+                added[msg_id] = {'id': msg_id, 'labelIds': labels[msg_id]}
+    messages = _fetch(service, list(added))
+
+    owner = profile.user
+    with _database(), transaction.atomic():
+        count = store_messages(owner, messages)
+        removed, _ = EmailMessage.objects.filter(owner=owner, gmail_id__in=deleted).delete()
+        relabeled = [
+            EmailMessage(pk=pk, label_ids=labels[gmail_id])
+            for pk, gmail_id in EmailMessage.objects.filter(
+                owner=owner, gmail_id__in=[i for i in labels if i not in added and i not in deleted],
+            ).values_list('pk', 'gmail_id')
+        ]
+        EmailMessage.objects.bulk_update(relabeled, ['label_ids'], batch_size=500)
+        _save_cursor(profile, cursor)
+    return count, len(relabeled), removed
+
+
+def incremental_sync(profile, service):
+    """Apply users.history since the stored cursor, checkpointing after every page"""
+    result = SyncResult('incremental', history_id=profile.gmail_history_id)
+    for page in _history_pages(service, profile.gmail_history_id):
+        records = page.get('history', [])
+        if page.get('nextPageToken'):
+            # Records come oldest first; a rerun continues after the last one applied
+            cursor = records[-1]['id'] if records else result.history_id
+        else:
+            cursor = page.get('historyId', result.history_id)
+        added, updated, deleted = _apply_history(profile, service, records, cursor)
+        result.added += added
+        result.updated += updated
+        result.deleted += deleted
+        result.history_id = cursor
+    return result
+
+
+def sync_account(profile, service=None, limit=None, full=False):
+    """
+    Bring the stored messages of `profile`'s Gmail account up to date:
+    incrementally from its cursor, or with a bounded full sync the first
+    time, with `full`, or when the cursor has expired.
+    """
+    if service is None:
+        from .gmail_service import get_profile_service
+
+        service = get_profile_service(profile)
+    if profile.gmail_history_id and not full:
+        try:
+            return incremental_sync(profile, service)
+        except Exception as e:
+            if _status(e) != 404:
+                raise
+            logger.info("Gmail history cursor of %s expired; running a full sync", profile.user)
+    return full_sync(profile, service, limit)
@@ -0,0 +1,112 @@
+"""
+Per-account rate limiting and retries for Gmail API traffic.
+
+Gmail enforces a per-user quota (250 units/s; a messages.get costs 5), and
+answers bursts above it with 429, as it answers overload with 5xx. Every
+cached service (one per account, see gmail_service) sends its requests
+through a ThrottledHttp that owns a TokenBucket for that account: each
+request, or each request inside a batch, takes a token, so one busy
+account cannot run past its quota however many threads work on it.
+Responses with 429/5xx, and connection errors, are retried with
+exponential backoff and jitter, honouring Retry-After when Gmail sends it.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved up; thread-safe"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, tokens=1):
+        """Take `tokens`, sleeping until they are available; returns the time slept"""
+        tokens = min(tokens, self.capacity)  # an oversized request waits for a full bucket
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going negative reserves the tokens; later callers wait behind us
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class ThrottledHttp:
+    """Wraps an httplib2-style HTTP object with a TokenBucket and retries"""
+
+    def __init__(self, http, bucket=None, max_retries=None, backoff=None, max_backoff=None):
+        self.http = http
+        self.bucket = bucket or TokenBucket(
+            getattr(settings, 'GMAIL_RATE_LIMIT', 40), getattr(settings, 'GMAIL_RATE_BURST', 100),
+        )
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'GMAIL_MAX_RETRIES', 4)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'GMAIL_BACKOFF', 0.5)
+        self.max_backoff = max_backoff or getattr(settings, 'GMAIL_MAX_BACKOFF', 16.0)
+        self.retries = 0
+        self.thread_safe = getattr(http, 'thread_safe', False)
+
+    def __getattr__(self, name):
+        if name == 'http':
+            raise AttributeError(name)
+        return getattr(self.http, name)
+
+    @property
+    def on_refresh(self):
+        return getattr(self.http, 'on_refresh', None)
+
+    @on_refresh.setter
+    def on_refresh(self, callback):
+        self.http.on_refresh = callback
+
+    def _delay(self, attempt, resp=None):
+        retry_after = _retry_after(resp) if resp is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        content_type = {k.lower(): v for k, v in (headers or {}).items()}.get('content-type', '')
+        if content_type.startswith('multipart/mixed') and body:
+            # A batch costs what its parts cost
+            text = body.decode() if isinstance(body, bytes) else body
+            items = max(text.count('Content-ID:'), 1)
+        else:
+            items = 1
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(items)
+            try:
+                resp, content = self.http.request(uri, method, body, headers, *args, **kwargs)
+            except OSError:
+                # Connection reset, timeout, ... (requests' errors are OSErrors too)
+                if attempt == self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+            else:
+                if resp.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                    return resp, content
+                delay = self._delay(attempt, resp)
+            self.retries += 1
+            time.sleep(delay)
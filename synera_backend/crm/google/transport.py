@@ -0,0 +1,116 @@
+"""
+Pooled, thread-safe HTTP transport for the Gmail client.
+
+The client library's default transport is an httplib2.Http wrapped in
+google_auth_httplib2.AuthorizedHttp: one connection, not safe to share
+between threads, and a new TLS handshake for every service built. PooledHttp
+offers the same request() interface on top of a requests.Session, whose
+urllib3 pool keeps up to `pool_size` connections to Google open and can be
+used from many threads at once.
+
+It signs requests itself and refreshes expired credentials under a lock:
+when several requests find the token expired, or get a 401 back with the
+same token, one of them refreshes and the others reuse the new token.
+The credentials are deliberately not exposed as `.credentials`, which would
+let the client library refresh them on its own, outside that lock. Proxy
+and CA bundle settings are taken from the environment once, when the
+transport is created.
+"""
+import os
+import threading
+
+from django.conf import settings
+
+# Headers describing the wire encoding, which requests has already undone
+_HOP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def _fingerprint(credentials):
+    return tuple(
+        getattr(credentials, name, None) for name in ('token', 'refresh_token', 'client_secret', 'token_uri')
+    )
+
+
+class PooledHttp:
+    """httplib2.Http-compatible request() over a pooled requests.Session"""
+    thread_safe = True
+    # Called with the credentials after each refresh, e.g. to store the new token
+    on_refresh = None
+
+    def __init__(self, credentials, pool_size=None, session=None, timeout=None):
+        import requests
+        from google.auth.transport.requests import Request
+
+        self._credentials = credentials
+        self._given = _fingerprint(credentials)
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.timeout = timeout or getattr(settings, 'GMAIL_HTTP_TIMEOUT', 30)
+        if session is None:
+            pool_size = pool_size or getattr(settings, 'GMAIL_HTTP_POOL_SIZE', 10)
+            session = requests.Session()
+            session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size))
+        if session.trust_env:
+            # requests re-reads proxy settings from os.environ on every call; do it once
+            session.proxies.update(requests.utils.get_environ_proxies('https://gmail.googleapis.com/'))
+            ca_bundle = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+            if ca_bundle and session.verify is True:
+                session.verify = ca_bundle
+            session.trust_env = False
+        self.session = session
+        self._auth_request = Request(session)
+
+    def update_credentials(self, credentials):
+        """
+        Sign with `credentials` from now on if they differ from the ones
+        given last time, e.g. a token stored by another process or a rotated
+        client secret. The same credentials again are ignored, so a caller
+        still holding a token refreshed here since does not bring it back.
+        """
+        fingerprint = _fingerprint(credentials)
+        with self._lock:
+            if fingerprint != self._given:
+                self._given = fingerprint
+                self._credentials = credentials
+
+    def refresh(self, stale_token=None):
+        """
+        Refresh the credentials unless another thread already did: either
+        they are valid again or their token is no longer `stale_token`.
+        """
+        credentials = self._credentials
+        with self._lock:
+            if stale_token is None and credentials.valid:
+                return
+            if stale_token is not None and credentials.token != stale_token:
+                return
+            credentials.refresh(self._auth_request)
+            self.refreshes += 1
+            if self.on_refresh is not None:
+                self.on_refresh(credentials)
+
+    def _send(self, uri, method, body, headers):
+        credentials = self._credentials
+        if not credentials.valid:
+            self.refresh()
+        token = credentials.token
+        headers = dict(headers or {})
+        credentials.apply(headers)
+        return token, self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        import httplib2
+
+        token, response = self._send(uri, method, body, headers)
+        if response.status_code == 401 and getattr(self._credentials, 'refresh_token', None):
+            self.refresh(stale_token=token)
+            token, response = self._send(uri, method, body, headers)
+
+        info = {k.lower(): v for k, v in response.headers.items() if k.lower() not in _HOP_HEADERS}
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self):
+        self.session.close()
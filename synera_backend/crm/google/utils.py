@@ -1,41 +1,218 @@
+"""
+Turning Gmail API message resources into sender, subject, snippet and body.
+
+parse_message() walks the MIME part tree iteratively, however deeply
+multipart/mixed, /alternative and /related are nested, and picks one body
+part: the first text/plain, else the first text/html, skipping
+attachments. Only that part is base64-decoded, with the charset its
+Content-Type names (undecodable bytes are replaced, unknown charsets read
+as UTF-8), and at most GMAIL_BODY_MAX_CHARS of it is kept.
+
+HTML is reduced to text by a streaming extractor built on the standard
+library's HTMLParser: no tree is built, script/style/head are skipped and
+block elements become line breaks. When lxml is installed (and
+GMAIL_HTML_PARSER is "auto" or "lxml") its C parser does the same work
+faster.
+"""
 import base64
-from bs4 import BeautifulSoup
+import functools
+import re
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+_CHARSET = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+_SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption',
+    'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+}
+# HTML read per character of text kept: markup is usually most of an email's HTML
+HTML_INPUT_FACTOR = 8
+
+
+def _headers(part):
+    return {h['name'].lower(): h['value'] for h in part.get('headers', [])}
+
+
+def _is_attachment(part, headers):
+    return bool(part.get('filename')) or headers.get('content-disposition', '').lower().startswith('attachment')
+
+
+def find_body_part(payload):
+    """The text/plain part of `payload`, else its first text/html part, else None"""
+    html = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        mime_type = (part.get('mimeType') or '').lower()
+        if mime_type.startswith('multipart/'):
+            # Reversed so the first child is visited first
+            stack.extend(reversed(part.get('parts') or []))
+            continue
+        if not part.get('body', {}).get('data'):
+            continue
+        if mime_type not in ('text/plain', 'text/html') or _is_attachment(part, _headers(part)):
+            continue
+        if mime_type == 'text/plain':
+            return part
+        if html is None:
+            html = part
+    return html
+
+
+def decode_part(part, max_chars):
+    """Text of a body part: at most about `max_chars` characters, in its own charset"""
+    data = part['body']['data']
+    # Decode only what can be kept (UTF-8 needs up to 4 bytes per character)
+    max_bytes = max_chars * 4
+    data = data[:(max_bytes + 2) // 3 * 4]
+    raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+    match = _CHARSET.search(_headers(part).get('content-type', ''))
+    charset = match.group(1).strip("'") if match else 'utf-8'
+    try:
+        text = raw.decode(charset, errors='replace')
+    except LookupError:
+        text = raw.decode('utf-8', errors='replace')
+    return text[:max_chars]
+
+
+class _Enough(Exception):
+    pass
+
+
+class HTMLTextExtractor(HTMLParser):
+    """Collects the text of an HTML document as it is fed, up to `max_chars`"""
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.chunks = []
+        self.size = 0
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size > self.max_chars:
+            raise _Enough
+
+    def text(self):
+        return ''.join(self.chunks)
+
+
+def _stdlib_html_text(html, max_chars):
+    extractor = HTMLTextExtractor(max_chars)
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except _Enough:
+        pass
+    return extractor.text()
+
+
+def _lxml_html_text(html, max_chars):
+    from lxml import etree, html as lxml_html
+
+    try:
+        root = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        # e.g. a str that carries an XML encoding declaration; HTMLParser reads anything
+        return _stdlib_html_text(html, max_chars)
+    chunks = []
+    size = skipping = 0
+    for event, element in etree.iterwalk(root, events=('start', 'end')):
+        tag = element.tag if isinstance(element.tag, str) else None  # comments, processing instructions
+        if event == 'start':
+            if tag in SKIP_TAGS:
+                skipping += 1
+            elif not skipping:
+                if tag in BLOCK_TAGS:
+                    chunks.append('\n')
+                if tag and element.text:
+                    chunks.append(element.text)
+                    size += len(element.text)
+        else:
+            if tag in SKIP_TAGS:
+                skipping -= 1
+            elif not skipping and tag in BLOCK_TAGS:
+                chunks.append('\n')
+            if not skipping and element.tail:
+                chunks.append(element.tail)
+                size += len(element.tail)
+        if size > max_chars:
+            break
+    return ''.join(chunks)
+
+
+@functools.lru_cache(maxsize=None)
+def _has_lxml():
+    try:
+        import lxml.html  # noqa: F401 (optional dependency)
+    except ImportError:
+        return False
+    return True
+
+
+def _html_text_function():
+    choice = getattr(settings, 'GMAIL_HTML_PARSER', 'auto')
+    if choice == 'lxml' or (choice == 'auto' and _has_lxml()):
+        return _lxml_html_text
+    return _stdlib_html_text
+
+
+def html_to_text(html, max_chars=None):
+    """Readable text of an HTML fragment or document"""
+    max_chars = max_chars or getattr(settings, 'GMAIL_BODY_MAX_CHARS', 100_000)
+    text = _html_text_function()(html, max_chars)
+    lines = (_SPACES.sub(' ', line).strip() for line in text.split('\n'))
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()[:max_chars]
+
 
 def parse_message(msg):
-    headers = msg.get("payload", {}).get("headers", [])
-    subject = None
-    sender = None
-    for h in headers:
-        if h["name"] == "Subject":
-            subject = h["value"]
-        elif h["name"] == "From":
-            sender = h["value"]
-
-    snippet = msg.get("snippet", "")
-    body = ""
-    parts = msg.get("payload", {}).get("parts", [])
-    if parts:
-        for part in parts:
-            mime_type = part.get("mimeType", "")
-            data = part.get("body", {}).get("data")
-            if not data:
-                continue
-            decoded = base64.urlsafe_b64decode(data).decode("utf-8")
-            if mime_type == "text/plain":
-                body = decoded
-                break
-            elif mime_type == "text/html":
-                soup = BeautifulSoup(decoded, "html.parser")
-                body = soup.get_text()
-                break
-    else:
-        data = msg.get("payload", {}).get("body", {}).get("data")
-        if data:
-            body = base64.urlsafe_b64decode(data).decode("utf-8")
+    """Sender, subject, snippet and body text of a format=full message resource"""
+    payload = msg.get('payload', {})
+    headers = {}
+    for h in payload.get('headers', []):
+        name = h['name'].lower()
+        if name in ('subject', 'from') and name not in headers:
+            headers[name] = h['value']
+
+    max_chars = getattr(settings, 'GMAIL_BODY_MAX_CHARS', 100_000)
+    body = ''
+    part = find_body_part(payload)
+    if part is not None:
+        if (part.get('mimeType') or '').lower() == 'text/html':
+            body = html_to_text(decode_part(part, max_chars * HTML_INPUT_FACTOR), max_chars)
+        else:
+            body = decode_part(part, max_chars)
 
     return {
-        "sender": sender,
-        "subject": subject,
-        "snippet": snippet,
-        "body": body,
+        'sender': headers.get('from'),
+        'subject': headers.get('subject'),
+        'snippet': msg.get('snippet', ''),
+        'body': body,
     }
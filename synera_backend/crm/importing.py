@@ -0,0 +1,154 @@
+"""
+Bulk CSV import of customers and leads (manage.py import_crm).
+
+The file is read in chunks. Per chunk, customers are resolved by
+(owner, email) with one query, missing ones are created and changed ones
+updated in bulk; the chunk's leads get sentiment and scores through the
+batch path (Lead.enrich) and go in with bulk_create. Each chunk is its own
+transaction, so a failing chunk is reported and skipped without undoing
+the ones before it.
+
+CSV columns (header names): customer_email, customer_name, customer_phone,
+customer_company, customer_address, customer_notes, title, description,
+status. A row without a title only upserts its customer.
+"""
+import itertools
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import invalidate_owner
+from .models import Customer, Lead
+from .sentiment import content_hash, polarities
+
+CUSTOMER_FIELDS = ['name', 'phone', 'company', 'address', 'notes']
+
+
+class RowError(Exception):
+    pass
+
+
+def read_chunks(reader, chunk_size):
+    """Yield lists of (line number, row dict) from a csv.DictReader"""
+    def numbered():
+        for row in reader:
+            yield reader.line_num, row
+
+    rows = numbered()
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield chunk
+
+
+def _clean(model, name, value, column=None):
+    """Value of CSV cell `value` for model field `name`, validated like a form would"""
+    field = model._meta.get_field(name)
+    value = (value or '').strip()
+    if not value:
+        if field.null:
+            return None
+        if field.has_default():
+            return field.get_default()
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise RowError(f"{column or name}: {' '.join(e.messages)}")
+
+
+def parse_row(row):
+    """(email, customer values, lead values or None) of one CSV row; RowError if invalid"""
+    email = _clean(Customer, 'email', row.get('customer_email'), 'customer_email')
+    customer = {
+        name: _clean(Customer, name, row[f'customer_{name}'], f'customer_{name}')
+        for name in CUSTOMER_FIELDS if (row.get(f'customer_{name}') or '').strip()
+    }
+    lead = None
+    if (row.get('title') or '').strip():
+        lead = {name: _clean(Lead, name, row.get(name)) for name in ('title', 'description')}
+        lead['status'] = _clean(Lead, 'status', (row.get('status') or '').lower())
+    return email, customer, lead
+
+
+def upsert_customers(owner, existing, parsed):
+    """
+    Create the customers of `parsed` ((email, values) pairs) missing from
+    `existing` (email -> Customer, updated in place) and update the ones
+    whose values changed. Returns (created, updated) counts.
+    """
+    wanted = {}
+    for email, values in parsed:
+        wanted.setdefault(email, {}).update(values)
+
+    changed, created = [], []
+    now = timezone.now()
+    for email, values in wanted.items():
+        customer = existing.get(email)
+        if customer is None:
+            customer = existing[email] = Customer(owner=owner, email=email, **values)
+            created.append(customer)
+        elif any(getattr(customer, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(customer, name, value)
+            customer.updated_at = now  # bulk_update skips auto_now; sync and ETags rely on it
+            changed.append(customer)
+
+    Customer.objects.bulk_create(created)
+    if changed:
+        Customer.objects.bulk_update(changed, CUSTOMER_FIELDS + ['updated_at'])
+    return len(created), len(changed)
+
+
+def import_chunk(owner, chunk, pool=None, workers=1):
+    """
+    Import one chunk of (line number, row) pairs in a transaction. Returns
+    (stats, errors) where errors lists (line number, message).
+    """
+    errors = []
+    parsed = []
+    for line, row in chunk:
+        try:
+            parsed.append((line, *parse_row(row)))
+        except RowError as e:
+            errors.append((line, str(e)))
+
+    with transaction.atomic():
+        # The chunk's one customer lookup
+        existing = {
+            customer.email: customer
+            for customer in Customer.objects.filter(owner=owner, email__in={item[1] for item in parsed})
+        }
+        named = set(existing) | {email for _line, email, values, _lead in parsed if values.get('name')}
+        valid = []
+        for item in parsed:
+            if item[1] in named:
+                valid.append(item)
+            else:
+                errors.append((item[0], "customer_name: required for a new customer."))
+
+        created, updated = upsert_customers(owner, existing, [(email, values) for _l, email, values, _ld in valid])
+        leads = [
+            Lead(customer=existing[email], **lead)
+            for _line, email, _values, lead in valid if lead is not None
+        ]
+        if pool is not None and leads:
+            analyze_in_pool(pool, workers, leads)
+        Lead.enrich(leads)
+        Lead.objects.bulk_create(leads)
+        if valid:
+            invalidate_owner(owner.pk)  # bulk writes send no post_save
+    errors.sort()
+    stats = {'customers_created': created, 'customers_updated': updated, 'leads': len(leads)}
+    return stats, errors
+
+
+def analyze_in_pool(pool, workers, leads):
+    """
+    Compute sentiment for `leads` across `pool` (a ProcessPoolExecutor),
+    leaving only scoring to Lead.enrich.
+    """
+    texts = [lead.description for lead in leads]
+    size = -(-len(texts) // workers)
+    parts = pool.map(polarities, [texts[i:i + size] for i in range(0, len(texts), size)])
+    for lead, value in zip(leads, itertools.chain.from_iterable(parts)):
+        lead.description_hash = content_hash(lead.description)
+        lead.set_sentiment(value if lead.description else None)
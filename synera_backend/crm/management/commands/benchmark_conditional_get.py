@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from crm.benchmarking import Timings, rolled_back, seed_customers, seed_leads
+from crm.ml.utils import current_model_version
+from crm.models import Lead
+from crm.views import LeadViewSet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch every page of an unchanged lead list, then revalidate it with "
+        "If-None-Match, and compare bytes sent and server CPU time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=5000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.seed(options['leads'])
+            self.run(user, options['page_size'], options['rounds'])
+
+    def seed(self, count):
+        rng = random.Random(0)
+        user = User.objects.create_user('benchmark-conditional-get')
+        customer_ids = [customer.pk for customer in seed_customers(user, max(count // 10, 1))]
+        seed_leads(
+            customer_ids, count, rng, statuses=['new', 'contacted', 'qualified'],
+            description='Asked for a quote.', score_model_version=current_model_version(),
+        )
+        return user
+
+    def run(self, user, page_size, rounds):
+        view = LeadViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+
+        def fetch_all(pages):
+            """
+            Walk every page like the frontend does. `pages` holds the (etag,
+            next link) of each page from an earlier walk, to revalidate with.
+            Returns (bytes received, status codes, pages).
+            """
+            url = f'/api/leads/?page_size={page_size}'
+            received, statuses, seen = 0, [], []
+            while url:
+                headers = {'HTTP_IF_NONE_MATCH': pages[len(seen)][0]} if pages else {}
+                request = factory.get(url, **headers)
+                force_authenticate(request, user=user)
+                response = view(request)
+                response.render()
+                received += len(response.content)
+                statuses.append(response.status_code)
+                if response.status_code == 200:
+                    url = response.data['next']
+                else:
+                    # Unchanged: the client still holds this page, next link included
+                    url = pages[len(seen)][1]
+                seen.append((response['ETag'], url))
+            return received, statuses, seen
+
+        results = {}
+        pages = None
+        for name in ('full', 'revalidate'):
+            cpu = Timings(clock=time.process_time)
+            for _ in range(rounds):
+                with cpu.measure():
+                    received, statuses, seen = fetch_all(pages)
+            results[name] = (received, statuses, cpu.mean)
+            pages = seen
+
+        full, revalidate = results['full'], results['revalidate']
+        assert set(revalidate[1]) == {304}, revalidate[1]
+        self.stdout.write(f"{Lead.objects.filter(customer__owner=user).count()} leads, "
+                          f"{len(full[1])} pages of {page_size}")
+        self.stdout.write(f"{'':>11} {'bytes':>10} {'CPU (ms)':>9}")
+        for name, (received, _statuses, cpu) in results.items():
+            self.stdout.write(f"{name:>11} {received:>10} {cpu * 1000:>9.1f}")
+        self.stdout.write(
+            f"saved {1 - revalidate[0] / full[0]:.1%} of bytes, {1 - revalidate[2] / full[2]:.1%} of CPU"
+        )
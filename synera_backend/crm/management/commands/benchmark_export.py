@@ -0,0 +1,81 @@
+import gc
+import os
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from crm.benchmarking import rolled_back, seed_customers, seed_leads
+from crm.views import LeadViewSet
+
+User = get_user_model()
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Not Linux: fall back to the peak, which can only overstate growth
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream /api/leads/export/ over a large seeded table and check that "
+        "memory stays under a fixed ceiling; reports rows per second"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--customers', type=int, default=10_000)
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--max-rss-mb', type=float, default=64,
+                            help="Allowed RSS growth while streaming, in MB")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.seed(options['rows'], options['customers'], options['seed'])
+            growth = self.run(user, options['rows'], options['fmt'])
+        if growth > options['max_rss_mb']:
+            raise CommandError(f"RSS grew {growth:.1f} MB, over the {options['max_rss_mb']} MB ceiling")
+
+    def seed(self, rows, customers, seed):
+        rng = random.Random(seed)
+        user = User.objects.create_user('benchmark-export')
+        customer_ids = [customer.pk for customer in seed_customers(user, customers)]
+        seed_leads(customer_ids, rows, rng, description='Asked for a quote, follow up next week.')
+        return user
+
+    def run(self, user, rows, fmt):
+        request = APIRequestFactory().get('/api/leads/export/', {'fmt': fmt})
+        force_authenticate(request, user=user)
+
+        gc.collect()
+        baseline = peak = current_rss()
+        start = time.perf_counter()
+        response = LeadViewSet.as_view({'get': 'export'})(request)
+        received = lines = 0
+        for part in response.streaming_content:
+            received += len(part)
+            lines += part.count(b'\n')
+            peak = max(peak, current_rss())
+        elapsed = time.perf_counter() - start
+        response.close()
+
+        # CSV has a header line; embedded newlines are absent from the seeded data
+        exported = lines - 1 if fmt == 'csv' else lines
+        assert exported == rows, (exported, rows)
+        growth = (peak - baseline) / 2**20
+        self.stdout.write(f"{exported} rows as {fmt}, {received / 2**20:.1f} MB in {elapsed:.1f} s")
+        self.stdout.write(f"{exported / elapsed:,.0f} rows/s")
+        self.stdout.write(f"RSS {baseline / 2**20:.1f} MB before, peak {peak / 2**20:.1f} MB (+{growth:.1f} MB)")
+        return growth
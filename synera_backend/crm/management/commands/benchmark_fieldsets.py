@@ -0,0 +1,72 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from crm.benchmarking import Timings, rolled_back, seed_customers, seed_leads
+from crm.ml.utils import current_model_version
+from crm.views import LeadViewSet
+
+User = get_user_model()
+
+# What LeadsList.jsx renders
+LIST_FIELDS = 'id,title,status,score,sentiment,enrichment_status,customer.name'
+
+
+class Command(BaseCommand):
+    help = "Compare payload size and latency of the full lead list with a ?fields= selection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument('--fields', default=LIST_FIELDS)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.seed(options['leads'])
+            self.run(user, options)
+
+    def seed(self, count):
+        rng = random.Random(0)
+        user = User.objects.create_user('benchmark-fieldsets')
+        notes = 'Met at the trade fair; interested in the annual plan, wants a demo for the whole team. ' * 5
+        customers = seed_customers(
+            user, max(count // 10, 1), phone='+1 555 0100', notes=notes,
+            company=lambda i: f'Company {i}', address=lambda i: f'{i} Market Street, Springfield',
+        )
+        seed_leads(
+            [customer.pk for customer in customers], count, rng, statuses=['new', 'contacted', 'qualified'],
+            description='Asked for a quote for 50 seats and a follow-up call next week. ' * 3,
+            sentiment='Positive', sentiment_score=0.4, score_model_version=current_model_version(),
+        )
+        return user
+
+    def run(self, user, options):
+        view = LeadViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+
+        def fetch_all(params):
+            url = f"/api/leads/?page_size={options['page_size']}{params}"
+            received = rows = 0
+            while url:
+                request = factory.get(url)
+                force_authenticate(request, user=user)
+                response = view(request)
+                response.render()
+                received += len(response.content)
+                rows += len(response.data['results'])
+                url = response.data['next']
+            return received, rows
+
+        self.stdout.write(f"{options['leads']} leads, pages of {options['page_size']}")
+        self.stdout.write(f"{'':>8} {'bytes':>10} {'p50 (ms)':>9}")
+        for name, params in (('full', ''), ('fields', f"&fields={options['fields']}")):
+            fetch_all(params)  # warm up
+            timings = Timings()
+            for _ in range(options['rounds']):
+                with timings.measure():
+                    received, rows = fetch_all(params)
+            assert rows == options['leads'], rows
+            self.stdout.write(f"{name:>8} {received:>10} {timings.median * 1000:>9.1f}")
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.google.fake import FakeGmail
+from crm.google.fetch import get_messages, list_message_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Wall time of fetching N Gmail messages against the in-process fake with simulated latency: "
+        "one get per message vs batched gets vs batches over a thread pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', type=int, nargs='+', default=[10, 50, 100, 200])
+        parser.add_argument('--latency-ms', type=float, default=40.0, help="per round trip")
+        parser.add_argument('--item-latency-ms', type=float, default=1.0, help="per request inside a batch")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        gmail = FakeGmail(latency=options['latency_ms'] / 1000, item_latency=options['item_latency_ms'] / 1000)
+        for i in range(max(options['counts'])):
+            gmail.add_message(subject=f'Quote {i}', body='Thanks for the call, please send the quote. ' * 20,
+                              html='<p>Thanks for the call, please send the quote.</p>' * 20)
+        service = gmail.service()
+
+        def sequential(ids):
+            return [service.users().messages().get(userId='me', id=i).execute() for i in ids]
+
+        def batched(ids):
+            return get_messages(service, ids, batch_size=options['batch_size'], workers=1).messages
+
+        def threaded(ids):
+            return get_messages(service, ids, batch_size=options['batch_size'], workers=options['workers']).messages
+
+        self.stdout.write(
+            f"latency {options['latency_ms']} ms/round trip, batches of {options['batch_size']}, "
+            f"{options['workers']} workers"
+        )
+        self.stdout.write(f"{'messages':>8} {'path':>10} {'round trips':>11} {'wall (ms)':>10}")
+        for count in options['counts']:
+            for label, fetch in (('sequential', sequential), ('batched', batched), ('threaded', threaded)):
+                del gmail.requests[:]
+                start = time.perf_counter()
+                ids = list_message_ids(service, max_results=count)
+                messages = fetch(ids)
+                elapsed = time.perf_counter() - start
+                assert len(messages) == count, (label, len(messages))
+                self.stdout.write(f"{count:>8} {label:>10} {len(gmail.requests):>11} {elapsed * 1000:>10.0f}")
@@ -0,0 +1,54 @@
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from crm.benchmarking import Timings
+from crm.google.fake import FakeGmail, FakeResponse, fake_session
+from crm.google.gmail_service import clear_service_cache, gmail_service_for
+from crm.google.transport import PooledHttp
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-request overhead of getting a Gmail service and making one call, with the transport "
+        "stubbed out: build() per request vs the cached per-credential service factory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build
+
+        gmail = FakeGmail()
+        gmail.add_message(subject='Hello', body='Body')
+
+        def credentials():
+            # What a view rebuilds from the session on every request
+            return Credentials(token='token', refresh_token='refresh', client_id='client',
+                               client_secret='secret', token_uri='https://oauth2.googleapis.com/token')
+
+        def stub_request(http, uri, method='GET', body=None, headers=None, *args, **kwargs):
+            status, response_headers, content = gmail.respond(method, uri, body, headers)
+            return FakeResponse(status, response_headers), content
+
+        def per_request_build():
+            service = build('gmail', 'v1', credentials=credentials())
+            return service.users().messages().list(userId='me', maxResults=10).execute()
+
+        def factory():
+            service = gmail_service_for(credentials(), transport=lambda c: PooledHttp(c, session=fake_session(gmail)))
+            return service.users().messages().list(userId='me', maxResults=10).execute()
+
+        self.stdout.write(f"{'path':>10} {'p50 (us)':>9} {'mean (us)':>10}")
+        clear_service_cache()
+        with mock.patch('httplib2.Http.request', stub_request):
+            for label, path in (('build', per_request_build), ('factory', factory)):
+                path()  # warm up
+                timings = Timings()
+                for _ in range(options['requests']):
+                    with timings.measure():
+                        assert path()['messages']
+                self.stdout.write(f"{label:>10} {timings.median * 1e6:>9.0f} {timings.mean * 1e6:>10.0f}")
+        clear_service_cache()
@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from crm.google.fake import FakeGmail, fake_session
+from crm.google.gmail_service import clear_service_cache, gmail_service_for, profile_credentials, store_credentials
+from crm.google.throttle import ThrottledHttp, TokenBucket
+from crm.google.transport import PooledHttp
+from crm.google.worker import sync_accounts
+from crm.models import EmailMessage, Profile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Multi-account Gmail sync against in-process fake mailboxes with injected latency "
+        "and 429s: a full sync round then an incremental one, for each worker count"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=24)
+        parser.add_argument('--messages', type=int, default=100, help="per mailbox before the first sync")
+        parser.add_argument('--new-messages', type=int, default=10, help="per mailbox between the two syncs")
+        parser.add_argument('--latency-ms', type=float, default=50.0, help="per round trip")
+        parser.add_argument('--item-latency-ms', type=float, default=1.0, help="per request inside a batch")
+        parser.add_argument('--throttled', type=int, default=2, help="429 answers per mailbox and round")
+        parser.add_argument('--rate-limit', type=float, default=40.0, help="requests/s per account")
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+
+    def handle(self, *args, **options):
+        users = []
+        try:
+            mailboxes = {}
+            for i in range(options['accounts']):
+                user = User.objects.create_user(f'benchmark-gmail-{i}')
+                users.append(user)
+                gmail = mailboxes[user.pk] = FakeGmail(
+                    latency=options['latency_ms'] / 1000, item_latency=options['item_latency_ms'] / 1000,
+                )
+                gmail.tokens = {'fresh'}
+                for j in range(options['messages']):
+                    gmail.add_message(subject=f'Quote {j}', body='Thanks for the call, please send the quote. ' * 20)
+            self.run(users, mailboxes, options)
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            clear_service_cache()
+
+    def run(self, users, mailboxes, options):
+        from google.oauth2.credentials import Credentials
+
+        def refresh(credentials, request):
+            credentials.token = 'fresh'
+
+        transports = {}
+
+        def service_for(profile):
+            def transport(credentials):
+                bucket = TokenBucket(options['rate_limit'], options['rate_limit'])
+                http = ThrottledHttp(PooledHttp(credentials, session=fake_session(mailboxes[profile.user_id])), bucket)
+                transports[profile.user_id] = http
+                return http
+            return gmail_service_for(profile_credentials(profile), transport=transport,
+                                     on_refresh=lambda credentials: store_credentials(profile, credentials))
+
+        self.stdout.write(
+            f"{options['accounts']} accounts, {options['messages']} + {options['new_messages']} messages each, "
+            f"{options['latency_ms']} ms/round trip, {options['throttled']} x 429 per account and round"
+        )
+        self.stdout.write(
+            f"{'workers':>7} {'round':>11} {'messages':>8} {'wall (s)':>8} {'msg/s':>7} "
+            f"{'lag p50':>7} {'lag max':>7} {'refreshes':>9} {'retries':>7}"
+        )
+        for workers in options['workers']:
+            # Start over: nothing stored, stale access tokens, no cached services
+            EmailMessage.objects.filter(owner__in=users).delete()
+            for user in users:
+                Profile.objects.filter(user=user).update(
+                    gmail_token='stale', gmail_refresh_token=f'refresh-{user.pk}', gmail_client_id='benchmark',
+                    gmail_history_id=None, gmail_synced_at=None,
+                )
+            clear_service_cache()
+            transports.clear()
+            for label in ('full', 'incremental'):
+                if label == 'incremental':
+                    for gmail in mailboxes.values():
+                        for j in range(options['new_messages']):
+                            gmail.add_message(subject=f'Follow-up {j}', body='Any news on the quote?')
+                for gmail in mailboxes.values():
+                    gmail.fail_requests(429, times=options['throttled'])
+                profiles = Profile.objects.select_related('user').filter(user__in=users).order_by('user_id')
+                with mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=refresh):
+                    run = sync_accounts(profiles, workers=workers, service_for=service_for)
+                assert not run.failed, run.failed[0].error
+                p50, worst = run.lag_summary()
+                lag = ('-', '-') if p50 is None else (f'{p50:.2f}', f'{worst:.2f}')
+                self.stdout.write(
+                    f"{workers:>7} {label:>11} {run.messages:>8} {run.seconds:>8.2f} {run.messages_per_second:>7.0f} "
+                    f"{lag[0]:>7} {lag[1]:>7} {sum(h.refreshes for h in transports.values()):>9} "
+                    f"{sum(h.retries for h in transports.values()):>7}"
+                )
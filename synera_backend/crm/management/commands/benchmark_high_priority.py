@@ -0,0 +1,71 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from crm.benchmarking import Timings, rolled_back, seed_customers, seed_leads
+from crm.caching import bump_owner_version
+from crm.ml.utils import current_model_version
+from crm.views import high_priority_leads
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Load-test high_priority_leads: requests per second with the per-user cache cold vs warm"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--leads', type=int, default=10, help="Leads per customer")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        user = None
+        try:
+            with rolled_back():
+                user = self.seed(options['customers'], options['leads'], options['seed'])
+                self.run(user, options['requests'])
+        finally:
+            if user is not None:
+                # The rolled-back user's id can be reused; drop what was cached for it
+                bump_owner_version(user.pk)
+
+    def seed(self, customers, leads, seed):
+        rng = random.Random(seed)
+        user = User.objects.create_user('benchmark-high-priority')
+        customer_ids = [customer.pk for customer in seed_customers(user, customers)]
+        # Stored scores are current, so no rescoring on read
+        seed_leads(customer_ids, customers * leads, rng, score_model_version=current_model_version())
+        return user
+
+    def run(self, user, count):
+        factory = APIRequestFactory()
+
+        def request(timings):
+            req = factory.get('/api/high-priority-leads/')
+            force_authenticate(req, user=user)
+            with timings.measure():
+                response = high_priority_leads(req)
+                response.render()
+            assert response.status_code == 200, response.data
+            return len(response.data)
+
+        results = {'cold': Timings(), 'warm': Timings()}
+        # cold: every request starts from a freshly invalidated cache
+        for _ in range(count):
+            bump_owner_version(user.pk)
+            rows = request(results['cold'])
+
+        request(Timings())  # prime
+        for _ in range(count):
+            request(results['warm'])
+
+        self.stdout.write(f"{rows} high-priority leads per response, {count} requests each")
+        self.stdout.write(f"{'cache':>6} {'req/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+        for name, timings in results.items():
+            self.stdout.write(
+                f"{name:>6} {timings.per_second:>9.0f} "
+                f"{timings.median * 1000:>9.2f} {timings.p95 * 1000:>9.2f}"
+            )
@@ -0,0 +1,90 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.ml import utils as ml_utils
+from crm.ml.lookup import build_score_table
+from crm.ml.registry import LoadedModel
+from crm.ml.synthetic import fit_synthetic_model, make_leads
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-lead vs batch lead scoring on synthetic leads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='*', type=int, default=[1000, 10000, 100000])
+        parser.add_argument(
+            '--model', choices=['loaded', 'logistic', 'forest', 'rules'], default='logistic',
+            help="Score with the loaded artifact, a synthetic stand-in model, or the rule-based fallback"
+        )
+        parser.add_argument(
+            '--micro', type=int, default=0, metavar='CALLS',
+            help="Also time single calculate_lead_score calls (model vs lookup table) over CALLS leads"
+        )
+
+    def handle(self, *args, **options):
+        if options['model'] == 'loaded':
+            loaded = ml_utils.current_model()
+        elif options['model'] == 'rules':
+            loaded = LoadedModel(model=None, version='benchmark')
+        else:
+            loaded = LoadedModel(model=fit_synthetic_model(options['model']), version='benchmark')
+
+        model_name = type(loaded.model).__name__ if loaded.model is not None else 'rule-based'
+        self.stdout.write(f"model: {model_name}")
+        if options['sizes']:
+            self.batch_benchmark(loaded, options['sizes'])
+        if options['micro']:
+            self.per_call_benchmark(loaded, options['micro'])
+
+    def batch_benchmark(self, loaded, sizes):
+        loaded = loaded._replace(score_table=None)
+        self.stdout.write(f"{'leads':>8} {'per-lead (s)':>14} {'batch (s)':>11} {'speedup':>9}")
+        for size in sizes:
+            leads = make_leads(size)
+
+            start = time.perf_counter()
+            single = [ml_utils.calculate_lead_score(lead, loaded) for lead in leads]
+            per_lead = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch = ml_utils.calculate_lead_scores(leads, loaded)
+            batched = time.perf_counter() - start
+
+            if single != batch:
+                self.stderr.write(f"warning: batch scores differ from per-lead scores at n={size}")
+            self.stdout.write(
+                f"{size:>8} {per_lead:>14.3f} {batched:>11.3f} {per_lead / batched:>8.1f}x"
+            )
+
+    def per_call_benchmark(self, loaded, calls):
+        if loaded.model is None:
+            self.stderr.write("per-call benchmark needs a model; skipping")
+            return
+        leads = make_leads(calls, seed=1)
+        loaded = loaded._replace(score_table=None)
+
+        start = time.perf_counter()
+        for lead in leads:
+            ml_utils.calculate_lead_score(lead, loaded)
+        model_us = (time.perf_counter() - start) / calls * 1e6
+
+        start = time.perf_counter()
+        table = build_score_table(loaded.model)
+        build_s = time.perf_counter() - start
+        if table is None:
+            self.stderr.write("lookup table rejected by the accuracy bound; skipping")
+            return
+        loaded = loaded._replace(score_table=table)
+
+        start = time.perf_counter()
+        for lead in leads:
+            ml_utils.calculate_lead_score(lead, loaded)
+        table_us = (time.perf_counter() - start) / calls * 1e6
+
+        self.stdout.write(
+            f"table: {table.resolution} grid points, built in {build_s:.2f}s, "
+            f"max error {table.max_error():.4f} points"
+        )
+        self.stdout.write(f"per call: model {model_us:.1f} us, table {table_us:.2f} us "
+                          f"({model_us / table_us:.0f}x)")
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from crm.benchmarking import Timings, rolled_back
+from crm.ml.synthetic import fit_synthetic_model
+from crm.ml.utils import registry
+from crm.models import Customer, Lead
+from crm.views import LeadViewSet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Measure LeadViewSet write latency (p50/p95) in sync vs async enrichment mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--sentences', type=int, default=40, help="Length of each description")
+        parser.add_argument('--model', choices=['loaded', 'logistic', 'forest'], default='forest')
+
+    def handle(self, *args, **options):
+        model = None if options['model'] == 'loaded' else fit_synthetic_model(options['model'])
+        with rolled_back():
+            if model is None:
+                self.run(options['requests'], options['sentences'])
+            else:
+                with registry.use(model):
+                    self.run(options['requests'], options['sentences'])
+
+    def run(self, count, sentences):
+        user = User.objects.create_user('benchmark-writes')
+        customer = Customer.objects.create(owner=user, name='Benchmark', email='bench@example.com')
+        lead = Lead.objects.create(customer=customer, title='Benchmark lead')
+        view = LeadViewSet.as_view({'patch': 'partial_update'})
+        factory = APIRequestFactory()
+
+        for mode in ('sync', 'async'):
+            timings = Timings()
+            with override_settings(LEAD_ENRICHMENT_MODE=mode):
+                for i in range(count):
+                    # Unique text so neither the description hash nor the polarity cache short-circuits
+                    text = " ".join(
+                        f"Call {mode} {i}.{n}: very interested, great budget, a few concerns." for n in range(sentences)
+                    )
+                    body = {'description': text}
+                    request = factory.patch(f'/api/leads/{lead.pk}/', body, format='json')
+                    force_authenticate(request, user=user)
+                    with timings.measure():
+                        response = view(request, pk=lead.pk)
+                    assert response.status_code == 200, response.data
+
+            self.stdout.write(
+                f"{mode:>5}: p50 {timings.median * 1000:.2f} ms, p95 {timings.p95 * 1000:.2f} ms"
+            )
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+import crm
+from crm.ml.synthetic import fit_synthetic_model
+
+# Runs in a fresh interpreter so RSS and imports reflect only one artifact type
+MEASURE_SCRIPT = """
+import json, resource, sys, time
+from pathlib import Path
+
+
+def peak_rss_mb():
+    # ru_maxrss survives fork+exec on Linux, so prefer the per-process high-water mark
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+import django
+django.setup()
+from crm.ml.registry import LoadedModel, load_artifact
+from crm.ml.synthetic import make_leads
+from crm.ml.utils import calculate_lead_score
+
+path, calls = Path(sys.argv[1]), int(sys.argv[2])
+baseline_mb = peak_rss_mb()
+start = time.perf_counter()
+loaded = LoadedModel(load_artifact(path, path.read_bytes()), 'benchmark')
+leads = make_leads(calls)
+calculate_lead_score(leads[0], loaded)
+load_s = time.perf_counter() - start
+
+start = time.perf_counter()
+for lead in leads:
+    calculate_lead_score(lead, loaded)
+per_call_us = (time.perf_counter() - start) / calls * 1e6
+
+print(json.dumps({
+    'load_s': load_s,
+    'per_call_us': per_call_us,
+    'rss_mb': peak_rss_mb(),
+    'model_rss_mb': peak_rss_mb() - baseline_mb,
+    'pandas': 'pandas' in sys.modules,
+    'sklearn': 'sklearn' in sys.modules,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare worker RSS and per-call latency for pickle vs compiled .npz lead models"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pickle', help="Fitted model artifact (default: synthetic forest)")
+        parser.add_argument('--calls', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            pickle_path = options['pickle']
+            if not pickle_path:
+                import joblib
+                pickle_path = os.path.join(tmp, 'lead_scoring_model.pkl')
+                joblib.dump(fit_synthetic_model('forest'), pickle_path)
+            npz_path = os.path.join(tmp, 'lead_scoring_model.npz')
+            call_command('export_lead_model', model=pickle_path, output=npz_path, stdout=self.stdout)
+
+            self.stdout.write(f"{'artifact':>9} {'load (s)':>9} {'per call (us)':>14} "
+                              f"{'peak RSS (MB)':>14} {'model+deps (MB)':>16} pandas sklearn")
+            for label, path in (('pickle', pickle_path), ('npz', npz_path)):
+                result = self.measure(path, options['calls'])
+                self.stdout.write(
+                    f"{label:>9} {result['load_s']:>9.2f} {result['per_call_us']:>14.1f} "
+                    f"{result['rss_mb']:>14.1f} {result['model_rss_mb']:>16.1f} "
+                    f"{'yes' if result['pandas'] else 'no':>6} {'yes' if result['sklearn'] else 'no':>7}"
+                )
+
+    def measure(self, path, calls):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE_SCRIPT, str(path), str(calls)],
+            cwd=Path(crm.__file__).resolve().parent.parent,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONWARNINGS='ignore'),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
@@ -0,0 +1,123 @@
+import base64
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.google.utils import parse_message
+
+
+def legacy_parse_message(msg):
+    """parse_message as it was: top-level parts only, UTF-8 only, BeautifulSoup for HTML"""
+    headers = msg.get("payload", {}).get("headers", [])
+    subject = None
+    sender = None
+    for h in headers:
+        if h["name"] == "Subject":
+            subject = h["value"]
+        elif h["name"] == "From":
+            sender = h["value"]
+
+    snippet = msg.get("snippet", "")
+    body = ""
+    parts = msg.get("payload", {}).get("parts", [])
+    if parts:
+        for part in parts:
+            mime_type = part.get("mimeType", "")
+            data = part.get("body", {}).get("data")
+            if not data:
+                continue
+            decoded = base64.urlsafe_b64decode(data).decode("utf-8")
+            if mime_type == "text/plain":
+                body = decoded
+                break
+            elif mime_type == "text/html":
+                from bs4 import BeautifulSoup
+                soup = BeautifulSoup(decoded, "html.parser")
+                body = soup.get_text()
+                break
+    else:
+        data = msg.get("payload", {}).get("body", {}).get("data")
+        if data:
+            body = base64.urlsafe_b64decode(data).decode("utf-8")
+
+    return {
+        "sender": sender,
+        "subject": subject,
+        "snippet": snippet,
+        "body": body,
+    }
+
+
+def _part(mime_type, text, charset='utf-8', filename=''):
+    return {
+        'mimeType': mime_type,
+        'filename': filename,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': base64.urlsafe_b64encode(text.encode(charset)).decode()},
+    }
+
+
+def _message(payload):
+    payload['headers'] = [{'name': 'From', 'value': 'Client <c@beta.test>'}, {'name': 'Subject', 'value': 'Quote'}]
+    return {'snippet': 'Thanks for the call', 'payload': payload}
+
+
+def _html(size):
+    row = ('<tr><td style="padding:4px;font-family:Arial"><a href="https://example.test/track?id=1">Seat</a></td>'
+           '<td style="padding:4px">12&nbsp;&euro;</td></tr>\n')
+    head = '<html><head><style>td {color: #333}</style><script>var t = 1;</script></head><body><table>'
+    return head + row * (size // len(row)) + '</table><p>Kind regards</p></body></html>'
+
+
+def corpus(scale):
+    plain = 'Thanks for the call, please send the quote for 50 seats.\n' * (300 * scale)
+    attachment = _part('application/pdf', 'x' * (300_000 * scale), filename='quote.pdf')
+    nested = {'mimeType': 'multipart/alternative', 'parts': [_part('text/plain', plain), _part('text/html', _html(80_000 * scale))]}
+    deep = _part('text/plain', plain)
+    for _ in range(30):
+        deep = {'mimeType': 'multipart/mixed', 'parts': [deep]}
+    return {
+        'html-only': _message({'mimeType': 'multipart/alternative', 'parts': [_part('text/html', _html(1_000_000 * scale))]}),
+        'nested': _message({'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'multipart/related', 'parts': [nested]}, attachment, attachment,
+        ]}),
+        'deep': _message({'mimeType': 'multipart/mixed', 'parts': [deep]}),
+        'latin-1': _message({'mimeType': 'multipart/alternative', 'parts': [_part('text/plain', 'Grüße aus Köln. ' * 2000 * scale, 'iso-8859-1')]}),
+        'big-plain': _message({'mimeType': 'text/plain', 'body': _part('text/plain', plain * 40)['body']}),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Time parse_message against the previous BeautifulSoup implementation over "
+        "synthetic large, nested, HTML-only and non-UTF-8 Gmail messages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--scale', type=int, default=1, help="multiplies every message's size")
+
+    def time(self, parse, msg, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                body = parse(msg)['body']
+            except Exception as e:
+                return None, type(e).__name__
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, body
+
+    def handle(self, *args, **options):
+        messages = corpus(options['scale'])
+        self.stdout.write(
+            f"{'message':>10} {'size KB':>8} {'legacy ms':>9} {'legacy body':>14} {'new ms':>7} {'new body':>9}"
+        )
+        for name, msg in messages.items():
+            size = len(str(msg)) // 1024
+            legacy_ms, legacy_body = self.time(legacy_parse_message, msg, options['repeat'])
+            new_ms, new_body = self.time(parse_message, msg, options['repeat'])
+            legacy = (f"{legacy_ms:>9.1f} {len(legacy_body):>8} chars" if legacy_ms is not None
+                      else f"{'-':>9} {legacy_body:>14}")
+            self.stdout.write(f"{name:>10} {size:>8} {legacy} {new_ms:>7.1f} {len(new_body):>9}")
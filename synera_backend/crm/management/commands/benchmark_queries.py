@@ -0,0 +1,108 @@
+import random
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm.benchmarking import Timings, rolled_back, seed_customers, seed_leads
+from crm.models import Customer, Lead, Product
+from crm.pagination import CreatedAtCursorPagination
+from crm.views import CustomerViewSet, LeadViewSet, ProductViewSet, high_priority_queryset
+
+User = get_user_model()
+
+# Models whose Meta.indexes are compared with and without
+INDEXED_MODELS = [Customer, Lead, Product]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large CRM dataset in a rolled-back transaction and print EXPLAIN "
+        "plans and timings of the list endpoint queries without and with the "
+        "composite/partial indexes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument('--customers', type=int, default=5000, help="Customers per user")
+        parser.add_argument('--leads', type=int, default=10, help="Leads per customer")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"database: {connection.vendor}")
+        with rolled_back():
+            user = self.seed(options['users'], options['customers'], options['leads'], options['seed'])
+            self.analyze()
+            after = self.measure(user, options['repeat'])
+            self.drop_indexes()
+            self.analyze()
+            before = self.measure(user, options['repeat'])
+
+        for name in after:
+            self.stdout.write(f"\n== {name} ==")
+            for label, results in (('without indexes', before), ('with indexes', after)):
+                ms, plan = results[name]
+                self.stdout.write(f"-- {label}: {ms:.2f} ms")
+                self.stdout.write(plan)
+
+        self.stdout.write(f"\n{'query':<16} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}")
+        for name in after:
+            self.stdout.write(
+                f"{name:<16} {before[name][0]:>12.2f} {after[name][0]:>11.2f} "
+                f"{before[name][0] / after[name][0]:>7.1f}x"
+            )
+
+    def seed(self, users, customers, leads, seed):
+        rng = random.Random(seed)
+        owners = User.objects.bulk_create([User(username=f'benchmark-queries-{i}') for i in range(users)])
+        for owner in owners:
+            seed_customers(owner, customers)
+        customer_ids = list(Customer.objects.filter(owner__in=owners).values_list('id', flat=True))
+        seed_leads(customer_ids, len(customer_ids) * leads, rng)
+        Product.objects.bulk_create(
+            [Product(name=f'Product {i}') for i in range(customers * 10)], batch_size=5000
+        )
+        self.stdout.write(
+            f"seeded {users} users, {len(customer_ids)} customers, {len(customer_ids) * leads} leads"
+        )
+        return owners[0]
+
+    def queries(self, user):
+        """The querysets each list endpoint runs for `user`'s first page"""
+        request = SimpleNamespace(user=user)
+        ordering = CreatedAtCursorPagination.ordering
+        limit = CreatedAtCursorPagination.page_size + 1  # the paginator fetches one extra row
+        return {
+            viewset.__name__.replace('ViewSet', '').lower() + 's': (
+                viewset(request=request).get_queryset().order_by(*ordering)[:limit]
+            )
+            for viewset in (CustomerViewSet, LeadViewSet, ProductViewSet)
+        } | {'high_priority': high_priority_queryset(user)}
+
+    def measure(self, user, repeat):
+        results = {}
+        for name, queryset in self.queries(user).items():
+            list(queryset.all())  # warm the page cache
+            timings = Timings()
+            for _ in range(repeat):
+                with timings.measure():
+                    list(queryset.all())
+            if connection.vendor == 'postgresql':
+                plan = queryset.explain(analyze=True)
+            else:
+                plan = queryset.explain()
+            results[name] = (timings.median * 1000, plan)
+        return results
+
+    def drop_indexes(self):
+        # Plain DROP INDEX: the SQLite schema editor refuses to run inside a transaction
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
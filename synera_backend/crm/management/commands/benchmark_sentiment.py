@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.sentiment import LexiconBackend, TextBlobBackend, sentiment_label
+
+FILLER = [
+    'the', 'customer', 'said', 'that', 'our', 'proposal', 'budget', 'team', 'call',
+    'meeting', 'about', 'pricing', 'and', 'was', 'is', 'a', 'with', 'for', 'next', 'week',
+]
+MODIFIERS = ['very', 'really', 'extremely', 'quite', 'so', 'too']
+NEGATIONS = ['not', 'never', "don't", "isn't", 'no']
+
+
+def generate_corpus(lexicon, documents, sentences, seed=0):
+    """Synthetic CRM notes mixing lexicon words, modifiers, negations and '!'"""
+    rng = random.Random(seed)
+    opinion_words = [word for word, (p, _, _) in lexicon.items() if p and word.isalpha()]
+    corpus = []
+    for _ in range(documents):
+        parts = []
+        for _ in range(sentences):
+            words = rng.sample(FILLER, 5)
+            phrase = [rng.choice(opinion_words)]
+            if rng.random() < 0.3:
+                phrase.insert(0, rng.choice(MODIFIERS))
+            if rng.random() < 0.2:
+                phrase.insert(0, rng.choice(NEGATIONS))
+            words[rng.randrange(len(words))] = ' '.join(phrase)
+            parts.append(' '.join(words).capitalize() + ('!' if rng.random() < 0.1 else '.'))
+        corpus.append(' '.join(parts))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = "Benchmark the lexicon sentiment backend against TextBlob and report agreement"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=2000)
+        parser.add_argument('--sentences', type=int, default=10, help="Sentences per document")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        lexicon_backend = LexiconBackend()
+        self.stdout.write(f"lexicon: {len(lexicon_backend.lexicon)} words loaded in "
+                          f"{time.perf_counter() - start:.2f}s")
+
+        corpus = generate_corpus(
+            lexicon_backend.lexicon, options['documents'], options['sentences'], options['seed']
+        )
+        chars = sum(len(text) for text in corpus)
+        self.stdout.write(f"corpus: {len(corpus)} documents, {chars / len(corpus):.0f} chars on average")
+
+        results = {}
+        for backend in (TextBlobBackend(), lexicon_backend):
+            backend.polarity(corpus[0])  # warm up lazy loading
+            start = time.perf_counter()
+            results[backend.name] = backend.polarities(corpus)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{backend.name:>9}: {elapsed:.3f}s, {elapsed / len(corpus) * 1e6:.0f} us/doc, "
+                f"{chars / elapsed / 1e6:.1f} MB/s"
+            )
+
+        reference, fast = results['textblob'], results['lexicon']
+        diffs = [abs(a - b) for a, b in zip(reference, fast)]
+        labels_agree = sum(sentiment_label(a) == sentiment_label(b) for a, b in zip(reference, fast))
+        self.stdout.write(
+            f"agreement: labels {labels_agree / len(corpus):.1%}, "
+            f"exact {sum(d < 1e-9 for d in diffs) / len(corpus):.1%}, "
+            f"mean abs diff {sum(diffs) / len(diffs):.4f}, max abs diff {max(diffs):.4f}"
+        )
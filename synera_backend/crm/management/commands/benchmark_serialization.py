@@ -0,0 +1,78 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from crm.benchmarking import Timings, rolled_back, seed_customers, seed_leads
+from crm.fastlist import compile_plan
+from crm.ml.utils import current_model_version
+from crm.models import Customer, Lead
+from crm.renderers import FastJSONRenderer
+from crm.serializers import CustomerSerializer, LeadSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Serialization throughput of lead and customer lists: LeadSerializer/"
+        "CustomerSerializer + JSONRenderer vs the fast list plan (json and orjson)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.seed(max(options['sizes']))
+            self.run(user, options['sizes'], options['rounds'])
+
+    def seed(self, count):
+        rng = random.Random(0)
+        user = User.objects.create_user('benchmark-serialization')
+        customers = seed_customers(
+            user, count, phone='+1 555 0100', notes='Met at the trade fair.',
+            company=lambda i: f'Company {i}', address=lambda i: f'{i} Market Street',
+        )
+        seed_leads(
+            [customer.pk for customer in customers], count, rng, statuses=['new', 'contacted', 'qualified'],
+            description='Asked for a quote.', sentiment='Positive', sentiment_score=0.4,
+            score_model_version=current_model_version(), updated_by=lambda i: user if i % 2 else None,
+        )
+        return user
+
+    def run(self, user, sizes, rounds):
+        lists = [
+            ('leads', LeadSerializer,
+             Lead.objects.filter(customer__owner=user).select_related('customer', 'updated_by').order_by('pk')),
+            ('customers', CustomerSerializer, Customer.objects.filter(owner=user).order_by('pk')),
+        ]
+
+        def regular(serializer_class, queryset):
+            return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+        def fast(serializer_class, queryset):
+            plan = compile_plan(serializer_class())
+            rows = queryset.values_list(*plan.lookups, named=True)
+            return FastJSONRenderer().render([plan.build(row) for row in rows])
+
+        def fast_orjson(serializer_class, queryset):
+            with override_settings(CRM_JSON_ENCODER='orjson'):
+                return fast(serializer_class, queryset)
+
+        self.stdout.write(f"{'':>9} {'rows':>6} {'path':>12} {'rows/s':>9} {'p50 (ms)':>9}")
+        for name, serializer_class, queryset in lists:
+            for size in sizes:
+                expected = None
+                for label, path in (('serializer', regular), ('fast', fast), ('fast+orjson', fast_orjson)):
+                    timings = Timings()
+                    for _ in range(rounds):
+                        with timings.measure():
+                            content = path(serializer_class, queryset[:size])
+                    expected = expected or content
+                    assert content == expected, f"{label} output differs for {name}"
+                    median = timings.median
+                    self.stdout.write(f"{name:>9} {size:>6} {label:>12} {size / median:>9.0f} {median * 1000:>9.1f}")
@@ -0,0 +1,60 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.ml.compiled import CompiledModel, compile_estimator
+from crm.ml.utils import FEATURE_COLUMNS, model_path
+
+
+class Command(BaseCommand):
+    help = "Compile the fitted lead scoring model into a NumPy-only .npz artifact"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=str(model_path), help="Fitted joblib/pickle artifact")
+        parser.add_argument('--output', help="Defaults to the model path with an .npz suffix")
+
+    def handle(self, *args, **options):
+        import joblib
+        import numpy as np
+
+        source = Path(options['model'])
+        output = Path(options['output'] or source.with_suffix('.npz'))
+        try:
+            estimator = joblib.load(source)
+        except Exception as e:
+            raise CommandError(f"Could not load {source}: {e}")
+
+        feature_names = getattr(estimator, 'feature_names_in_', FEATURE_COLUMNS)
+        try:
+            arrays = compile_estimator(estimator, feature_names)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+
+        # Check the round trip before replacing the live artifact
+        compiled = CompiledModel.load(io.BytesIO(buffer.getvalue()))
+        probe = np.random.default_rng(0).uniform(-1, 1, size=(256, compiled.n_features))
+        if hasattr(estimator, 'feature_names_in_'):
+            import pandas as pd
+            expected = estimator.predict_proba(pd.DataFrame(probe, columns=list(feature_names)))
+        else:
+            expected = estimator.predict_proba(probe)
+        error = float(np.max(np.abs(compiled.predict_proba(probe) - expected)))
+        if error > 1e-9:
+            raise CommandError(f"Compiled model differs from the estimator by {error}")
+
+        # Atomic replace so the model registry never sees a partial file
+        with tempfile.NamedTemporaryFile(dir=output.parent, suffix='.npz', delete=False) as tmp:
+            tmp.write(buffer.getvalue())
+        os.replace(tmp.name, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {compiled.kind} model to {output} ({output.stat().st_size} bytes, "
+            f"max deviation {error:.1e})"
+        ))
+
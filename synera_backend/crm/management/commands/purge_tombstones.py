@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crm.models import Tombstone
+from crm.sync import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS. "
+        "Clients with an older sync token get a full snapshot instead."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - retention()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} tombstones"))
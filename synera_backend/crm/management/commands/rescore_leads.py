@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.ml.utils import current_model, registry
+from crm.models import Lead
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score leads whose stored score came from another model version. "
+        "Leads are streamed in primary-key order, so an interrupted run can be "
+        "re-run (or resumed with --after-id) without redoing finished chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--after-id', type=int, default=0, help="Skip leads with id <= AFTER_ID")
+        parser.add_argument('--reload', action='store_true', help="Check the model artifact before starting")
+
+    def handle(self, *args, **options):
+        loaded = registry.reload() if options['reload'] else current_model()
+        stale = (
+            Lead.objects.exclude(score_model_version=loaded.version)
+            .only('id', 'status', 'sentiment_score', 'score', 'score_model_version', 'enrichment_status')
+            .order_by('pk')
+        )
+        total = stale.filter(pk__gt=options['after_id']).count()
+        self.stdout.write(f"Model {loaded.version}: {total} stale leads")
+
+        last_id = options['after_id']
+        done = 0
+        start = time.perf_counter()
+        while True:
+            chunk = list(stale.filter(pk__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                break
+            with transaction.atomic():
+                done += Lead.refresh_stale_scores(chunk)
+            last_id = chunk[-1].pk
+
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"  {done}/{total} leads ({done / elapsed:.0f}/s), last id {last_id}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-scored {done} leads in {time.perf_counter() - start:.1f}s"
+        ))
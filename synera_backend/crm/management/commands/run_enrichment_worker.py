@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.enrichment import claim_jobs, process_jobs
+
+
+class Command(BaseCommand):
+    help = "Drain the lead enrichment queue (sentiment + scoring) used in async mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--lease-seconds', type=int, default=300,
+                            help="Reclaim jobs left running longer than this by a crashed worker")
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--once', action='store_true', help="Exit when no jobs are due")
+
+    def handle(self, *args, **options):
+        total_ok = total_failed = 0
+        while True:
+            jobs = claim_jobs(options['batch_size'], lease_seconds=options['lease_seconds'])
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            start = time.perf_counter()
+            ok, failed = process_jobs(jobs, max_attempts=options['max_attempts'])
+            total_ok += ok
+            total_failed += failed
+            self.stdout.write(
+                f"Enriched {ok} leads ({failed} failed) in {time.perf_counter() - start:.2f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total_ok} enriched, {total_failed} failed"))
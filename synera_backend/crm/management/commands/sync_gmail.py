@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from crm.google.worker import sync_accounts
+from crm.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the Gmail messages of connected accounts into EmailMessage: a bounded "
+        "full sync the first time, then incremental syncs from the stored historyId. "
+        "Accounts are synced concurrently; see crm.google.sync and crm.google.worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help="Sync only this user (repeatable); default: every connected account")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Messages stored by a full sync (default GMAIL_INITIAL_SYNC_LIMIT, 500)")
+        parser.add_argument('--full', action='store_true', help="Full sync even where a cursor is stored")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Accounts synced at once (default GMAIL_SYNC_WORKERS, 4)")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Keep running, starting a sync round every INTERVAL seconds")
+
+    def profiles(self, users):
+        profiles = Profile.objects.select_related('user').filter(
+            Q(gmail_refresh_token__gt='') | Q(gmail_token__gt='')
+        ).order_by('user__username')
+        if users:
+            profiles = profiles.filter(user__username__in=users)
+            missing = set(users) - {profile.user.username for profile in profiles}
+            if missing:
+                raise CommandError(f"No connected Gmail account for: {', '.join(sorted(missing))}")
+        return list(profiles)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            run = sync_accounts(
+                self.profiles(options['users']), workers=options['workers'],
+                limit=options['limit'], full=options['full'],
+            )
+            self.report(run)
+            if options['interval'] is None:
+                break
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
+        if run.failed:
+            raise CommandError(f"{len(run.failed)} accounts failed to sync")
+
+    def report(self, run):
+        for account in run.accounts:
+            if account.error:
+                self.stderr.write(f"{account.username}: {account.error}")
+                continue
+            lag = 'first sync' if account.lag is None else f"lag {account.lag:.1f}s"
+            self.stdout.write(
+                f"{account.username}: {account.mode} sync, {account.added} stored, {account.updated} relabeled, "
+                f"{account.deleted} deleted in {account.seconds:.2f}s ({lag})"
+            )
+        p50, worst = run.lag_summary()
+        lag = '' if p50 is None else f", lag p50 {p50:.1f}s max {worst:.1f}s"
+        self.stdout.write(
+            f"Synced {len(run.accounts) - len(run.failed)}/{len(run.accounts)} accounts: "
+            f"{run.messages} messages in {run.seconds:.2f}s ({run.messages_per_second:.0f} msg/s){lag}"
+        )
@@ -0,0 +1,122 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from crm.ml import training
+from crm.ml.utils import FEATURE_COLUMNS, model_path
+
+
+def _init_worker():
+    # Spawned workers start without Django configured; forked ones already are
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPERIMENTAL: train a lead scoring model on won/lost leads, streamed from "
+        "the database in fixed-size batches, and write a versioned artifact with its "
+        "cross-validation metrics. Leads keep no status history and the won/lost "
+        "flags are the label, so no status feature varies in training and the model "
+        "scores on sentiment alone. It is for offline evaluation only and is never "
+        "installed as the live model (LEAD_MODEL_PATH)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--epochs', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per partial_fit call")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched per database round trip")
+        parser.add_argument('--alpha', type=float, default=1e-4, help="L2 regularization strength")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds (0 to skip)")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes for cross-validation (default: one per fold, 1 = in-process)")
+        parser.add_argument('--output-dir', default=str(model_path.parent))
+
+    def handle(self, *args, **options):
+        fit_options = {
+            key: options[key] for key in ('epochs', 'batch_size', 'chunk_size', 'alpha', 'seed')
+        }
+        start = time.perf_counter()
+
+        folds = options['folds']
+        cv_metrics = self.cross_validate(folds, options['workers'], fit_options) if folds > 1 else []
+
+        try:
+            estimator, rows = training.fit(**fit_options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        import joblib
+        buffer = io.BytesIO()
+        joblib.dump(estimator, buffer)
+        content = buffer.getvalue()
+        # Same scheme as ModelRegistry, so the file name matches Lead.score_model_version
+        version = "sha256-" + hashlib.sha256(content).hexdigest()[:12]
+
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        artifact = output_dir / f"{model_path.stem}-{version}.pkl"
+        self.write_atomic(artifact, content)
+        metadata = {
+            'version': version,
+            'trained_at': timezone.now().isoformat(),
+            'estimator': type(estimator).__name__,
+            'features': FEATURE_COLUMNS,
+            'untrained_features': training.UNTRAINED_COLUMNS,
+            'experimental': True,
+            'rows': rows,
+            'options': fit_options,
+            'cross_validation': cv_metrics,
+        }
+        self.write_atomic(artifact.with_suffix('.json'), json.dumps(metadata, indent=2).encode())
+        self.stdout.write(f"Wrote {artifact} ({rows} leads, {time.perf_counter() - start:.1f}s)")
+        self.stdout.write("Experimental: status features are constant in training; not installed")
+
+    def cross_validate(self, folds, workers, fit_options):
+        workers = folds if workers is None else workers
+        if workers > 1:
+            # Child processes must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=min(workers, folds), initializer=_init_worker) as pool:
+                futures = [
+                    pool.submit(training.cross_validate_fold, fold, folds, fit_options)
+                    for fold in range(folds)
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [training.cross_validate_fold(fold, folds, fit_options) for fold in range(folds)]
+
+        for result in results:
+            self.stdout.write(
+                f"  fold {result['fold']}: {result['rows']} held out, log loss {result['log_loss']:.4f}, "
+                f"accuracy {result['accuracy']:.3f}, AUC {result['auc']:.3f}"
+            )
+        scored = [result for result in results if result['rows']]
+        if scored:
+            total = sum(result['rows'] for result in scored)
+            mean = {
+                metric: sum(result[metric] * result['rows'] for result in scored) / total
+                for metric in ('log_loss', 'accuracy', 'auc')
+            }
+            self.stdout.write(
+                f"  {folds}-fold CV: log loss {mean['log_loss']:.4f}, "
+                f"accuracy {mean['accuracy']:.3f}, AUC {mean['auc']:.3f}"
+            )
+        return results
+
+    @staticmethod
+    def write_atomic(path, content):
+        # Readers (the model registry) never see a partially written file
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=path.suffix, delete=False) as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, path)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_customer_owner_alter_customer_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='score_model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_lead_score_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='description_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
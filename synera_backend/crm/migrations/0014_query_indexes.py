@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_lead_enrichment_status_enrichmentjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['owner', 'created_at'], name='crm_cust_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['-created_at', 'id'], name='crm_lead_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(condition=models.Q(('score__gte', 80), models.Q(('status__in', ['won', 'lost']), _negated=True)), fields=['customer', '-score'], name='crm_lead_open_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', 'id'], name='crm_product_created_idx'),
+        ),
+    ]
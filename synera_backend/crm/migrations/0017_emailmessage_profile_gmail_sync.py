@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0016_sync_tombstones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='gmail_history_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='gmail_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='EmailMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gmail_id', models.CharField(max_length=64)),
+                ('thread_id', models.CharField(max_length=64)),
+                ('sender', models.CharField(blank=True, default='', max_length=255)),
+                ('subject', models.TextField(blank=True, default='')),
+                ('snippet', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('label_ids', models.JSONField(blank=True, default=list)),
+                ('internal_date', models.DateTimeField()),
+                ('history_id', models.CharField(blank=True, default='', max_length=32)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-internal_date'],
+                'indexes': [models.Index(fields=['owner', '-internal_date'], name='crm_email_owner_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'gmail_id'), name='crm_email_owner_gmail_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,125 @@
+"""
+NumPy-only inference for exported lead scoring models.
+
+`compile_estimator` flattens a fitted scikit-learn estimator into plain
+arrays (coefficients for linear models, concatenated node arrays for
+decision trees and forests) that `export_lead_model` saves as an .npz
+file. `CompiledModel` loads that file with NumPy alone and reproduces the
+estimator's predict_proba, so web workers need neither pandas nor sklearn.
+"""
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class CompiledModel:
+    numpy_only = True  # tells crm.ml.utils to pass plain arrays, not DataFrames
+
+    def __init__(self, arrays):
+        self.kind = str(arrays['kind'])
+        self.classes_ = arrays['classes']
+        self.feature_names = [str(name) for name in arrays['feature_names']]
+        self.n_features = len(self.feature_names)
+        if self.kind == 'linear':
+            self.coef = arrays['coef']
+            self.intercept = arrays['intercept']
+        elif self.kind == 'trees':
+            self.roots = arrays['roots']
+            self.left = arrays['left']
+            self.right = arrays['right']
+            self.feature = arrays['feature']
+            # Leaves have feature -2; index column 0 there, the result is never used
+            self._feature_index = np.maximum(self.feature, 0)
+            self.threshold = arrays['threshold']
+            self.value = arrays['value']
+            self.max_depth = int(arrays['max_depth'])
+        else:
+            raise ValueError(f"Unknown compiled model kind: {self.kind}")
+
+    @classmethod
+    def load(cls, path_or_file):
+        with np.load(path_or_file, allow_pickle=False) as data:
+            if int(data['format_version']) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported compiled model format {data['format_version']}")
+            return cls({key: data[key] for key in data.files})
+
+    def predict_proba(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != self.n_features:
+            raise ValueError(
+                f"X has {features.shape[-1]} features, but the compiled model expects {self.n_features}"
+            )
+        if self.kind == 'linear':
+            logits = features @ self.coef + self.intercept
+            positive = 1.0 / (1.0 + np.exp(-logits))
+            return np.column_stack([1.0 - positive, positive])
+        return self._predict_trees(features)
+
+    def _predict_trees(self, features):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        features = features.astype(np.float32)
+        samples = np.arange(len(features))
+        nodes = np.repeat(self.roots[:, None], len(features), axis=1)  # (trees, samples)
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            go_left = features[samples, self._feature_index[nodes]] <= self.threshold[nodes]
+            nodes = np.where(left < 0, nodes, np.where(go_left, left, self.right[nodes]))
+        return self.value[nodes].mean(axis=0)
+
+
+def compile_estimator(estimator, feature_names):
+    """Flatten a fitted LogisticRegression / DecisionTree / RandomForest into arrays"""
+    classes = np.asarray(estimator.classes_)
+    common = {
+        'format_version': np.array(FORMAT_VERSION),
+        'classes': classes,
+        'feature_names': np.array(list(feature_names), dtype=str),
+    }
+
+    if hasattr(estimator, 'coef_') and hasattr(estimator, 'intercept_'):
+        if len(classes) != 2:
+            raise ValueError("Only binary linear models can be compiled")
+        return dict(
+            common,
+            kind=np.array('linear'),
+            coef=np.asarray(estimator.coef_, dtype=np.float64).ravel(),
+            intercept=np.asarray(estimator.intercept_, dtype=np.float64).ravel()[0],
+        )
+
+    trees = getattr(estimator, 'estimators_', None)
+    if trees is None and hasattr(estimator, 'tree_'):
+        trees = [estimator]
+    if trees is None or not all(hasattr(tree, 'tree_') for tree in np.ravel(trees)):
+        raise ValueError(f"Cannot compile {type(estimator).__name__}")
+    if getattr(estimator, 'n_outputs_', 1) != 1 or np.ndim(trees) != 1:
+        raise ValueError(f"Cannot compile multi-output {type(estimator).__name__}")
+
+    roots, left, right, feature, threshold, value = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        t = tree.tree_
+        children_left = t.children_left.astype(np.int64)
+        children_right = t.children_right.astype(np.int64)
+        leaf = children_left < 0
+        roots.append(offset)
+        left.append(np.where(leaf, -1, children_left + offset))
+        right.append(np.where(leaf, -1, children_right + offset))
+        feature.append(t.feature.astype(np.int64))
+        threshold.append(t.threshold.astype(np.float64))
+        counts = t.value[:, 0, :].astype(np.float64)
+        value.append(counts / counts.sum(axis=1, keepdims=True))
+        max_depth = max(max_depth, int(t.max_depth))
+        offset += t.node_count
+
+    return dict(
+        common,
+        kind=np.array('trees'),
+        roots=np.array(roots, dtype=np.int64),
+        left=np.concatenate(left),
+        right=np.concatenate(right),
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        value=np.concatenate(value),
+        max_depth=np.array(max_depth),
+    )
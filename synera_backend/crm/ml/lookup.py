@@ -0,0 +1,162 @@
+"""
+Precomputed lookup table for the lead scoring model.
+
+The model only sees a status one-hot and a sentiment score bounded to
+[-1, 1], so its output can be tabulated per status over the sentiment
+range and answered without calling pandas or sklearn.
+
+Smooth models (e.g. logistic regression) are sampled on an even grid and
+linearly interpolated. Tree models are piecewise constant in sentiment, so
+for them the table stores one value per interval between the trees' own
+sentiment split thresholds, which makes the lookup exact.
+"""
+import struct
+from bisect import bisect_left
+
+import numpy as np
+from django.conf import settings
+
+from .utils import FEATURE_COLUMNS, STATUS_FEATURE_INDEX
+
+STATUSES = list(STATUS_FEATURE_INDEX) + [None]  # None = unknown status, all flags off
+
+# sklearn trees compare float32 feature values against their thresholds
+_FLOAT32 = struct.Struct('f')
+
+
+class LeadScoreTable:
+    """Per-status conversion probabilities over the sentiment range"""
+
+    def __init__(self, model, rows, unknown_row, breakpoints=None):
+        self.model = model
+        self.resolution = len(unknown_row)
+        self._rows = rows
+        self._unknown_row = unknown_row
+        self._breakpoints = breakpoints
+        self._scale = (self.resolution - 1) / 2.0
+        self._last = self.resolution - 1
+
+    @classmethod
+    def from_model(cls, model, resolution=2001):
+        """Tabulate predict_proba for every status (plus unknown) in one call"""
+        thresholds = _sentiment_thresholds(model)
+        if thresholds is not None:
+            # Largest float32 at or below each threshold: float32(x) <= breakpoint goes left
+            rounded = np.asarray(thresholds, dtype=np.float32)
+            below = np.nextafter(rounded, np.float32(-np.inf))
+            breakpoints = np.where(rounded <= np.asarray(thresholds), rounded, below)
+            breakpoints = sorted({float(b) for b in breakpoints if -1.0 <= b < 1.0})
+            # One sample per interval (b[i-1], b[i]], taken at its right end
+            samples = np.array(breakpoints + [1.0])
+        else:
+            if resolution < 2:
+                raise ValueError("Lead score table needs at least two grid points")
+            breakpoints = None
+            samples = np.linspace(-1.0, 1.0, resolution)
+
+        probabilities = _predict_conversion(model, _features(samples))
+        probabilities = probabilities.reshape(len(STATUSES), len(samples))
+        rows = {status: probabilities[block].tolist() for block, status in enumerate(STATUSES[:-1])}
+        return cls(model, rows, probabilities[-1].tolist(), breakpoints=breakpoints)
+
+    def probability(self, status, sentiment_score):
+        """Conversion probability from the table, or None outside [-1, 1]"""
+        if not -1.0 <= sentiment_score <= 1.0:
+            return None
+        row = self._rows.get(status, self._unknown_row)
+        if self._breakpoints is not None:
+            sentiment_score = _FLOAT32.unpack(_FLOAT32.pack(sentiment_score))[0]
+            return row[bisect_left(self._breakpoints, sentiment_score)]
+
+        position = (sentiment_score + 1.0) * self._scale
+        index = int(position)
+        if index >= self._last:
+            return row[self._last]
+        low = row[index]
+        return low + (row[index + 1] - low) * (position - index)
+
+    def score(self, status, sentiment_score):
+        """Lead score (%) from the table, or None if the model must be asked"""
+        probability = self.probability(status, sentiment_score)
+        if probability is None:
+            return None
+        return round(probability * 100, 2)
+
+    def max_error(self, samples=1000, seed=0):
+        """
+        Largest absolute difference, in score points, between the table and
+        the real model over grid midpoints and random sentiments.
+        """
+        rng = np.random.default_rng(seed)
+        sentiments = rng.uniform(-1.0, 1.0, samples)
+        if self._breakpoints is None:
+            step = 2.0 / self._last
+            midpoints = np.linspace(-1.0 + step / 2, 1.0 - step / 2, self._last)
+            if len(midpoints) > samples:
+                midpoints = rng.choice(midpoints, samples, replace=False)
+            sentiments = np.concatenate([sentiments, midpoints])
+
+        expected = _predict_conversion(self.model, _features(sentiments)) * 100
+        actual = np.array([
+            self.probability(status, s) for status in STATUSES for s in sentiments.tolist()
+        ]) * 100
+        return float(np.max(np.abs(expected - actual)))
+
+
+def build_score_table(scoring_model):
+    """
+    Precompute the lookup table for `scoring_model` and check it against the
+    model. Returns None if the interpolation error exceeds
+    LEAD_SCORE_TABLE_MAX_ERROR score points.
+    """
+    resolution = getattr(settings, "LEAD_SCORE_TABLE_RESOLUTION", 2001)
+    max_error = getattr(settings, "LEAD_SCORE_TABLE_MAX_ERROR", 0.5)
+    try:
+        table = LeadScoreTable.from_model(scoring_model, resolution=resolution)
+        error = table.max_error()
+    except Exception as e:
+        print(f"Lead score table not built: {e}")
+        return None
+    if error > max_error:
+        print(f"Lead score table disabled: max error {error:.3f} exceeds {max_error}")
+        return None
+    return table
+
+
+def _features(sentiments):
+    """Feature rows for every status in STATUSES, each over all `sentiments`"""
+    n = len(sentiments)
+    features = np.zeros((len(STATUSES) * n, len(FEATURE_COLUMNS)))
+    for block, status in enumerate(STATUSES):
+        rows = slice(block * n, (block + 1) * n)
+        features[rows, 0] = sentiments
+        if status is not None:
+            features[rows, STATUS_FEATURE_INDEX[status]] = 1.0
+    return features
+
+
+def _sentiment_thresholds(model):
+    """Sorted sentiment split thresholds of a tree model, or None for other models"""
+    sentiment_index = FEATURE_COLUMNS.index("sentiment_score")
+    if getattr(model, "kind", None) == "trees":  # CompiledModel
+        splits = (model.left >= 0) & (model.feature == sentiment_index)
+        return np.unique(model.threshold[splits]).tolist()
+
+    trees = getattr(model, "estimators_", None)
+    if trees is None:
+        trees = [model] if hasattr(model, "tree_") else None
+    if trees is None:
+        return None
+    trees = np.ravel(trees)
+    if not all(hasattr(tree, "tree_") for tree in trees):
+        return None
+
+    thresholds = [tree.tree_.threshold[tree.tree_.feature == sentiment_index] for tree in trees]
+    return np.unique(np.concatenate(thresholds)).tolist() if thresholds else []
+
+
+def _predict_conversion(model, features):
+    if hasattr(model, "feature_names_in_"):
+        import pandas as pd
+        features = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    return model.predict_proba(features)[:, 1]
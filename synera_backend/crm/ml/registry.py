@@ -0,0 +1,144 @@
+"""
+Lead scoring model registry.
+
+Loads the model artifact on first use and re-checks its mtime/size at most
+every LEAD_MODEL_CHECK_INTERVAL seconds. A changed file is hashed and, if
+its content differs, loaded and swapped in as a new immutable LoadedModel,
+so a retrained artifact is picked up without restarting workers. Callers
+take one snapshot per scoring call and use its model, lookup table and
+version together. Artifacts ending in .npz are compiled models
+(crm.ml.compiled) and load with NumPy only. An artifact trained on other
+feature columns than the registry's is rejected when loaded, not at the
+first prediction.
+"""
+import hashlib
+import io
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, NamedTuple, Optional
+
+from django.conf import settings
+
+# Version stamped on Lead.score_model_version for scores from the rule-based fallback
+RULES_VERSION = "rules-v1"
+
+
+class LoadedModel(NamedTuple):
+    model: Any
+    version: str
+    score_table: Optional[Any] = None
+
+
+NO_MODEL = LoadedModel(model=None, version=RULES_VERSION)
+
+
+class ModelRegistry:
+    def __init__(self, path, check_interval=None, features=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.features = features
+        self._current = NO_MODEL
+        self._signature = None
+        self._pinned = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current LoadedModel, reloading the artifact first if it changed on disk"""
+        if self._pinned is not None:
+            return self._pinned
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._refresh()
+                    self._next_check = now + self._interval()
+        return self._current
+
+    def reload(self):
+        """Check the artifact immediately, ignoring the check interval"""
+        with self._lock:
+            self._refresh()
+            self._next_check = time.monotonic() + self._interval()
+        return self._current
+
+    @contextmanager
+    def use(self, model, version=None):
+        """Temporarily serve `model` instead of the artifact (tests and benchmarks)"""
+        previous = self._pinned
+        if model is None:
+            self._pinned = NO_MODEL
+        else:
+            self._pinned = build_loaded_model(model, version or f"pinned-{id(model):x}")
+        try:
+            yield self._pinned
+        finally:
+            self._pinned = previous
+
+    def _interval(self):
+        if self.check_interval is not None:
+            return self.check_interval
+        return getattr(settings, "LEAD_MODEL_CHECK_INTERVAL", 5.0)
+
+    def _refresh(self):
+        try:
+            stat = self.path.stat()
+        except OSError as e:
+            if self._signature != "missing":
+                print(f"ML model not loaded: {e}")
+            self._signature = "missing"
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+
+        try:
+            content = self.path.read_bytes()
+            version = "sha256-" + hashlib.sha256(content).hexdigest()[:12]
+            if version != self._current.version:
+                model = load_artifact(self.path, content)
+                if self.features is not None:
+                    check_features(model, self.features, self.path)
+                self._current = build_loaded_model(model, version)
+                print(f"ML model loaded: {version}")
+        except Exception as e:
+            # Keep serving the previous model; retry once the file changes again
+            print(f"ML model not loaded: {e}")
+        self._signature = signature
+
+
+def load_artifact(path, content):
+    """Compiled .npz artifacts need only NumPy; anything else is a joblib pickle"""
+    if path.suffix == ".npz":
+        from .compiled import CompiledModel
+        return CompiledModel.load(io.BytesIO(content))
+    import joblib
+    return joblib.load(io.BytesIO(content))
+
+
+def check_features(model, features, path):
+    """Raise ValueError unless `model` was trained on exactly `features`, in order"""
+    names = getattr(model, "feature_names_in_", None)
+    if names is None:
+        names = getattr(model, "feature_names", None)  # CompiledModel
+    if names is not None:
+        if [str(name) for name in names] != list(features):
+            raise ValueError(
+                f"{path.name} was trained on features {[str(name) for name in names]}, "
+                f"but scoring sends {list(features)}"
+            )
+    elif getattr(model, "n_features_in_", len(features)) != len(features):
+        raise ValueError(
+            f"{path.name} expects {model.n_features_in_} features, but scoring sends {len(features)}"
+        )
+
+
+def build_loaded_model(model, version):
+    """Wrap `model` with its version and, if enabled, its lookup table"""
+    score_table = None
+    if getattr(settings, "LEAD_SCORING_ENGINE", "model") == "table":
+        from .lookup import build_score_table
+        score_table = build_score_table(model)
+    return LoadedModel(model=model, version=version, score_table=score_table)
@@ -0,0 +1,49 @@
+"""
+Synthetic leads and stand-in models for benchmarks and tests.
+
+The shipped artifact is not always loadable in development, so scoring
+benchmarks fit a small model on random data with the same feature layout
+as crm.ml.utils.FEATURE_COLUMNS.
+"""
+import random
+
+
+STATUSES = ['new', 'contacted', 'qualified', 'lost', 'won']
+
+
+def make_leads(n, seed=0):
+    """Return n unsaved Lead objects with random status and sentiment"""
+    from crm.models import Lead
+
+    rng = random.Random(seed)
+    return [
+        Lead(status=rng.choice(STATUSES), sentiment_score=rng.uniform(-1, 1))
+        for _ in range(n)
+    ]
+
+
+def fit_synthetic_model(kind='logistic', seed=0, n_samples=5000):
+    """
+    Fit a stand-in classifier on random features laid out like FEATURE_COLUMNS.
+    `kind` is 'logistic' or 'forest'.
+    """
+    import numpy as np
+    import pandas as pd
+    from .utils import FEATURE_COLUMNS, build_feature_matrix
+
+    leads = make_leads(n_samples, seed=seed)
+    features = build_feature_matrix(leads)
+    rng = np.random.default_rng(seed)
+    signal = 1.5 * features[:, 0] + features[:, 2] + 2 * features[:, 4] - 2 * features[:, 3]
+    labels = (signal + rng.normal(0, 0.75, size=len(leads)) > 0.5).astype(int)
+    frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+
+    if kind == 'forest':
+        from sklearn.ensemble import RandomForestClassifier
+        model = RandomForestClassifier(n_estimators=50, max_depth=8, random_state=seed)
+    elif kind == 'logistic':
+        from sklearn.linear_model import LogisticRegression
+        model = LogisticRegression()
+    else:
+        raise ValueError(f"Unknown synthetic model kind: {kind}")
+    return model.fit(frame, labels)
@@ -0,0 +1,142 @@
+"""
+Streaming training for the lead scoring model.
+
+Closed leads (won = 1, lost = 0) are read with QuerySet.iterator() and
+encoded in fixed-size batches by crm.ml.utils.build_feature_matrix, the
+same encoder used at inference, then fed to SGDClassifier.partial_fit.
+Only one batch is in memory at a time, so memory stays flat however many
+leads there are. Cross-validation folds are assigned by primary key
+(pk % folds), which needs no shuffled copy of the table.
+
+The status_Won/status_Lost flags are the label itself, so they are zeroed
+in training batches. Leads keep no status history, so that leaves no
+status feature that varies: every status flag is 0 in training, those
+weights stay 0, and the model learns from sentiment alone. At inference
+it would ignore the status of open leads, which the rule-based scores do
+not, so train_lead_model is experimental: it writes artifacts and
+metrics for offline evaluation and never installs them (see
+UNTRAINED_COLUMNS).
+"""
+import math
+from itertools import islice
+
+from .utils import FEATURE_COLUMNS, build_feature_matrix
+
+# Columns that encode the outcome and would leak the label
+OUTCOME_COLUMNS = [FEATURE_COLUMNS.index("status_Won"), FEATURE_COLUMNS.index("status_Lost")]
+
+# Columns constant (0) in every training batch: closed leads are won or lost only
+UNTRAINED_COLUMNS = [name for name in FEATURE_COLUMNS if name.startswith("status_")]
+
+# Probability histogram resolution used to approximate ROC AUC in bounded memory
+AUC_BINS = 1000
+
+
+def closed_leads():
+    from crm.models import Lead
+
+    return (
+        Lead.objects.filter(status__in=[Lead.STATUS_WON, Lead.STATUS_LOST])
+        .order_by('pk')
+        # Named rows expose .status/.sentiment_score like a Lead, without model instances
+        .values_list('id', 'status', 'sentiment_score', named=True)
+    )
+
+
+def iter_batches(batch_size, chunk_size=2000, folds=None, fold=None, holdout=False):
+    """
+    Yield (ids, features, labels) arrays for closed leads, batch_size rows at a time.
+    With `folds`, keep only rows of fold `fold` (holdout=True) or all other rows.
+    """
+    import numpy as np
+    from crm.models import Lead
+
+    leads = closed_leads().iterator(chunk_size=chunk_size)
+    while True:
+        batch = list(islice(leads, batch_size))
+        if not batch:
+            return
+        ids = np.fromiter((lead.id for lead in batch), dtype=np.int64, count=len(batch))
+        features = build_feature_matrix(batch)
+        features[:, OUTCOME_COLUMNS] = 0.0
+        labels = np.fromiter(
+            (lead.status == Lead.STATUS_WON for lead in batch), dtype=np.int64, count=len(batch)
+        )
+        if folds:
+            keep = (ids % folds == fold) if holdout else (ids % folds != fold)
+            ids, features, labels = ids[keep], features[keep], labels[keep]
+            if not len(ids):
+                continue
+        yield ids, features, labels
+
+
+def new_estimator(alpha=1e-4, seed=0):
+    from sklearn.linear_model import SGDClassifier
+
+    # log_loss gives calibrated predict_proba and compiles to a linear .npz model
+    return SGDClassifier(loss='log_loss', alpha=alpha, random_state=seed)
+
+
+def fit(epochs=5, batch_size=10000, chunk_size=2000, alpha=1e-4, seed=0, folds=None, fold=None):
+    """Fit a fresh estimator over `epochs` streamed passes (optionally leaving out one fold)"""
+    import numpy as np
+    import pandas as pd
+
+    estimator = new_estimator(alpha=alpha, seed=seed)
+    rng = np.random.default_rng(seed)
+    rows = 0
+    for _ in range(epochs):
+        rows = 0
+        for _ids, features, labels in iter_batches(batch_size, chunk_size, folds, fold):
+            order = rng.permutation(len(labels))
+            # DataFrame input records feature_names_in_, matching how inference calls the model
+            frame = pd.DataFrame(features[order], columns=FEATURE_COLUMNS)
+            estimator.partial_fit(frame, labels[order], classes=[0, 1])
+            rows += len(labels)
+    if not rows:
+        raise ValueError("No won/lost leads to train on")
+    return estimator, rows
+
+
+def evaluate(estimator, batch_size=10000, chunk_size=2000, folds=None, fold=None):
+    """Streaming log loss, accuracy and binned ROC AUC of `estimator` on held-out rows"""
+    import numpy as np
+    import pandas as pd
+
+    histogram = np.zeros((2, AUC_BINS), dtype=np.int64)
+    log_loss = 0.0
+    correct = rows = 0
+    for _ids, features, labels in iter_batches(batch_size, chunk_size, folds, fold, holdout=True):
+        frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        probability = np.clip(estimator.predict_proba(frame)[:, 1], 1e-15, 1 - 1e-15)
+        log_loss -= float(np.sum(labels * np.log(probability) + (1 - labels) * np.log(1 - probability)))
+        correct += int(np.sum((probability >= 0.5) == labels))
+        rows += len(labels)
+        bins = np.minimum((probability * AUC_BINS).astype(np.int64), AUC_BINS - 1)
+        np.add.at(histogram, (labels, bins), 1)
+
+    if not rows:
+        return {'rows': 0, 'log_loss': math.nan, 'accuracy': math.nan, 'auc': math.nan}
+    return {
+        'rows': rows,
+        'log_loss': log_loss / rows,
+        'accuracy': correct / rows,
+        'auc': binned_auc(histogram),
+    }
+
+
+def binned_auc(histogram):
+    """ROC AUC from per-class probability histograms (ties within a bin count half)"""
+    negatives, positives = histogram[0], histogram[1]
+    if not negatives.sum() or not positives.sum():
+        return math.nan
+    negatives_below = negatives.cumsum() - negatives
+    wins = (positives * negatives_below).sum() + 0.5 * (positives * negatives).sum()
+    return float(wins / (positives.sum() * negatives.sum()))
+
+
+def cross_validate_fold(fold, folds, options):
+    """Train without `fold` and score it; runs in a worker process"""
+    estimator, rows = fit(folds=folds, fold=fold, **options)
+    metrics = evaluate(estimator, options['batch_size'], options['chunk_size'], folds, fold)
+    return dict(metrics, fold=fold, train_rows=rows)
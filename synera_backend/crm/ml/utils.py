@@ -1,35 +1,92 @@
-import joblib
-import pandas as pd
 from pathlib import Path
+from django.conf import settings
+
+from .registry import ModelRegistry
 
 # Path to trained ML model
-model_path = Path(__file__).resolve().parent / "ml" / "lead_scoring_model.pkl"
+model_path = Path(getattr(
+    settings, "LEAD_MODEL_PATH", Path(__file__).resolve().parent / "lead_scoring_model.pkl"
+))
+
+# Feature columns in the order the model expects them
+FEATURE_COLUMNS = [
+    "sentiment_score",
+    "status_Contacted",
+    "status_Qualified",
+    "status_Lost",
+    "status_Won",
+    "status_New",
+]
+
+# Loads the model on first use and hot-swaps it when the artifact changes
+registry = ModelRegistry(model_path, features=FEATURE_COLUMNS)
+
+# Lead status -> column index of its one-hot flag in FEATURE_COLUMNS
+STATUS_FEATURE_INDEX = {
+    "contacted": 1,
+    "qualified": 2,
+    "lost": 3,
+    "won": 4,
+    "new": 5,
+}
+
+# Rule-based scores used when the ML model is unavailable
+STATUS_BASE_SCORES = {
+    'new': 10,
+    'contacted': 40,
+    'qualified': 70,
+    'lost': 0,
+    'won': 100
+}
+
+
+def current_model():
+    """
+    Snapshot of the scoring model (model, version, lookup table). Pass it to
+    calculate_lead_score(s) when a score and its version must match.
+    """
+    return registry.get()
+
+
+def current_model_version():
+    """Version of the scoring model currently answering calculate_lead_score"""
+    return registry.get().version
+
 
-try:
-    model = joblib.load(model_path)
-except Exception as e:
-    model = None
-    print(f"ML model not loaded: {e}")
+def rule_based_score(status, sentiment_score):
+    """Fallback score from lead status plus sentiment, clamped to 0..100"""
+    score = STATUS_BASE_SCORES.get(status, 0)
+    score += int(sentiment_score * 50)  # scale -1..1 to -50..50
+    return max(0, min(100, score))
 
 
-def calculate_lead_score(lead):
+def calculate_lead_score(lead, loaded=None):
     """
     Takes a Lead object and returns predicted probability (%) of conversion
     using available Lead fields.
     """
+    loaded = loaded or registry.get()
+    model = loaded.model
 
     # If ML model is not available, fallback to simple rule-based scoring
     if model is None:
-        status_map = {
-            'new': 10,
-            'contacted': 40,
-            'qualified': 70,
-            'lost': 0,
-            'won': 100
-        }
-        score = status_map.get(lead.status, 0)
-        score += int(lead.sentiment_score * 50)  # scale -1..1 to -50..50
-        return max(0, min(100, score))
+        return rule_based_score(lead.status, lead.sentiment_score)
+
+    if loaded.score_table is not None:
+        score = loaded.score_table.score(lead.status, lead.sentiment_score)
+        if score is not None:
+            return score
+
+    if getattr(model, "numpy_only", False):
+        # Compiled .npz model: plain NumPy features, no pandas/sklearn
+        features = build_feature_matrix([lead])
+        try:
+            return round(float(model.predict_proba(features)[0][1]) * 100, 2)
+        except Exception as e:
+            print(f"ML scoring failed, fallback: {e}")
+            return rule_based_score(lead.status, lead.sentiment_score)
+
+    import pandas as pd
 
     # Prepare features for ML model
     features = pd.DataFrame([{
@@ -46,13 +103,58 @@ def calculate_lead_score(lead):
         return round(probability * 100, 2)
     except Exception as e:
         print(f"ML scoring failed, fallback: {e}")
-        status_map = {
-            'new': 10,
-            'contacted': 40,
-            'qualified': 70,
-            'lost': 0,
-            'won': 100
-        }
-        score = status_map.get(lead.status, 0)
-        score += int(lead.sentiment_score * 50)
-        return max(0, min(100, score))
+        return rule_based_score(lead.status, lead.sentiment_score)
+
+
+def build_feature_matrix(leads):
+    """
+    Encode a sequence of leads into an (n, 6) float array whose columns
+    follow FEATURE_COLUMNS.
+    """
+    import numpy as np
+
+    n = len(leads)
+    sentiments = np.fromiter((lead.sentiment_score for lead in leads), dtype=np.float64, count=n)
+    status_index = np.fromiter(
+        (STATUS_FEATURE_INDEX.get(lead.status, -1) for lead in leads), dtype=np.int64, count=n
+    )
+
+    features = np.zeros((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+    features[:, 0] = sentiments
+    known = status_index >= 0
+    features[np.flatnonzero(known), status_index[known]] = 1.0
+    return features
+
+
+def calculate_lead_scores(leads, loaded=None):
+    """
+    Batch version of calculate_lead_score: takes an iterable of Lead objects
+    and returns their scores as a list in input order, using a single
+    predict_proba call for the whole batch.
+    """
+    leads = list(leads)
+    if not leads:
+        return []
+
+    loaded = loaded or registry.get()
+    model = loaded.model
+    if model is None:
+        return [rule_based_score(lead.status, lead.sentiment_score) for lead in leads]
+
+    if loaded.score_table is not None:
+        scores = [loaded.score_table.score(lead.status, lead.sentiment_score) for lead in leads]
+        if None not in scores:
+            return scores
+
+    features = build_feature_matrix(leads)
+    if hasattr(model, "feature_names_in_"):
+        import pandas as pd
+        # Model was fitted on a DataFrame; keep sklearn's feature-name check intact
+        features = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+
+    try:
+        probabilities = model.predict_proba(features)[:, 1]
+        return [round(probability * 100, 2) for probability in probabilities.tolist()]
+    except Exception as e:
+        print(f"ML batch scoring failed, fallback: {e}")
+        return [rule_based_score(lead.status, lead.sentiment_score) for lead in leads]
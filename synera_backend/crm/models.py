@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
-from textblob import TextBlob  # pip install textblob
-from .ml.utils import calculate_lead_score  # ML scoring function
+from django.utils import timezone
+from .caching import invalidate_lead_owners
+from .ml.utils import calculate_lead_score, calculate_lead_scores, current_model  # ML scoring
+from .sentiment import content_hash, polarities, polarity, sentiment_label
 
 User = get_user_model()
 
@@ -18,10 +21,18 @@ class Customer(models.Model):
     company = models.CharField(max_length=255, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ('owner', 'email')  # Each user can have same emails independently
+        indexes = [
+            # CustomerViewSet: owner filter + cursor order, read backwards. Kept ascending so
+            # lead joins that walk it visit customers (and their leads) in insertion order.
+            models.Index(fields=['owner', 'created_at'], name='crm_cust_owner_created_idx'),
+            # /api/sync/ change scans
+            models.Index(fields=['owner', 'updated_at'], name='crm_cust_owner_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -45,6 +56,22 @@ class Lead(models.Model):
         (STATUS_WON, 'Won'),
     ]
 
+    ENRICHMENT_COMPLETE = 'complete'
+    ENRICHMENT_PENDING = 'pending'
+    ENRICHMENT_FAILED = 'failed'
+
+    ENRICHMENT_CHOICES = [
+        (ENRICHMENT_COMPLETE, 'Complete'),
+        (ENRICHMENT_PENDING, 'Pending'),
+        (ENRICHMENT_FAILED, 'Failed'),
+    ]
+
+    # Fields written by sentiment analysis and scoring
+    ENRICHMENT_FIELDS = [
+        'sentiment', 'sentiment_score', 'description_hash',
+        'score', 'score_model_version', 'enrichment_status', 'updated_at',
+    ]
+
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='leads')
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -52,8 +79,13 @@ class Lead(models.Model):
 
     # Scoring & Sentiment
     score = models.FloatField(default=0)
+    score_model_version = models.CharField(max_length=64, blank=True, default='')
     sentiment = models.CharField(max_length=20, blank=True, null=True)
     sentiment_score = models.FloatField(default=0.0)
+    description_hash = models.CharField(max_length=40, blank=True, default='')
+    enrichment_status = models.CharField(
+        max_length=10, choices=ENRICHMENT_CHOICES, default=ENRICHMENT_COMPLETE
+    )
 
     # Tracking
     created_at = models.DateTimeField(auto_now_add=True)
@@ -68,36 +100,167 @@ class Lead(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # LeadViewSet cursor order (-created_at, id)
+            models.Index(fields=['-created_at', 'id'], name='crm_lead_created_idx'),
+            # /api/sync/ change scans
+            models.Index(fields=['updated_at'], name='crm_lead_updated_idx'),
+            # high_priority_leads; the condition must match that view's filter exactly
+            models.Index(
+                fields=['customer', '-score'],
+                name='crm_lead_open_hot_idx',
+                condition=models.Q(score__gte=80) & ~models.Q(status__in=['won', 'lost']),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.customer.name}"
 
     def analyze_sentiment(self):
-        """Analyze sentiment using TextBlob"""
+        """Analyze sentiment with the configured SENTIMENT_BACKEND (crm.sentiment)"""
+        self.description_hash = content_hash(self.description)
         if self.description:
-            blob = TextBlob(self.description)
-            polarity = blob.sentiment.polarity
-            self.sentiment_score = polarity
-            if polarity > 0.1:
-                self.sentiment = 'Positive'
-            elif polarity < -0.1:
-                self.sentiment = 'Negative'
-            else:
-                self.sentiment = 'Neutral'
+            self.set_sentiment(polarity(self.description, self.description_hash))
         else:
+            self.set_sentiment(None)
+
+    def set_sentiment(self, value):
+        """Store a -1..1 polarity and its label (None means no description)"""
+        if value is None:
             self.sentiment = 'N/A'
             self.sentiment_score = 0.0
+        else:
+            self.sentiment_score = value
+            self.sentiment = sentiment_label(value)
+
+    def sentiment_is_stale(self):
+        """True if the description changed since sentiment was last analyzed"""
+        return self.sentiment is None or content_hash(self.description) != self.description_hash
 
     def save(self, *args, **kwargs):
-        """Analyze sentiment and calculate lead score before saving"""
-        self.analyze_sentiment()
+        """Analyze sentiment (if the description changed) and calculate lead score before saving"""
+        if getattr(settings, 'LEAD_ENRICHMENT_MODE', 'sync') == 'async':
+            # Save now; run_enrichment_worker fills in sentiment and score
+            self.enrichment_status = self.ENRICHMENT_PENDING
+            super().save(*args, **kwargs)
+            EnrichmentJob.enqueue(self)
+            return
+
+        self.enrichment_status = self.ENRICHMENT_COMPLETE
+        if self.sentiment_is_stale():
+            self.analyze_sentiment()
         try:
-            self.score = calculate_lead_score(self)
+            loaded = current_model()
+            self.score = calculate_lead_score(self, loaded)
+            self.score_model_version = loaded.version
         except Exception as e:
             self.score = 0
+            self.score_model_version = ''
             print(f"Lead scoring error: {e}")
         super().save(*args, **kwargs)
 
+    @classmethod
+    def refresh_stale_scores(cls, leads):
+        """
+        Re-score, in one batch, the leads whose stored score came from a
+        different model version and write them back with bulk_update.
+        Returns the number of leads re-scored.
+        """
+        loaded = current_model()
+        stale = [
+            lead for lead in leads
+            if lead.pk and lead.score_model_version != loaded.version
+            and lead.enrichment_status != cls.ENRICHMENT_PENDING
+        ]
+        if not stale:
+            return 0
+
+        now = timezone.now()
+        for lead, score in zip(stale, calculate_lead_scores(stale, loaded)):
+            lead.score = score
+            lead.score_model_version = loaded.version
+            lead.updated_at = now  # bulk_update skips auto_now; /api/sync/ and list ETags rely on it
+        cls.objects.bulk_update(stale, ['score', 'score_model_version', 'updated_at'], batch_size=500)
+        invalidate_lead_owners(stale)  # bulk_update sends no post_save
+        return len(stale)
+
+    @classmethod
+    def enrich(cls, leads):
+        """
+        Analyze sentiment (only where the description changed) and score
+        `leads` in batch, without saving. Write back ENRICHMENT_FIELDS.
+        """
+        stale = [lead for lead in leads if lead.sentiment_is_stale()]
+        values = polarities([lead.description for lead in stale])
+        for lead, value in zip(stale, values):
+            lead.description_hash = content_hash(lead.description)
+            lead.set_sentiment(value if lead.description else None)
+
+        loaded = current_model()
+        for lead, score in zip(leads, calculate_lead_scores(leads, loaded)):
+            lead.score = score
+            lead.score_model_version = loaded.version
+            lead.enrichment_status = cls.ENRICHMENT_COMPLETE
+            lead.updated_at = timezone.now()  # bulk_update skips auto_now; list ETags rely on it
+
+
+# -----------------------------
+# Enrichment job (async mode)
+# -----------------------------
+class EnrichmentJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    lead = models.OneToOneField(Lead, on_delete=models.CASCADE, related_name='enrichment_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['available_at']
+        indexes = [models.Index(fields=['status', 'available_at'], name='crm_enrich_status_avail_idx')]
+
+    def __str__(self):
+        return f"Enrichment of lead {self.lead_id} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, lead):
+        """(Re)queue `lead` for enrichment, resetting any previous attempt"""
+        cls.objects.update_or_create(
+            lead=lead,
+            defaults={
+                'status': cls.STATUS_PENDING,
+                'attempts': 0,
+                'last_error': '',
+                'available_at': timezone.now(),
+                'claimed_at': None,
+            },
+        )
+
+    @classmethod
+    def enqueue_many(cls, leads):
+        """enqueue() for a batch of saved leads, in one upsert"""
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(lead=lead, available_at=now) for lead in leads],
+            update_conflicts=True,
+            unique_fields=['lead'],
+            update_fields=['status', 'attempts', 'last_error', 'available_at', 'claimed_at', 'updated_at'],
+        )
+
 
 # -----------------------------
 # Profile (extended user)
@@ -128,6 +291,9 @@ class Profile(models.Model):
     gmail_client_id = models.TextField(blank=True, null=True)
     gmail_client_secret = models.TextField(blank=True, null=True)
     gmail_scopes = models.JSONField(blank=True, null=True)
+    # Gmail sync cursor (users.history startHistoryId); empty until the first sync
+    gmail_history_id = models.CharField(max_length=32, blank=True, null=True)
+    gmail_synced_at = models.DateTimeField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -151,8 +317,72 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='crm_product_created_idx'),
+            models.Index(fields=['updated_at'], name='crm_product_updated_idx'),
+        ]
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
 
     def __str__(self):
         return f"{self.name} (${self.price})"
+
+
+# -----------------------------
+# Tombstone (deleted rows, for /api/sync/)
+# -----------------------------
+class Tombstone(models.Model):
+    KIND_LEAD = 'lead'
+    KIND_CUSTOMER = 'customer'
+    KIND_PRODUCT = 'product'
+
+    KIND_CHOICES = [
+        (KIND_LEAD, 'Lead'),
+        (KIND_CUSTOMER, 'Customer'),
+        (KIND_PRODUCT, 'Product'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Owner of the deleted lead/customer; products are shared, so None. No FK
+    # constraint: deleting a user writes tombstones for its cascaded rows.
+    owner = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'kind', 'deleted_at'], name='crm_tombstone_owner_idx')]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.object_id}"
+
+
+# -----------------------------
+# Email message (synced from Gmail)
+# -----------------------------
+class EmailMessage(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='email_messages')
+    gmail_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64)
+    sender = models.CharField(max_length=255, blank=True, default='')
+    subject = models.TextField(blank=True, default='')
+    snippet = models.TextField(blank=True, default='')
+    body = models.TextField(blank=True, default='')
+    label_ids = models.JSONField(default=list, blank=True)
+    internal_date = models.DateTimeField()
+    history_id = models.CharField(max_length=32, blank=True, default='')
+    synced_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-internal_date']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'gmail_id'], name='crm_email_owner_gmail_uniq'),
+        ]
+        indexes = [
+            # Conversations list: newest messages of one user
+            models.Index(fields=['owner', '-internal_date'], name='crm_email_owner_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject or '(no subject)'} from {self.sender}"
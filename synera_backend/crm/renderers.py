@@ -0,0 +1,44 @@
+"""
+JSON renderer for the CRM viewsets.
+
+Renders with DRF's JSONRenderer unless CRM_JSON_ENCODER = "orjson" and
+orjson is installed, in which case compact, non-indented responses are
+encoded by orjson, several times faster on large list pages. orjson output
+matches the stdlib encoder's for everything the CRM serializers emit
+(strings, ints, floats in ordinary ranges, None, lists, dicts); it is
+opt-in because it differs on edge cases: exponents are written 1e16
+rather than 1e+16, and NaN becomes null instead of an error. Anything
+orjson cannot encode falls back to the regular renderer.
+"""
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None
+            and getattr(settings, 'CRM_JSON_ENCODER', 'json') == 'orjson'
+            and self.compact and not self.ensure_ascii
+            and not self.get_indent(accepted_media_type, renderer_context)
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.use_orjson(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Datetimes and the like go through DRF's encoder, as with json.dumps
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same as JSONRenderer: keep the output valid JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
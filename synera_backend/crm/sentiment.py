@@ -0,0 +1,264 @@
+"""
+Sentiment analysis for lead descriptions.
+
+The backend is selected with SENTIMENT_BACKEND: "textblob" (default),
+"lexicon" (fast single-pass scorer over TextBlob's lexicon), or a dotted
+path to a SentimentBackend subclass. Polarity is cached process-wide in an
+LRU keyed by backend and the SHA-1 of the text, so repeated descriptions
+(templates, re-imports, copy-pasted notes) are analysed once per worker.
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import threading
+from collections import OrderedDict
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+def content_hash(text):
+    """SHA-1 hex digest of `text`, or '' for empty text"""
+    if not text:
+        return ''
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def sentiment_label(polarity):
+    """Map a -1..1 polarity onto the Positive/Neutral/Negative labels"""
+    if polarity > 0.1:
+        return 'Positive'
+    elif polarity < -0.1:
+        return 'Negative'
+    return 'Neutral'
+
+
+class PolarityCache:
+    """Thread-safe LRU of (backend name, content hash) -> polarity"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+polarity_cache = PolarityCache(getattr(settings, 'SENTIMENT_CACHE_SIZE', 4096))
+
+
+def textblob_polarity(text):
+    from textblob import TextBlob  # pip install textblob; imported on first use (slow: pulls in nltk)
+    return TextBlob(text).sentiment.polarity
+
+
+class SentimentBackend:
+    """Maps text to a polarity in -1..1"""
+    name = None
+
+    def polarity(self, text):
+        raise NotImplementedError
+
+    def polarities(self, texts):
+        return [self.polarity(text) for text in texts]
+
+
+class TextBlobBackend(SentimentBackend):
+    name = 'textblob'
+
+    def polarity(self, text):
+        return textblob_polarity(text)
+
+
+class LexiconBackend(SentimentBackend):
+    """
+    Port of TextBlob's pattern analyzer that scores text in one regex
+    tokenizing pass over a precompiled dict. Known words are averaged;
+    adverbs ("very") multiply the next word, negations ("not", "never")
+    flip and halve it, and "!" boosts the previous word. Contractions are
+    split like TextBlob's tokenizer ("isn't" -> "is n ' t"), so "n't" is
+    not treated as a negation either.
+    Emoticons and the "(!)" irony mark are not handled.
+    """
+    name = 'lexicon'
+    NEGATIONS = frozenset(('no', 'not', 'never'))
+    TOKEN_RE = re.compile(r"[a-z0-9]+(?=n'[a-z])|[a-z0-9]+(?:-[a-z0-9]+)*|!")
+
+    def __init__(self, path=None):
+        path = path or getattr(settings, 'SENTIMENT_LEXICON_PATH', None) or _textblob_lexicon_path()
+        if not path or not os.path.exists(path):
+            raise ImproperlyConfigured(
+                "LexiconBackend needs SENTIMENT_LEXICON_PATH or an installed textblob package"
+            )
+        self.lexicon = self.load_lexicon(path)
+
+    @staticmethod
+    def load_lexicon(path):
+        """word -> (polarity, intensity, is_modifier), averaged like TextBlob"""
+        senses = {}
+        for word in ElementTree.parse(path).getroot().iter('word'):
+            form = word.get('form')
+            if form:
+                senses.setdefault(form, {}).setdefault(word.get('pos'), []).append(
+                    (float(word.get('polarity', 0.0)), float(word.get('intensity', 1.0)))
+                )
+
+        lexicon = {}
+        adjectives = []
+        for form, by_pos in senses.items():
+            per_pos = {
+                pos: (sum(p for p, _ in values) / len(values), sum(i for _, i in values) / len(values))
+                for pos, values in by_pos.items()
+            }
+            lexicon[form] = (
+                sum(p for p, _ in per_pos.values()) / len(per_pos),
+                sum(i for _, i in per_pos.values()) / len(per_pos),
+                'RB' in per_pos,
+            )
+            if 'JJ' in per_pos:
+                adjectives.append((form, per_pos['JJ']))
+
+        # Like TextBlob, score adverbs as their adjective ("terrible" -> "terribly")
+        for form, (p, intensity) in adjectives:
+            if form.endswith('y'):
+                form = form[:-1] + 'i'
+            if form.endswith('le'):
+                form = form[:-2]
+            lexicon[form + 'ly'] = (p, intensity, True)
+        return lexicon
+
+    def polarity(self, text):
+        lexicon = self.lexicon
+        negations = self.NEGATIONS
+        found = []         # [polarity, intensity, negated] per assessed word
+        modifier = None    # preceding adverb ("very good")
+        negation = None    # preceding negation ("not good")
+
+        for word in self.TOKEN_RE.findall(text.lower()):
+            entry = lexicon.get(word)
+            if entry is not None:
+                p, intensity, is_modifier = entry
+                if modifier is None:
+                    found.append([p, intensity, False])
+                else:
+                    last = found[-1]
+                    last[0] = max(-1.0, min(p * last[1], 1.0))
+                    last[1] = intensity
+                if negation is not None:
+                    found[-1][1] = 1.0 / found[-1][1]
+                    found[-1][2] = True
+                modifier = word if is_modifier else None
+                negation = word if word in negations else None
+            else:
+                if word in negations:
+                    negation = word
+                elif negation and len(word) > 1:
+                    negation = None
+                if negation is not None and modifier is not None and modifier.endswith('ly'):
+                    found[-1][2] = True
+                    negation = None
+                elif modifier and len(word) > 2:
+                    modifier = None
+                if word == '!' and found:
+                    found[-1][0] = max(-1.0, min(found[-1][0] * 1.25, 1.0))
+
+        if not found:
+            return 0.0
+        return sum(p * -0.5 if negated else p for p, _, negated in found) / len(found)
+
+
+BACKENDS = {
+    'textblob': TextBlobBackend,
+    'lexicon': LexiconBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """The configured (or named) backend, instantiated once per process"""
+    name = name or getattr(settings, 'SENTIMENT_BACKEND', 'textblob')
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend_class = BACKENDS.get(name) or import_string(name)
+                backend = _backends[name] = backend_class()
+    return backend
+
+
+def _textblob_lexicon_path():
+    spec = importlib.util.find_spec('textblob')
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(spec.submodule_search_locations[0], 'en', 'en-sentiment.xml')
+
+
+def polarity(text, digest=None):
+    """Polarity of `text` in -1..1, served from the LRU cache when possible"""
+    if not text:
+        return 0.0
+    backend = get_backend()
+    key = (backend.name, digest or content_hash(text))
+    cached = polarity_cache.get(key)
+    if cached is not None:
+        return cached
+    value = backend.polarity(text)
+    polarity_cache.put(key, value)
+    return value
+
+
+def polarities(texts):
+    """Batch version of polarity(): one value per text, in input order"""
+    backend = get_backend()
+    keys = [(backend.name, content_hash(text)) if text else None for text in texts]
+    values = [polarity_cache.get(key) if key else 0.0 for key in keys]
+
+    missing = {}
+    for i, value in enumerate(values):
+        if value is None:
+            missing.setdefault(keys[i], texts[i])
+    if missing:
+        computed = dict(zip(missing, backend.polarities(list(missing.values()))))
+        for key, value in computed.items():
+            polarity_cache.put(key, value)
+        values = [computed[key] if value is None else value for key, value in zip(keys, values)]
+    return values
+
+
+def init_worker():
+    """
+    ProcessPoolExecutor initializer for processes running polarities().
+    Lives here because this module imports no models, so a spawned worker
+    can unpickle it before Django is set up.
+    """
+    import django
+    django.setup()
@@ -1,54 +1,109 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import models
 from dj_rest_auth.registration.serializers import RegisterSerializer
 from .models import Customer, Lead, Profile, Product
-from .ml.utils import calculate_lead_score
 
 User = get_user_model()
 
 
+class SparseFieldsMixin:
+    """Serializer option `fields`: keep only the named fields (None keeps all)"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 # -----------------------------
 # Customer Serializer
 # -----------------------------
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = [
             'id', 'name', 'email', 'phone',
-            'company', 'created_at', 'address', 'notes'
+            'company', 'created_at', 'updated_at', 'address', 'notes'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
 
 
 # -----------------------------
 # Lead Serializer
 # -----------------------------
-class LeadSerializer(serializers.ModelSerializer):
+class LeadListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        """Refresh stale stored scores for the whole page in one batch"""
+        leads = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        Lead.refresh_stale_scores(leads)
+        return super().to_representation(leads)
+
+
+class CustomerIdField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves ids from context['customers'] (id -> Customer) when given, so
+    bulk endpoints look every customer of a batch up with one query.
+    """
+
+    def to_internal_value(self, data):
+        customers = self.context.get('customers')
+        if customers is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            customer = customers.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if customer is None:
+            self.fail('does_not_exist', pk_value=data)
+        return customer
+
+
+class LeadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
-    customer_id = serializers.PrimaryKeyRelatedField(
+    customer_id = CustomerIdField(
         queryset=Customer.objects.all(),
         source='customer',
         write_only=True
     )
-    score = serializers.SerializerMethodField()
+    score = serializers.FloatField(read_only=True)
     sentiment = serializers.CharField(read_only=True)
     sentiment_score = serializers.FloatField(read_only=True)
+    enrichment_status = serializers.CharField(read_only=True)
     updated_by = serializers.CharField(source='updated_by.username', read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
-    def get_score(self, obj):
-        """Calculate lead score dynamically"""
-        return calculate_lead_score(obj)
+    def __init__(self, *args, expand=None, **kwargs):
+        """
+        `expand` maps expanded relations to their fields ({'customer': None}
+        for all). None keeps the embedded customer; otherwise an unexpanded
+        customer is rendered as its id.
+        """
+        super().__init__(*args, **kwargs)
+        if expand is not None and 'customer' in self.fields:
+            if 'customer' in expand:
+                self.fields['customer'] = CustomerSerializer(read_only=True, fields=expand['customer'])
+            else:
+                self.fields['customer'] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    def to_representation(self, instance):
+        if self.parent is None:
+            Lead.refresh_stale_scores([instance])
+        return super().to_representation(instance)
 
     def validate_customer_id(self, value):
         """Ensure the selected customer belongs to the current user"""
         request = self.context.get('request')
-        if request and value.owner != request.user:
+        if request and value.owner_id != request.user.pk:
             raise serializers.ValidationError("You cannot assign a lead to this customer.")
         return value
 
     class Meta:
         model = Lead
+        list_serializer_class = LeadListSerializer
         fields = [
             'id',
             'customer',
@@ -59,20 +114,21 @@ class LeadSerializer(serializers.ModelSerializer):
             'score',
             'sentiment',
             'sentiment_score',
+            'enrichment_status',
             'created_at',
             'updated_by',
             'updated_at'
         ]
         read_only_fields = [
             'id', 'customer', 'created_at', 'score',
-            'sentiment', 'sentiment_score', 'updated_by', 'updated_at'
+            'sentiment', 'sentiment_score', 'enrichment_status', 'updated_by', 'updated_at'
         ]
 
 
 # -----------------------------
 # Product Serializer
 # -----------------------------
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'stock', 'created_at', 'updated_at']
@@ -1,7 +1,11 @@
-from django.db.models.signals import post_save
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .caching import invalidate_owner
+from .models import Customer, Lead, Product, Profile, Tombstone
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -11,3 +15,69 @@ def create_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+# {customer_id: owner_id} of customers being deleted in a batch (see known_customer_owners)
+_owners = threading.local()
+
+@contextmanager
+def known_customer_owners(owners):
+    """Let lead_owner_id() look up the customers in `owners` ({customer_id: owner_id}) inside the block"""
+    _owners.map = owners
+    try:
+        yield
+    finally:
+        _owners.map = None
+
+def lead_owner_id(lead, origin=None):
+    if Lead.customer.is_cached(lead):
+        return lead.customer.owner_id
+    if isinstance(origin, Customer) and origin.pk == lead.customer_id:
+        # Cascade from deleting the customer
+        return origin.owner_id
+    known = getattr(_owners, 'map', None)
+    if known and lead.customer_id in known:
+        # Cascade from deleting a batch of customers
+        return known[lead.customer_id]
+    # Don't load the whole customer just for its owner
+    return Customer.objects.filter(pk=lead.customer_id).values_list('owner_id', flat=True).first()
+
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_customer_owner(sender, instance, **kwargs):
+    invalidate_owner(instance.owner_id)
+
+@receiver([post_save, post_delete], sender=Lead)
+def invalidate_lead_owner(sender, instance, origin=None, **kwargs):
+    invalidate_owner(lead_owner_id(instance, origin))
+
+# Tombstones let /api/sync/ report deletions
+_batch = threading.local()
+
+@contextmanager
+def batched_tombstones():
+    """Write the tombstones of deletes made inside the block with one bulk_create"""
+    _batch.tombstones = []
+    try:
+        yield
+        Tombstone.objects.bulk_create(_batch.tombstones)
+    finally:
+        _batch.tombstones = None
+
+def record_tombstone(**fields):
+    tombstone = Tombstone(**fields)
+    pending = getattr(_batch, 'tombstones', None)
+    if pending is None:
+        tombstone.save()
+    else:
+        pending.append(tombstone)
+
+@receiver(post_delete, sender=Lead)
+def record_lead_tombstone(sender, instance, origin=None, **kwargs):
+    record_tombstone(kind=Tombstone.KIND_LEAD, object_id=instance.pk, owner_id=lead_owner_id(instance, origin))
+
+@receiver(post_delete, sender=Customer)
+def record_customer_tombstone(sender, instance, **kwargs):
+    record_tombstone(kind=Tombstone.KIND_CUSTOMER, object_id=instance.pk, owner_id=instance.owner_id)
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    record_tombstone(kind=Tombstone.KIND_PRODUCT, object_id=instance.pk)
@@ -1,3 +1,1379 @@
-from django.test import TestCase
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import joblib
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .ml import utils as ml_utils
+from .ml.compiled import CompiledModel, compile_estimator
+from .ml.lookup import LeadScoreTable, build_score_table
+from .ml.registry import RULES_VERSION, LoadedModel, ModelRegistry
+from .ml.synthetic import fit_synthetic_model, make_leads
+from .ml.training import binned_auc
+from .enrichment import claim_jobs, process_jobs
+from .models import Customer, EmailMessage, EnrichmentJob, Lead, Product, Profile, Tombstone
+from .sentiment import LexiconBackend, get_backend, polarity, polarity_cache, textblob_polarity
+
+User = get_user_model()
+
+
+class BatchLeadScoringTests(TestCase):
+    def test_batch_matches_per_lead_scores_with_model(self):
+        leads = make_leads(200, seed=1)
+        with ml_utils.registry.use(fit_synthetic_model('logistic')):
+            expected = [ml_utils.calculate_lead_score(lead) for lead in leads]
+            self.assertEqual(ml_utils.calculate_lead_scores(iter(leads)), expected)
+
+    def test_batch_uses_rule_based_fallback_without_model(self):
+        leads = make_leads(50, seed=2)
+        with ml_utils.registry.use(None):
+            expected = [ml_utils.rule_based_score(lead.status, lead.sentiment_score) for lead in leads]
+            self.assertEqual(ml_utils.calculate_lead_scores(leads), expected)
+
+    def test_empty_batch(self):
+        self.assertEqual(ml_utils.calculate_lead_scores([]), [])
+
+
+class LeadScoreTableTests(TestCase):
+    def test_table_matches_model_within_bound(self):
+        for kind in ('logistic', 'forest'):
+            with self.subTest(kind=kind):
+                table = LeadScoreTable.from_model(fit_synthetic_model(kind), resolution=2001)
+                self.assertLess(table.max_error(), 0.5)
+
+    def test_calculate_lead_score_uses_table(self):
+        model = fit_synthetic_model('logistic')
+        leads = make_leads(100, seed=3)
+        expected = ml_utils.calculate_lead_scores(leads, LoadedModel(model, 'test'))
+        loaded = LoadedModel(model, 'test', build_score_table(model))
+        with mock.patch.object(model, 'predict_proba', side_effect=AssertionError):
+            scores = [ml_utils.calculate_lead_score(lead, loaded) for lead in leads]
+        for score, exact in zip(scores, expected):
+            self.assertAlmostEqual(score, exact, delta=0.5)
+
+    def test_out_of_range_sentiment_is_not_tabulated(self):
+        table = LeadScoreTable.from_model(fit_synthetic_model('logistic'), resolution=11)
+        self.assertIsNone(table.score('new', 1.5))
+
+
+class StoredLeadScoreTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        for i in range(5):
+            Lead.objects.create(customer=self.customer, title=f'Lead {i}', status='contacted')
+        self.client.force_authenticate(self.user)
+
+    def test_list_serves_stored_score_without_rescoring(self):
+        with mock.patch('crm.models.calculate_lead_scores') as batch:
+            response = self.client.get('/api/leads/')
+        self.assertEqual(response.status_code, 200)
+        batch.assert_not_called()
+        self.assertEqual({lead['score'] for lead in response.data['results']}, {40})
+
+    def test_stale_scores_are_refreshed_in_one_batch(self):
+        Lead.objects.update(score=0, score_model_version='old')
+        with mock.patch('crm.models.calculate_lead_scores', return_value=[55.0] * 5) as batch, \
+                mock.patch('crm.models.calculate_lead_score') as single:
+            response = self.client.get('/api/leads/')
+        batch.assert_called_once()
+        single.assert_not_called()
+        self.assertEqual({lead['score'] for lead in response.data['results']}, {55.0})
+        self.assertFalse(Lead.objects.exclude(score_model_version=ml_utils.current_model_version()).exists())
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / 'model.pkl'
+
+    def test_missing_artifact_serves_rules(self):
+        registry = ModelRegistry(self.path, check_interval=0)
+        self.assertIsNone(registry.get().model)
+        self.assertEqual(registry.get().version, RULES_VERSION)
+
+    def test_changed_artifact_is_swapped_in_with_new_version(self):
+        registry = ModelRegistry(self.path, check_interval=0)
+        joblib.dump(fit_synthetic_model('logistic', seed=1), self.path)
+        first = registry.get()
+        self.assertIsNotNone(first.model)
+        self.assertIs(registry.get(), first)
+
+        joblib.dump(fit_synthetic_model('logistic', seed=2), self.path)
+        second = registry.get()
+        self.assertNotEqual(second.version, first.version)
+
+    def test_artifact_with_other_features_is_rejected(self):
+        registry = ModelRegistry(self.path, check_interval=0, features=ml_utils.FEATURE_COLUMNS)
+        joblib.dump(fit_synthetic_model('logistic', seed=1), self.path)
+        self.assertIsNotNone(registry.get().model)
+
+        estimator = fit_synthetic_model('logistic', seed=1)
+        estimator.feature_names_in_ = estimator.feature_names_in_[::-1].copy()
+        joblib.dump(estimator, self.path)
+        with mock.patch('builtins.print') as log:
+            registry.reload()
+        self.assertIn('was trained on features', log.call_args[0][0])
+
+        other = ModelRegistry(self.path, check_interval=0, features=ml_utils.FEATURE_COLUMNS)
+        with mock.patch('builtins.print'):
+            self.assertEqual(other.get().version, RULES_VERSION)
+
+    def test_default_artifact_path_is_next_to_the_ml_package(self):
+        self.assertEqual(ml_utils.model_path, Path(ml_utils.__file__).resolve().parent / 'lead_scoring_model.pkl')
+
+    def test_rescore_leads_command_updates_stale_leads(self):
+        user = User.objects.create_user('agent', password='pw')
+        customer = Customer.objects.create(owner=user, name='Acme', email='a@acme.test')
+        for i in range(7):
+            Lead.objects.create(customer=customer, title=f'Lead {i}', status='qualified')
+        Lead.objects.update(score=0, score_model_version='old')
+
+        out = StringIO()
+        call_command('rescore_leads', chunk_size=3, stdout=out)
+        self.assertIn('Re-scored 7 leads', out.getvalue())
+        self.assertEqual(set(Lead.objects.values_list('score', flat=True)), {70})
+
+
+class LeadListQueryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.other = User.objects.create_user('editor', password='pw')
+        self.client.force_authenticate(self.user)
+
+    def add_leads(self, n):
+        start = Lead.objects.count()
+        for i in range(start, start + n):
+            customer = Customer.objects.create(owner=self.user, name=f'Customer {i}', email=f'c{i}@acme.test')
+            Lead.objects.create(customer=customer, title=f'Lead {i}', status='new', updated_by=self.other)
+
+    def count_list_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_lead_list_query_count_is_constant(self):
+        self.add_leads(3)
+        small, _ = self.count_list_queries('/api/leads/?page_size=2')
+        self.add_leads(12)
+        large, data = self.count_list_queries('/api/leads/?page_size=15')
+        self.assertEqual(len(data['results']), 15)
+        self.assertEqual(data['results'][0]['updated_by'], 'editor')
+        self.assertEqual(small, large)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        self.add_leads(7)
+        seen = []
+        url = '/api/leads/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            seen += [lead['id'] for lead in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(Lead.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_customer_and_product_lists_are_paginated(self):
+        self.add_leads(3)
+        for url in ('/api/customers/?page_size=2', '/api/products/?page_size=2'):
+            _, data = self.count_list_queries(url)
+            self.assertIn('next', data)
+        _, data = self.count_list_queries('/api/customers/?page_size=2')
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+
+
+    def test_lists_filter_and_search_on_the_server(self):
+        self.add_leads(4)
+        Lead.objects.filter(title='Lead 2').update(status='won', sentiment='Positive')
+        _, data = self.count_list_queries('/api/leads/?status=won&sentiment=positive&fields=id,title')
+        self.assertEqual([lead['title'] for lead in data['results']], ['Lead 2'])
+        _, data = self.count_list_queries('/api/leads/?search=customer%203&fields=title')
+        self.assertEqual([lead['title'] for lead in data['results']], ['Lead 3'])
+        _, data = self.count_list_queries('/api/customers/?search=c1@&fields=id,name')
+        self.assertEqual([customer['name'] for customer in data['results']], ['Customer 1'])
+
+    def test_dashboard_summary_counts_without_listing(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.add_leads(3)
+        Lead.objects.filter(title='Lead 0').update(status='won', score=95)
+        queries, data = self.count_list_queries('/api/dashboard/')
+        self.assertEqual(data, {
+            'total_leads': 3, 'total_customers': 3, 'won_leads': 1, 'high_score_leads': 1,
+            'status_counts': {'new': 2, 'won': 1},
+        })
+        self.assertLessEqual(queries, 3)
+
+
+class HighPriorityCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user('agent', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+        customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.lead = Lead.objects.create(customer=customer, title='Hot', status='contacted')
+        Lead.objects.filter(pk=self.lead.pk).update(score=90)
+        other_customer = Customer.objects.create(owner=self.other, name='Other', email='o@acme.test')
+        self.other_lead = Lead.objects.create(customer=other_customer, title='Other', status='new')
+        self.client.force_authenticate(self.user)
+
+    def get_ids(self):
+        response = self.client.get('/api/high-priority-leads/')
+        self.assertEqual(response.status_code, 200)
+        return [lead['id'] for lead in response.data]
+
+    def test_warm_request_runs_no_queries(self):
+        self.assertEqual(self.get_ids(), [self.lead.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_ids(), [self.lead.pk])
+        self.assertEqual(len(queries), 0)
+
+    def test_only_the_affected_owner_is_invalidated(self):
+        from .caching import owner_version
+
+        self.get_ids()
+        mine = owner_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_lead.save()
+        self.assertEqual(owner_version(self.user.pk), mine)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.status = 'won'
+            self.lead.save()
+        self.assertNotEqual(owner_version(self.user.pk), mine)
+        self.assertEqual(self.get_ids(), [])
+
+    def test_customer_delete_invalidates(self):
+        self.get_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lead.customer.delete()
+        self.assertEqual(self.get_ids(), [])
+
+    def test_bulk_rescore_invalidates(self):
+        self.assertEqual(self.get_ids(), [self.lead.pk])
+        Lead.objects.filter(pk=self.lead.pk).update(score_model_version='old')
+        with self.captureOnCommitCallbacks(execute=True):
+            Lead.refresh_stale_scores(list(Lead.objects.filter(pk=self.lead.pk)))
+        # Rule-based rescore of a neutral 'contacted' lead drops it to 40
+        self.assertEqual(self.get_ids(), [])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.leads = [
+            Lead.objects.create(customer=self.customer, title=f'Lead {i}', status='new') for i in range(3)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get('/api/leads/')['ETag']
+        with mock.patch('crm.serializers.LeadSerializer.to_representation') as serialize:
+            response = self.revalidate('/api/leads/', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        serialize.assert_not_called()
+
+    def test_list_etag_changes_on_update_insert_delete_and_customer_edit(self):
+        changes = [
+            lambda: self.leads[0].save(),
+            lambda: Lead.objects.create(customer=self.customer, title='New lead'),
+            lambda: self.leads[1].delete(),
+            lambda: Customer.objects.filter(pk=self.customer.pk).update(
+                name='Acme Inc', updated_at=timezone.now()
+            ),
+        ]
+        for change in changes:
+            etag = self.client.get('/api/leads/')['ETag']
+            change()
+            self.assertEqual(self.revalidate('/api/leads/', etag).status_code, 200)
+
+    def test_pages_and_users_get_distinct_etags(self):
+        first = self.client.get('/api/leads/?page_size=2')
+        second = self.client.get(first.data['next'])
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.revalidate(first.data['next'], second['ETag']).status_code, 304)
+
+        other = User.objects.create_user('other', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.revalidate('/api/leads/?page_size=2', first['ETag']).status_code, 200)
+
+    def test_detail_revalidation(self):
+        url = f'/api/customers/{self.customer.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.client.patch(url, {'notes': 'Called back'}, format='json')
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class DeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.leads = [Lead.objects.create(customer=self.customer, title=f'Lead {i}') for i in range(3)]
+        self.product = Product.objects.create(name='Widget')
+        other = User.objects.create_user('other', password='pw')
+        self.other_customer = Customer.objects.create(owner=other, name='Other', email='o@acme.test')
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token=None):
+        response = self.client.get('/api/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data, name):
+        return sorted(row['id'] for row in data[name]['changed']), sorted(data[name]['deleted'])
+
+    def test_initial_sync_is_a_full_snapshot(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual(self.ids(data, 'leads'), (sorted(lead.pk for lead in self.leads), []))
+        self.assertEqual(self.ids(data, 'customers'), ([self.customer.pk], []))
+        self.assertEqual(self.ids(data, 'products'), ([self.product.pk], []))
+
+    def test_delta_returns_only_changes_since_token(self):
+        token = self.sync()['token']
+        self.leads[0].title = 'Renamed'
+        self.leads[0].save()
+        deleted_lead, deleted_product = self.leads[1].pk, self.product.pk
+        self.leads[1].delete()
+        new_customer = Customer.objects.create(owner=self.user, name='Beta', email='b@acme.test')
+        self.other_customer.save()
+        self.product.delete()
+
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual(self.ids(data, 'leads'), ([self.leads[0].pk], [deleted_lead]))
+        self.assertEqual(data['leads']['changed'][0]['title'], 'Renamed')
+        self.assertEqual(self.ids(data, 'customers'), ([new_customer.pk], []))
+        self.assertEqual(self.ids(data, 'products'), ([], [deleted_product]))
+
+        data = self.sync(data['token'])
+        self.assertEqual([self.ids(data, name) for name in ('leads', 'customers', 'products')], [([], [])] * 3)
+
+    def test_customer_cascade_and_user_delete_leave_tombstones(self):
+        token = self.sync()['token']
+        lead_ids, customer_id = sorted(lead.pk for lead in self.leads), self.customer.pk
+        with CaptureQueriesContext(connection) as queries:
+            self.customer.delete()
+        # The cascade gives each lead's owner from the deleted customer, not a query per lead
+        self.assertFalse([q for q in queries.captured_queries if 'owner_id' in q['sql'] and 'SELECT' in q['sql']])
+        data = self.sync(token)
+        self.assertEqual(self.ids(data, 'leads'), ([], lead_ids))
+        self.assertEqual(self.ids(data, 'customers'), ([], [customer_id]))
+
+        beta = Customer.objects.create(owner=self.user, name='Beta', email='b@acme.test')
+        Lead.objects.create(customer=beta, title='Beta lead')
+        user_id = self.user.pk
+        self.user.delete()  # tombstones outlive their owner without an FK violation
+        self.assertEqual(Tombstone.objects.filter(owner_id=user_id, object_id=beta.pk, kind='customer').count(), 1)
+
+    def test_rescored_leads_are_in_the_next_delta(self):
+        token = self.sync()['token']
+        Lead.objects.filter(pk=self.leads[0].pk).update(score=0, score_model_version='old')
+        call_command('rescore_leads', stdout=StringIO())
+        data = self.sync(token)
+        self.assertEqual(self.ids(data, 'leads'), ([self.leads[0].pk], []))
+        self.assertEqual(data['leads']['changed'][0]['score'], self.leads[0].score)
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'yesterday'}).status_code, 400)
+        expired = str(int((timezone.now().timestamp() - 31 * 86400) * 1_000_000))
+        self.assertTrue(self.sync(expired)['reset'])
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme, Inc.', email='a@acme.test')
+        self.leads = [
+            Lead.objects.create(customer=self.customer, title=f'Lead {i}', description='Line one\nline "two"')
+            for i in range(5)
+        ]
+        other = User.objects.create_user('other', password='pw')
+        Lead.objects.create(customer=Customer.objects.create(owner=other, name='Other', email='o@acme.test'))
+        self.client.force_authenticate(self.user)
+
+    def export(self, url, fmt):
+        response = self.client.get(url, {'fmt': fmt})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export_streams_own_leads(self):
+        import csv
+
+        rows = list(csv.DictReader(StringIO(self.export('/api/leads/export/', 'csv'))))
+        self.assertEqual([int(row['id']) for row in rows], [lead.pk for lead in self.leads])
+        self.assertEqual(rows[0]['customer_name'], 'Acme, Inc.')
+        self.assertEqual(rows[0]['description'], 'Line one\nline "two"')
+        self.assertEqual(rows[0]['created_at'], self.leads[0].created_at.isoformat())
+
+    def test_ndjson_export_of_customers(self):
+        import json
+
+        rows = [json.loads(line) for line in self.export('/api/customers/export/', 'ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.customer.pk])
+        self.assertEqual(rows[0]['name'], 'Acme, Inc.')
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get('/api/leads/export/', {'fmt': 'xml'}).status_code, 400)
+
+
+class BulkEndpointTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        other = User.objects.create_user('other', password='pw')
+        self.other_customer = Customer.objects.create(owner=other, name='Other', email='o@acme.test')
+        self.other_lead = Lead.objects.create(customer=self.other_customer, title='Not yours')
+        self.client.force_authenticate(self.user)
+
+    def add_leads(self, n):
+        return [Lead.objects.create(customer=self.customer, title=f'Lead {i}', status='new') for i in range(n)]
+
+    def bulk(self, method, url, items):
+        response = getattr(self.client, method)(url, items, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_patch_batch_uses_constant_queries_and_rescores_in_one_call(self):
+        counts = []
+        for n in (2, 20):
+            leads = self.add_leads(n)
+            items = [{'id': lead.pk, 'status': 'qualified'} for lead in leads]
+            with CaptureQueriesContext(connection) as queries, \
+                    mock.patch('crm.models.calculate_lead_scores', wraps=ml_utils.calculate_lead_scores) as batch:
+                results = self.bulk('patch', '/api/leads/bulk/', items)
+            batch.assert_called_once()
+            counts.append(len(queries))
+            self.assertEqual({result['status'] for result in results}, {200})
+            self.assertEqual({result['data']['score'] for result in results}, {70})
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Lead.objects.filter(status='qualified', updated_by=self.user).count(), 22)
+
+        # A title-only change keeps the stored score without re-scoring
+        with mock.patch('crm.models.calculate_lead_scores') as batch:
+            results = self.bulk('patch', '/api/leads/bulk/', [
+                {'id': leads[0].pk, 'title': 'Renamed'}, {'id': self.other_lead.pk, 'title': 'Mine now'},
+            ])
+        batch.assert_not_called()
+        self.assertEqual([result['status'] for result in results], [200, 404])
+        self.assertEqual(Lead.objects.get(pk=self.other_lead.pk).title, 'Not yours')
+
+    def test_create_checks_ownership_per_item(self):
+        results = self.bulk('post', '/api/leads/bulk/', [
+            {'customer_id': self.customer.pk, 'title': 'Good', 'description': 'Great product, very happy'},
+            {'customer_id': self.other_customer.pk, 'title': 'Sneaky'},
+            {'customer_id': self.customer.pk},
+        ])
+        self.assertEqual([result['status'] for result in results], [201, 400, 400])
+        self.assertIn('customer_id', results[1]['errors'])
+        self.assertIn('title', results[2]['errors'])
+        lead = Lead.objects.get(pk=results[0]['id'])
+        self.assertEqual((lead.sentiment, lead.updated_by), ('Positive', self.user))
+
+    def test_delete_reports_missing_ids_and_leaves_tombstones(self):
+        leads = self.add_leads(3)
+        results = self.bulk('delete', '/api/leads/bulk/', [leads[0].pk, leads[1].pk, self.other_lead.pk])
+        self.assertEqual([result['status'] for result in results], [204, 204, 404])
+        self.assertEqual(sorted(Tombstone.objects.filter(kind='lead').values_list('object_id', flat=True)),
+                         [leads[0].pk, leads[1].pk])
+        self.assertTrue(Lead.objects.filter(pk=self.other_lead.pk).exists())
+
+    def test_customer_delete_cascades_to_leads_with_constant_queries(self):
+        counts = []
+        for n in (2, 20):
+            customers = [Customer.objects.create(owner=self.user, name=f'C{n}-{i}', email=f'c{n}-{i}@beta.test')
+                         for i in range(n)]
+            leads = [Lead.objects.create(customer=customer, title='Lead') for customer in customers for _ in range(3)]
+            with CaptureQueriesContext(connection) as queries:
+                results = self.bulk('delete', '/api/customers/bulk/', [customer.pk for customer in customers])
+            counts.append(len(queries))
+            self.assertEqual({result['status'] for result in results}, {204})
+            tombstones = Tombstone.objects.filter(kind='lead', object_id__in=[lead.pk for lead in leads])
+            self.assertEqual(set(tombstones.values_list('owner_id', flat=True)), {self.user.pk})
+            self.assertEqual(tombstones.count(), 3 * n)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_customer_emails_stay_unique_per_owner(self):
+        results = self.bulk('post', '/api/customers/bulk/', [
+            {'name': 'Beta', 'email': 'b@beta.test'},
+            {'name': 'Beta again', 'email': 'b@beta.test'},
+            {'name': 'Acme clone', 'email': 'a@acme.test'},
+            {'name': 'Same as other owner', 'email': 'o@acme.test'},
+        ])
+        self.assertEqual([result['status'] for result in results], [201, 400, 400, 201])
+        beta = results[0]['id']
+        results = self.bulk('patch', '/api/customers/bulk/', [
+            {'id': self.customer.pk, 'email': 'b@beta.test'},
+            {'id': beta, 'company': 'Beta Corp'},
+            {'id': beta, 'company': 'Beta Inc'},
+        ])
+        self.assertEqual([result['status'] for result in results], [400, 200, 400])
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).email, 'a@acme.test')
+        self.assertEqual(Customer.objects.get(pk=beta).company, 'Beta Corp')
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(
+            owner=self.user, name='Acme', email='a@acme.test', address='1 Long Road', notes='Very long notes'
+        )
+        for i in range(3):
+            Lead.objects.create(customer=self.customer, title=f'Lead {i}', description='Asked for a quote.')
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, table='crm_lead'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        list_query, = [q['sql'] for q in queries.captured_queries
+                       if f'FROM "{table}"' in q['sql'] and 'COUNT(' not in q['sql']]
+        return response.data['results'], list_query, len(queries)
+
+    def test_default_is_the_full_representation(self):
+        results, _sql, _count = self.get('/api/leads/')
+        self.assertEqual(results[0]['customer']['notes'], 'Very long notes')
+        self.assertIn('description', results[0])
+
+    def test_fields_limit_payload_and_columns(self):
+        results, sql, count = self.get('/api/leads/?fields=id,title,customer')
+        self.assertEqual(set(results[0]), {'id', 'title', 'customer'})
+        self.assertEqual(results[0]['customer'], self.customer.pk)
+        self.assertNotIn('"crm_customer"."notes"', sql)
+        self.assertNotIn('"crm_lead"."description"', sql)
+
+        # Deferred columns are never loaded row by row
+        Lead.objects.create(customer=self.customer, title='One more')
+        self.assertEqual(self.get('/api/leads/?fields=id,title,customer')[2], count)
+
+    def test_nested_fields_expand_with_only_their_columns(self):
+        results, sql, _count = self.get('/api/leads/?fields=id,customer.name,customer.email')
+        self.assertEqual(results[0]['customer'], {'name': 'Acme', 'email': 'a@acme.test'})
+        self.assertIn('"crm_customer"."name"', sql)
+        self.assertNotIn('"crm_customer"."notes"', sql)
+
+        results, sql, _count = self.get('/api/customers/?fields=id,name', table='crm_customer')
+        self.assertEqual(results, [{'id': self.customer.pk, 'name': 'Acme'}])
+        self.assertNotIn('"crm_customer"."notes"', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get('/api/leads/?fields=id,password').status_code, 400)
+        self.assertEqual(self.client.get('/api/leads/?fields=customer.secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/leads/?expand=updated_by').status_code, 400)
+
+
+class FastListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        customer = Customer.objects.create(owner=self.user, name='Ünïcode\u2028Co', email='a@acme.test', notes='"q"')
+        Lead.objects.create(customer=customer, title='Plain', description='Great product')
+        Lead.objects.create(customer=customer, title='Edited \U0001F600', status='won', updated_by=self.user)
+        Customer.objects.create(owner=self.user, name='Bare', email='b@acme.test')
+        self.client.force_authenticate(self.user)
+
+    def content(self, url, **settings_):
+        with self.settings(**settings_):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_fast_path_output_is_byte_identical(self):
+        urls = [
+            '/api/leads/', '/api/customers/', '/api/leads/?page_size=1',
+            '/api/leads/?fields=id,customer,updated_by,score', '/api/leads/?fields=title,customer.name',
+        ]
+        with mock.patch('crm.serializers.LeadSerializer.to_representation') as regular:
+            fast = {url: self.content(url) for url in urls}
+            orjson = {url: self.content(url, CRM_JSON_ENCODER='orjson') for url in urls}
+        regular.assert_not_called()
+        for url in urls:
+            with self.subTest(url=url):
+                expected = self.content(url, CRM_FAST_LIST=False)
+                self.assertEqual(fast[url], expected)
+                self.assertEqual(orjson[url], expected)
+
+    def test_stale_scores_fall_back_to_serializer(self):
+        import json
+
+        Lead.objects.update(score=0, score_model_version='old')
+        with CaptureQueriesContext(connection) as queries:
+            stale = self.content('/api/leads/?page_size=1')
+        self.assertFalse(Lead.objects.filter(pk=json.loads(stale)['results'][0]['id'],
+                                             score_model_version='old').exists())
+        # The page is fetched once, then its instances by id; the page query is not run again
+        self.assertEqual(len([q for q in queries.captured_queries if 'LIMIT' in q['sql']]), 1)
+        self.assertEqual(stale, self.content('/api/leads/?page_size=1', CRM_FAST_LIST=False))
+        self.client.get('/api/leads/')
+        self.assertFalse(Lead.objects.filter(score_model_version='old').exists())
+
+
+class QueryIndexTests(TestCase):
+    def test_partial_index_condition_matches_high_priority_filter(self):
+        from .views import high_priority_queryset
+
+        user = User.objects.create_user('agent', password='pw')
+        customer = Customer.objects.create(owner=user, name='Acme', email='a@acme.test')
+        for status in ('new', 'won', 'lost', 'qualified'):
+            for score in (79.99, 80, 95):
+                Lead.objects.create(customer=customer, title=f'{status} {score}', status=status)
+        Lead.objects.update(score=models.F('id') % 3 * 7.5 + 79.99)
+
+        index, = [index for index in Lead._meta.indexes if index.name == 'crm_lead_open_hot_idx']
+        self.assertEqual(
+            set(Lead.objects.filter(index.condition).values_list('id', flat=True)),
+            set(high_priority_queryset(user).values_list('id', flat=True)),
+        )
+
+    def test_benchmark_queries_rolls_back_seed_data(self):
+        out = StringIO()
+        call_command('benchmark_queries', users=2, customers=3, leads=2, repeat=1, stdout=out)
+        for name in ('customers', 'leads', 'products', 'high_priority'):
+            self.assertIn(f'== {name} ==', out.getvalue())
+        self.assertFalse(Lead.objects.exists())
+        with connection.cursor() as cursor:
+            self.assertIn('crm_lead_open_hot_idx', connection.introspection.get_constraints(cursor, 'crm_lead'))
+
+    def test_benchmark_helpers_seed_inside_a_rollback(self):
+        from .benchmarking import Timings, rolled_back, seed_customers, seed_leads
+
+        with rolled_back():
+            user = User.objects.create_user('benchmark')
+            customers = seed_customers(user, 3, company=lambda i: f'Company {i}', phone='+1 555 0100')
+            seed_leads([customer.pk for customer in customers], 25, random.Random(0), batch_size=10)
+            self.assertEqual(Lead.objects.filter(customer__owner=user).count(), 25)
+            self.assertEqual(Customer.objects.get(name='Customer 2').company, 'Company 2')
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+        timings = Timings()
+        timings.extend([0.4, 0.1, 0.3, 0.2])
+        self.assertEqual((timings.median, timings.p95, timings.per_second), (0.25, 0.3, 4.0))
+
+
+class SentimentRecomputeTests(APITestCase):
+    def setUp(self):
+        polarity_cache.clear()
+        self.user = User.objects.create_user('agent', password='pw')
+        customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.lead = Lead.objects.create(customer=customer, title='Deal', description='A great, happy customer')
+        self.client.force_authenticate(self.user)
+
+    def test_status_only_patch_skips_nlp(self):
+        with mock.patch('crm.sentiment.textblob_polarity') as nlp, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/api/leads/{self.lead.pk}/', {'status': 'contacted'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        nlp.assert_not_called()
+        # lead lookup (customer joined in), UPDATE; updated_by is the cached request.user
+        self.assertEqual(len(queries), 2)
+
+    def test_description_change_recomputes_sentiment(self):
+        with mock.patch('crm.sentiment.textblob_polarity', return_value=-0.8) as nlp:
+            response = self.client.patch(
+                f'/api/leads/{self.lead.pk}/', {'description': 'Terrible, angry call'}, format='json'
+            )
+        nlp.assert_called_once()
+        self.assertEqual(response.data['sentiment'], 'Negative')
+
+    def test_repeated_text_hits_polarity_cache(self):
+        with mock.patch('crm.sentiment.textblob_polarity', return_value=0.5) as nlp:
+            for i in range(3):
+                Lead.objects.create(customer=self.lead.customer, title=f'Copy {i}', description='Same template text')
+        nlp.assert_called_once()
+
+
+@override_settings(LEAD_ENRICHMENT_MODE='async')
+class AsyncEnrichmentTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.customer = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.client.force_authenticate(self.user)
+
+    def test_create_defers_enrichment_to_worker(self):
+        with mock.patch('crm.sentiment.textblob_polarity', return_value=0.6) as nlp:
+            response = self.client.post('/api/leads/', {
+                'customer_id': self.customer.pk, 'title': 'Deal', 'description': 'Loves it', 'status': 'qualified',
+            }, format='json')
+            nlp.assert_not_called()
+            self.assertEqual(response.data['enrichment_status'], 'pending')
+
+            call_command('run_enrichment_worker', once=True, stdout=StringIO())
+            nlp.assert_called_once()
+
+        lead = Lead.objects.get(pk=response.data['id'])
+        self.assertEqual(lead.enrichment_status, Lead.ENRICHMENT_COMPLETE)
+        self.assertEqual(lead.sentiment, 'Positive')
+        self.assertEqual(lead.score, 100)
+        self.assertEqual(lead.enrichment_job.status, EnrichmentJob.STATUS_DONE)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        lead = Lead.objects.create(customer=self.customer, title='Deal', description='Text')
+        jobs = claim_jobs(10)
+        with mock.patch.object(Lead, 'enrich', side_effect=RuntimeError('boom')):
+            self.assertEqual(process_jobs(jobs, max_attempts=2), (0, 1))
+
+        job = EnrichmentJob.objects.get(lead=lead)
+        self.assertEqual((job.status, job.attempts, job.last_error), (EnrichmentJob.STATUS_PENDING, 1, 'boom'))
+        self.assertEqual(claim_jobs(10), [])  # not due until the backoff expires
+
+    def test_save_during_enrichment_is_not_overwritten(self):
+        lead = Lead.objects.create(customer=self.customer, title='Deal', description='Loves it')
+        jobs = claim_jobs(10)
+        enrich = Lead.enrich
+
+        def edit_meanwhile(leads):
+            enrich(leads)
+            newer = Lead.objects.get(pk=lead.pk)
+            newer.description = 'Terrible, angry call'
+            newer.save()
+
+        with mock.patch.object(Lead, 'enrich', side_effect=edit_meanwhile):
+            self.assertEqual(process_jobs(jobs), (1, 0))
+        lead.refresh_from_db()
+        self.assertEqual(lead.enrichment_status, Lead.ENRICHMENT_PENDING)
+        self.assertEqual(EnrichmentJob.objects.get(lead=lead).status, EnrichmentJob.STATUS_PENDING)
+
+        process_jobs(claim_jobs(10))
+        lead.refresh_from_db()
+        self.assertEqual((lead.enrichment_status, lead.sentiment), (Lead.ENRICHMENT_COMPLETE, 'Negative'))
+
+
+class SentimentBackendTests(TestCase):
+    SAMPLES = [
+        "Great call, the customer is very happy with the proposal!",
+        "The customer is really not happy about the pricing.",
+        "Terribly slow response, but honestly a nice person.",
+        "Isn't interested. Never a good fit.",
+        "Budget meeting next week.",
+    ]
+
+    def test_lexicon_backend_agrees_with_textblob(self):
+        backend = LexiconBackend()
+        for text in self.SAMPLES:
+            with self.subTest(text=text):
+                self.assertAlmostEqual(backend.polarity(text), textblob_polarity(text), places=6)
+
+    @override_settings(SENTIMENT_BACKEND='lexicon')
+    def test_backend_is_selected_by_setting(self):
+        polarity_cache.clear()
+        self.assertIsInstance(get_backend(), LexiconBackend)
+        with mock.patch('crm.sentiment.textblob_polarity') as nlp:
+            self.assertGreater(polarity("A wonderful, excellent deal"), 0.1)
+        nlp.assert_not_called()
+
+
+class ImportTimeBudgetTests(TestCase):
+    HEAVY_MODULES = {
+        'pandas', 'numpy', 'sklearn', 'joblib', 'textblob', 'nltk',
+        'googleapiclient', 'google_auth_oauthlib', 'bs4',
+    }
+
+    def test_django_setup_stays_within_import_budget(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup()'],
+            cwd=Path(__file__).resolve().parent.parent, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        self_us = 0
+        imported = set()
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, _, name = line[len('import time:'):].split('|')
+            self_us += int(own)
+            imported.add(name.strip().split('.')[0])
+
+        self.assertFalse(imported & self.HEAVY_MODULES, "heavy modules imported at startup")
+        budget_ms = getattr(settings, 'CRM_IMPORT_TIME_BUDGET_MS', 1500)
+        self.assertLess(self_us / 1000, budget_ms)
+
+
+class CompiledModelTests(TestCase):
+    def test_compiled_predict_proba_matches_estimator(self):
+        import numpy as np
+        import pandas as pd
+
+        features = np.random.default_rng(0).uniform(-1, 1, size=(500, len(ml_utils.FEATURE_COLUMNS)))
+        frame = pd.DataFrame(features, columns=ml_utils.FEATURE_COLUMNS)
+        for kind in ('logistic', 'forest'):
+            with self.subTest(kind=kind):
+                estimator = fit_synthetic_model(kind)
+                with tempfile.TemporaryFile() as artifact:
+                    np.savez(artifact, **compile_estimator(estimator, ml_utils.FEATURE_COLUMNS))
+                    artifact.seek(0)
+                    compiled = CompiledModel.load(artifact)
+                np.testing.assert_allclose(
+                    compiled.predict_proba(features), estimator.predict_proba(frame), rtol=0, atol=1e-12
+                )
+
+    def test_registry_serves_npz_artifact(self):
+        import numpy as np
+
+        estimator = fit_synthetic_model('forest')
+        leads = make_leads(50, seed=4)
+        expected = ml_utils.calculate_lead_scores(leads, LoadedModel(estimator, 'pickle'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'model.npz'
+            np.savez(path, **compile_estimator(estimator, ml_utils.FEATURE_COLUMNS))
+            loaded = ModelRegistry(path, check_interval=0).get()
+        self.assertIsInstance(loaded.model, CompiledModel)
+        self.assertEqual([ml_utils.calculate_lead_score(lead, loaded) for lead in leads], expected)
+
+
+class TrainLeadModelTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        user = User.objects.create_user('agent', password='pw')
+        customer = Customer.objects.create(owner=user, name='Acme', email='a@acme.test')
+        leads = make_leads(400, seed=3)
+        for lead in leads:
+            lead.customer = customer
+            lead.status = 'won' if lead.sentiment_score > 0 else 'lost'
+        Lead.objects.bulk_create(leads)
+
+    def test_writes_versioned_artifact_with_cross_validation(self):
+        import json
+
+        out = StringIO()
+        call_command('train_lead_model', folds=2, workers=1, batch_size=64, chunk_size=50,
+                     output_dir=self.tmp.name, stdout=out)
+        self.assertIn('2-fold CV', out.getvalue())
+
+        metadata_path, = Path(self.tmp.name).glob('*.json')
+        metadata = json.loads(metadata_path.read_text())
+        artifact = metadata_path.with_suffix('.pkl')
+        self.assertEqual(artifact.name, f"{ml_utils.model_path.stem}-{metadata['version']}.pkl")
+        self.assertEqual(metadata['rows'], 400)
+        self.assertEqual(sum(fold['rows'] for fold in metadata['cross_validation']), 400)
+        self.assertGreater(min(fold['auc'] for fold in metadata['cross_validation']), 0.95)
+
+        # Served through the registry, its version is the one in the file name
+        loaded = ModelRegistry(artifact, check_interval=0).get()
+        self.assertEqual(loaded.version, metadata['version'])
+        positive, negative = make_leads(2)
+        positive.status = negative.status = 'new'
+        positive.sentiment_score, negative.sentiment_score = 0.8, -0.8
+        self.assertGreater(ml_utils.calculate_lead_score(positive, loaded),
+                           ml_utils.calculate_lead_score(negative, loaded))
+
+    def test_experimental_model_is_never_installed(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch('crm.management.commands.train_lead_model.model_path', Path(tmp) / 'live.pkl'):
+            with self.assertRaises(TypeError):
+                call_command('train_lead_model', folds=0, install=True, output_dir=self.tmp.name)
+            out = StringIO()
+            call_command('train_lead_model', folds=0, output_dir=self.tmp.name, stdout=out)
+            self.assertIn('not installed', out.getvalue())
+            self.assertFalse((Path(tmp) / 'live.pkl').exists())
+
+    def test_binned_auc(self):
+        import numpy as np
+
+        separated = np.zeros((2, 4), dtype=np.int64)
+        separated[0, 0], separated[1, 3] = 5, 5
+        self.assertEqual(binned_auc(separated), 1.0)
+        self.assertEqual(binned_auc(np.ones((2, 4), dtype=np.int64)), 0.5)
+
+
+class ImportCrmTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('agent', password='pw')
+        self.existing = Customer.objects.create(owner=self.user, name='Acme', email='a@acme.test')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write_csv(self, rows):
+        import csv
+
+        path = Path(self.tmp.name) / 'import.csv'
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['customer_email', 'customer_name', 'customer_company', 'title', 'description', 'status'])
+            writer.writerows(rows)
+        return str(path)
+
+    def test_upserts_customers_and_enriches_leads_in_chunks(self):
+        path = self.write_csv([
+            ['a@acme.test', '', 'Acme Corp', 'Renewal', 'Great call, they love it', 'Qualified'],
+            ['b@beta.test', 'Beta', '', 'Intro', 'Terrible experience, very angry', ''],
+            ['b@beta.test', '', '', 'Upsell', '', 'contacted'],
+            ['c@gamma.test', '', '', 'Orphan', '', ''],
+            ['not-an-email', 'Bad', '', 'Broken', '', ''],
+            ['a@acme.test', '', '', 'Odd', '', 'maybe'],
+        ])
+        out, err = StringIO(), StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_crm', path, owner='agent', chunk_size=3, stdout=out, stderr=err)
+
+        # One customer lookup per chunk
+        lookups = [q for q in queries.captured_queries
+                   if q['sql'].startswith('SELECT') and 'FROM "crm_customer"' in q['sql']]
+        self.assertEqual(len(lookups), 2)
+        self.assertIn('3 leads', out.getvalue())
+        self.assertIn('3 rows failed', out.getvalue())
+        for line in ('line 5: customer_name', 'line 6: customer_email', 'line 7: status'):
+            self.assertIn(line, err.getvalue())
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.company, 'Acme Corp')
+        renewal, intro, upsell = Lead.objects.filter(customer__owner=self.user).order_by('pk')
+        self.assertEqual((renewal.customer, renewal.status), (self.existing, 'qualified'))
+        self.assertEqual(intro.customer, upsell.customer)
+        self.assertEqual(intro.status, 'new')
+        self.assertEqual(renewal.sentiment, 'Positive')
+        self.assertEqual(intro.sentiment, 'Negative')
+        self.assertEqual(upsell.sentiment, 'N/A')
+        self.assertTrue(all(lead.score_model_version for lead in (renewal, intro, upsell)))
+
+
+class GmailFetchTests(APITestCase):
+    def setUp(self):
+        from .google.fake import FakeGmail
+
+        self.gmail = FakeGmail()
+        self.ids = [self.gmail.add_message(subject=f'Hello {i}', body=f'Body {i}')['id'] for i in range(120)]
+
+    def test_batches_gets_and_pages_through_results(self):
+        from .google.fetch import fetch_recent
+
+        result = fetch_recent(self.gmail.service(), max_results=110, format='metadata', batch_size=50)
+        # Newest first, one list call and three batches
+        self.assertEqual([msg['id'] for msg in result.messages], self.ids[::-1][:110])
+        self.assertEqual(self.gmail.requests.count(('POST', '/batch')), 3)
+        self.assertEqual(len(self.gmail.requests), 4)
+        self.assertEqual(result.errors, {})
+
+    def test_per_item_errors_and_retries(self):
+        from .google.fetch import get_messages
+
+        self.gmail.fail(self.ids[0], 429)
+        self.gmail.fail(self.ids[1], 503, times=5)
+        result = get_messages(self.gmail.service(), self.ids[:10] + ['missing'], backoff=0)
+        self.assertEqual([msg['id'] for msg in result.messages], [i for i in self.ids[:10] if i != self.ids[1]])
+        self.assertEqual({k: e.resp.status for k, e in result.errors.items()}, {self.ids[1]: 503, 'missing': 404})
+
+    def test_thread_pool_returns_the_same_messages(self):
+        from .google.fetch import get_messages
+
+        service = self.gmail.service()
+        sequential = get_messages(service, self.ids, batch_size=20)
+        threaded = get_messages(service, self.ids, batch_size=20, workers=4)
+        self.assertEqual(threaded.messages, sequential.messages)
+        self.assertEqual(len(threaded.messages), 120)
+
+    def test_conversations_view_uses_two_round_trips(self):
+        user = User.objects.create_user('agent', password='pw')
+        self.client.force_authenticate(user)
+        with mock.patch('crm.views.get_gmail_service', return_value=self.gmail.service()):
+            response = self.client.get('/api/gmail/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['messages'][0], {'id': self.ids[-1], 'snippet': 'Body 119'})
+        self.assertEqual(len(response.data['messages']), 10)
+        self.assertEqual(len(self.gmail.requests), 2)
+
+
+class GmailServiceFactoryTests(TestCase):
+    def setUp(self):
+        from .google.fake import FakeGmail
+        from .google.gmail_service import clear_service_cache
+
+        self.gmail = FakeGmail(latency=0.02)
+        self.gmail.add_message(subject='Hello', body='Body')
+        self.gmail.tokens = {'fresh'}
+        self.addCleanup(clear_service_cache)
+
+    def credentials(self, token='stale', expired=False, refresh_token='refresh', scopes=None):
+        from datetime import timedelta
+        from google.oauth2.credentials import Credentials
+
+        expiry = (timezone.now() - timedelta(minutes=5)).replace(tzinfo=None) if expired else None
+        return Credentials(token=token, refresh_token=refresh_token, client_id='client', client_secret='secret',
+                           token_uri='https://oauth2.googleapis.com/token', expiry=expiry, scopes=scopes)
+
+    def service(self, credentials):
+        from .google.fake import fake_session
+        from .google.gmail_service import gmail_service_for
+        from .google.transport import PooledHttp
+
+        return gmail_service_for(credentials, transport=lambda creds: PooledHttp(creds, session=fake_session(self.gmail)))
+
+    def patch_refresh(self):
+        import time
+        from datetime import timedelta
+        from google.oauth2.credentials import Credentials
+
+        def refresh(creds, request):
+            time.sleep(0.05)
+            creds.token = 'fresh'
+            creds.expiry = (timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+        return mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=refresh)
+
+    def list_ids(self, service):
+        return [m['id'] for m in service.users().messages().list(userId='me').execute()['messages']]
+
+    def test_one_service_per_account(self):
+        first = self.service(self.credentials('fresh'))
+        second = self.service(self.credentials('fresh'))
+        self.assertIs(first, second)
+        self.assertIsNot(first, self.service(self.credentials('fresh', refresh_token='other')))
+        self.assertIsNot(first, self.service(self.credentials('fresh', scopes=['https://mail.google.com/'])))
+        self.assertEqual(self.list_ids(first), list(self.gmail.messages))
+
+    def test_cached_service_takes_over_changed_credentials(self):
+        service = self.service(self.credentials('revoked'))
+        with self.patch_refresh() as refresh:
+            self.list_ids(service)
+            # The caller's copy still has the token refreshed away: keep the new one
+            self.list_ids(self.service(self.credentials('revoked')))
+            self.assertEqual(refresh.call_count, 1)
+
+            self.gmail.tokens = {'stored'}
+            # A token obtained elsewhere replaces the cached one without a refresh
+            self.assertIs(self.service(self.credentials('stored')), service)
+            self.assertEqual(self.list_ids(service), list(self.gmail.messages))
+            self.assertEqual(refresh.call_count, 1)
+
+    def test_concurrent_requests_refresh_an_expired_token_once(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        service = self.service(self.credentials(expired=True))
+        with self.patch_refresh() as refresh, ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: self.list_ids(service), range(8)))
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(results, [list(self.gmail.messages)] * 8)
+
+    def test_rejected_token_is_refreshed_once_and_retried(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        service = self.service(self.credentials('revoked'))
+        with self.patch_refresh() as refresh, ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: self.list_ids(service), range(4)))
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(service._http.refreshes, 1)
+
+
+class GmailSyncTests(APITestCase):
+    def setUp(self):
+        from .google.fake import FakeGmail
+
+        self.user = User.objects.create_user('agent', password='pw', email='agent@acme.test')
+        self.profile = self.user.profile
+        self.profile.gmail_refresh_token = 'refresh'
+        self.profile.save()
+        self.gmail = FakeGmail()
+        self.ids = [
+            self.gmail.add_message(subject=f'Quote {i}', sender=f'Client {i} <c{i}@beta.test>', body=f'Body {i}')['id']
+            for i in range(30)
+        ]
+        patcher = mock.patch('crm.google.gmail_service.get_profile_service', return_value=self.gmail.service())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync(self, **options):
+        out = StringIO()
+        call_command('sync_gmail', stdout=out, **options)
+        self.profile.refresh_from_db()
+        return out.getvalue()
+
+    def stored(self):
+        from .models import EmailMessage
+
+        return {m.gmail_id: m for m in EmailMessage.objects.filter(owner=self.user)}
+
+    def test_full_then_incremental_sync(self):
+        self.assertIn('full sync, 20 stored', self.sync(limit=20))
+        stored = self.stored()
+        self.assertEqual(set(stored), set(self.ids[10:]))
+        newest = stored[self.ids[-1]]
+        self.assertEqual((newest.subject, newest.sender, newest.body), ('Quote 29', 'Client 29 <c29@beta.test>', 'Body 29'))
+
+        new = self.gmail.add_message(subject='Follow-up', body='Any news?')['id']
+        self.gmail.delete_message(self.ids[15])
+        self.gmail.modify_labels(self.ids[16], add=['TRASH'])
+        self.gmail.modify_labels(self.ids[17], add=['STARRED'])
+        del self.gmail.requests[:]
+        self.assertIn('incremental sync, 1 stored, 1 relabeled, 2 deleted', self.sync())
+        # history.list plus one batch for the new message
+        self.assertEqual(len(self.gmail.requests), 2)
+        stored = self.stored()
+        self.assertIn(new, stored)
+        self.assertNotIn(self.ids[15], stored)
+        self.assertNotIn(self.ids[16], stored)
+        self.assertEqual(stored[self.ids[17]].label_ids, ['INBOX', 'STARRED'])
+        self.assertEqual(self.profile.gmail_history_id, str(self.gmail.history_id))
+
+        self.assertIn('incremental sync, 0 stored', self.sync())
+
+    def test_message_moved_out_of_trash_is_stored_again(self):
+        self.sync(limit=20)
+        self.gmail.modify_labels(self.ids[16], add=['TRASH'])
+        self.assertIn('0 stored, 0 relabeled, 1 deleted', self.sync())
+        self.assertNotIn(self.ids[16], self.stored())
+
+        self.gmail.modify_labels(self.ids[16], remove=['TRASH'])
+        self.gmail.modify_labels(self.ids[17], add=['STARRED'])
+        self.assertIn('1 stored, 1 relabeled, 0 deleted', self.sync())
+        self.assertEqual(self.stored()[self.ids[16]].subject, 'Quote 16')
+
+    def test_expired_cursor_falls_back_to_full_sync(self):
+        self.sync(limit=5)
+        self.gmail.add_message(subject='Late', body='Missed')
+        self.gmail.expire_history()
+        self.assertIn('full sync, 1 stored', self.sync(limit=5))
+
+    def test_conversations_are_served_from_synced_messages(self):
+        self.client.force_authenticate(self.user)
+        self.sync(limit=20)
+        with mock.patch('crm.views.get_gmail_service', side_effect=AssertionError("no live Gmail calls")), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/gmail/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        messages = response.data['messages']
+        self.assertEqual([m['id'] for m in messages], self.ids[::-1][:10])
+        self.assertEqual((messages[0]['subject'], messages[0]['snippet']), ('Quote 29', 'Body 29'))
+
+    def oauth_callback(self, state, session_state=None):
+        creds = mock.Mock(token='access', refresh_token='new-refresh', token_uri='https://oauth2.googleapis.com/token',
+                          client_id='client', client_secret='secret', scopes=['gmail.readonly'])
+        session = self.client.session
+        session['oauth_state'] = state if session_state is None else session_state
+        session.save()
+        with mock.patch('google_auth_oauthlib.flow.Flow.from_client_config', return_value=mock.Mock(credentials=creds)):
+            return self.client.get('/api/gmail/callback/', {'state': state, 'code': 'c'})
+
+    def oauth_state(self, user):
+        from django.core import signing
+        from .views import OAUTH_STATE_SALT
+
+        return signing.dumps({'user': user.pk if user else None, 'nonce': 'n'}, salt=OAUTH_STATE_SALT)
+
+    def test_oauth_callback_stores_tokens_on_the_user_in_the_state(self):
+        response = self.oauth_callback(self.oauth_state(self.user))
+        self.assertEqual(response.status_code, 302)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.gmail_token, self.profile.gmail_refresh_token), ('access', 'new-refresh'))
+        self.assertEqual(self.profile.gmail_scopes, ['gmail.readonly'])
+
+    def test_anonymous_flow_keeps_tokens_in_the_session_only(self):
+        # The frontend navigates to /gmail-auth/ without its JWT
+        response = self.oauth_callback(self.oauth_state(None))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session['refresh_token'], 'new-refresh')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.gmail_refresh_token, 'refresh')
+
+    def test_oauth_callback_with_a_bad_state_is_refused(self):
+        other = User.objects.create_user('other', email='other@acme.test')
+        forged = self.oauth_state(self.user)[:-2] + 'xx'
+        for state, session_state in [
+            (forged, None),
+            (self.oauth_state(self.user), self.oauth_state(other)),  # state issued to another browser
+        ]:
+            with self.subTest(state=state):
+                self.assertEqual(self.oauth_callback(state, session_state).status_code, 403)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.gmail_refresh_token, 'refresh')
+
+    def test_auth_url_signs_the_user_into_the_state(self):
+        from urllib.parse import parse_qs, urlsplit
+        from django.core import signing
+        from .views import OAUTH_STATE_SALT
+
+        self.assertEqual(self.client.get('/api/gmail/auth-url/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/gmail/auth-url/')
+        state = self.client.session['oauth_state']
+        self.assertEqual(parse_qs(urlsplit(response.data['url']).query)['state'], [state])
+        self.assertEqual(signing.loads(state, salt=OAUTH_STATE_SALT)['user'], self.user.pk)
+        self.assertTrue(self.client.session['oauth_code_verifier'])
+
+
+class GmailThrottleTests(TestCase):
+    def test_backs_off_on_429_and_rate_limits(self):
+        import time
+        from .google.fake import FakeGmail
+        from .google.throttle import ThrottledHttp, TokenBucket
+
+        gmail = FakeGmail()
+        gmail.fail_requests(429, times=2, retry_after=0.05)
+        http = ThrottledHttp(gmail.http(), TokenBucket(rate=50, burst=1))
+        start = time.perf_counter()
+        resp, _ = http.request('https://gmail.googleapis.com/gmail/v1/users/me/profile')
+        self.assertEqual((resp.status, http.retries), (200, 2))
+        for _ in range(5):
+            http.request('https://gmail.googleapis.com/gmail/v1/users/me/profile')
+        # Two Retry-After waits, then five requests held to 50/s
+        self.assertGreater(time.perf_counter() - start, 0.05 * 2 + 5 / 50 - 0.01)
+        self.assertEqual(len(gmail.requests), 8)
+
+    def test_gives_up_after_max_retries(self):
+        from .google.fake import FakeGmail
+        from .google.throttle import ThrottledHttp, TokenBucket
+
+        gmail = FakeGmail()
+        gmail.fail_requests(503, times=5)
+        http = ThrottledHttp(gmail.http(), TokenBucket(rate=1000), max_retries=2, backoff=0.001)
+        resp, _ = http.request('https://gmail.googleapis.com/gmail/v1/users/me/profile')
+        self.assertEqual(resp.status, 503)
+        self.assertEqual(len(gmail.requests), 3)
+
+
+class GmailSyncWorkerTests(TransactionTestCase):
+    def setUp(self):
+        from .google.fake import FakeGmail
+
+        self.mailboxes = {}
+        for name in ('alice', 'bob', 'carol'):
+            user = User.objects.create_user(name, password='pw')
+            user.profile.gmail_refresh_token = f'{name}-refresh'
+            user.profile.save()
+            gmail = self.mailboxes[user.pk] = FakeGmail(latency=0.01)
+            for i in range(12):
+                gmail.add_message(subject=f'{name} {i}', body='Hello')
+
+    def service_for(self, profile):
+        return self.mailboxes[profile.user_id].service()
+
+    def profiles(self):
+        return Profile.objects.select_related('user').order_by('user__username')
+
+    def test_accounts_sync_concurrently_and_failures_stay_isolated(self):
+        from .google.worker import sync_accounts
+
+        bob = User.objects.get(username='bob')
+        self.mailboxes[bob.pk].fail_requests(403, times=1)
+        run = sync_accounts(self.profiles(), workers=3, service_for=self.service_for)
+        self.assertEqual([a.username for a in run.failed], ['bob'])
+        self.assertEqual(run.messages, 24)
+        self.assertEqual(EmailMessage.objects.filter(owner__username='alice').count(), 12)
+
+        for gmail in self.mailboxes.values():
+            gmail.add_message(subject='New', body='Hi')
+        run = sync_accounts(self.profiles(), workers=3, service_for=self.service_for)
+        self.assertEqual(run.failed, [])
+        self.assertEqual({a.username: (a.mode, a.added) for a in run.accounts},
+                         {'alice': ('incremental', 1), 'bob': ('full', 13), 'carol': ('incremental', 1)})
+        self.assertIsNone(run.accounts[1].lag)
+        self.assertGreater(run.accounts[0].lag, 0)
+
+    @override_settings(GMAIL_HISTORY_PAGE_SIZE=2)
+    def test_interrupted_incremental_sync_resumes_from_checkpoint(self):
+        from .google.sync import SyncError, sync_account
+
+        alice = Profile.objects.select_related('user').get(user__username='alice')
+        gmail = self.mailboxes[alice.user_id]
+        sync_account(alice, service=gmail.service())
+        new = [gmail.add_message(subject=f'New {i}', body='Hi')['id'] for i in range(5)]
+        gmail.fail(new[3], 403)
+        with self.assertRaises(SyncError):
+            sync_account(alice, service=gmail.service())
+        alice.refresh_from_db()
+        # The first page (two messages) was committed with its cursor
+        self.assertEqual(alice.gmail_history_id, gmail.history[-4]['id'])
+        self.assertEqual(EmailMessage.objects.filter(owner=alice.user, subject__startswith='New').count(), 2)
+
+        del gmail.requests[:]
+        result = sync_account(alice, service=gmail.service())
+        self.assertEqual((result.mode, result.added), ('incremental', 3))
+        self.assertEqual(EmailMessage.objects.filter(owner=alice.user).count(), 17)
+
+
+class GmailParseMessageTests(TestCase):
+    @staticmethod
+    def part(mime_type, text, charset='utf-8', **extra):
+        import base64
+
+        data = base64.urlsafe_b64encode(text.encode(charset)).decode().rstrip('=')
+        headers = [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}]
+        return {'mimeType': mime_type, 'headers': headers, 'body': {'data': data}, **extra}
+
+    @staticmethod
+    def message(*parts, mime_type='multipart/mixed'):
+        headers = [{'name': 'From', 'value': 'Client <c@beta.test>'}, {'name': 'Subject', 'value': 'Quote'}]
+        return {'snippet': 'Hi', 'payload': {'mimeType': mime_type, 'headers': headers, 'parts': list(parts)}}
+
+    def parse(self, msg):
+        from .google.utils import parse_message
+
+        return parse_message(msg)
+
+    def test_prefers_plain_text_in_nested_alternatives(self):
+        msg = self.message(
+            {'mimeType': 'multipart/related', 'parts': [
+                {'mimeType': 'multipart/alternative', 'parts': [
+                    self.part('text/html', '<p>HTML</p>'), self.part('text/plain', 'Grüße aus Köln', 'iso-8859-1'),
+                ]},
+            ]},
+            self.part('text/plain', 'attached notes', filename='notes.txt'),
+        )
+        parsed = self.parse(msg)
+        self.assertEqual(parsed['body'], 'Grüße aus Köln')
+        self.assertEqual((parsed['sender'], parsed['subject']), ('Client <c@beta.test>', 'Quote'))
+
+    def test_html_is_reduced_to_text(self):
+        html = ('<html><head><title>T</title><style>p {}</style></head><body><h1>Offer</h1>'
+                '<p>50&nbsp;seats &amp; <b>support</b></p><script>track()</script><br>Thanks</body></html>')
+        msg = self.message({'mimeType': 'multipart/alternative', 'parts': [self.part('text/html', html, 'windows-1252')]})
+        self.assertEqual(self.parse(msg)['body'], 'Offer\n\n50 seats & support\n\nThanks')
+
+    def test_unknown_charset_and_bad_bytes_do_not_fail(self):
+        import base64
+
+        part = self.part('text/plain', '')
+        part['headers'] = [{'name': 'Content-Type', 'value': 'text/plain; charset=x-unknown'}]
+        part['body']['data'] = base64.urlsafe_b64encode(b'ok \xff\xfe').decode()
+        self.assertEqual(self.parse(self.message(part))['body'], 'ok ��')
+
+    @override_settings(GMAIL_HTML_PARSER='lxml')
+    def test_html_that_lxml_rejects_falls_back_to_the_stdlib_parser(self):
+        import types
+
+        # lxml refuses str input with an encoding declaration: "Unicode strings with encoding
+        # declaration are not supported". Simulated, as lxml is optional.
+        lxml = types.ModuleType('lxml')
+        lxml.etree = types.SimpleNamespace(ParserError=type('ParserError', (Exception,), {}))
+        lxml.html = types.SimpleNamespace(document_fromstring=mock.Mock(side_effect=ValueError(
+            'Unicode strings with encoding declaration are not supported.')))
+        html = '<?xml version="1.0" encoding="utf-8"?><html><body><p>Signed</p><p>contract</p></body></html>'
+        with mock.patch.dict(sys.modules, {'lxml': lxml}):
+            body = self.parse(self.message(self.part('text/html', html)))['body']
+        lxml.html.document_fromstring.assert_called_once()
+        self.assertEqual(body, 'Signed\n\ncontract')
+
+    @override_settings(GMAIL_BODY_MAX_CHARS=50)
+    def test_body_is_capped(self):
+        self.assertEqual(self.parse(self.message(self.part('text/plain', 'x' * 10_000)))['body'], 'x' * 50)
+        html = '<p>' + 'word ' * 10_000 + '</p>'
+        self.assertEqual(len(self.parse(self.message(self.part('text/html', html)))['body']), 50)
@@ -1,10 +1,11 @@
 # utils.py
 import base64
 from email.mime.text import MIMEText
-from googleapiclient.discovery import build
+
+from crm.google.gmail_service import gmail_service_for
 
 def send_gmail_message(credentials, to_email, subject, body):
-    service = build('gmail', 'v1', credentials=credentials)
+    service = gmail_service_for(credentials)
 
     message = MIMEText(body)
     message['to'] = to_email
@@ -1,18 +1,30 @@
 import os
 from django.conf import settings
+from django.core import signing
+from django.contrib.auth import get_user_model
 from django.shortcuts import redirect
 from django.http import JsonResponse
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from django.utils import timezone
+from django.utils.crypto import get_random_string
 
-from rest_framework import viewsets, generics
+from django.db.models import Count
+from rest_framework import filters, viewsets, generics
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .models import Product, Customer, Lead
+from .bulk import CustomerBulkMixin, LeadBulkMixin
+from .caching import cached_for_owner
+from .conditional import ConditionalGetMixin
+from .export import CUSTOMER_COLUMNS, LEAD_COLUMNS, ExportMixin
+from .fastlist import FastListMixin
+from .fieldsets import SparseFieldsetMixin
+from .ml.utils import current_model_version
+from .sync import decode_token, sync_payload
+from .models import EmailMessage, Product, Customer, Lead, Profile
+from .pagination import CreatedAtCursorPagination
 from .serializers import (
     ProductSerializer,
     CustomerSerializer,
@@ -21,8 +33,11 @@ from .serializers import (
     UserRegistrationSerializer
 )
 from .utils import send_gmail_message
+from crm.google.fetch import fetch_recent
 from crm.google.utils import parse_message
-from crm.google.gmail_service import get_gmail_service
+from crm.google.gmail_service import get_gmail_service, store_credentials
+
+User = get_user_model()
 
 # ---------------- Gmail Settings ---------------- #
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
@@ -43,21 +58,68 @@ def get_google_client_config():
 
 
 # ---------------- Gmail OAuth Views ---------------- #
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def gmail_auth_init(request):
+OAUTH_STATE_SALT = 'crm.gmail-oauth-state'
+OAUTH_STATE_MAX_AGE = 600
+
+
+def gmail_authorization_url(request):
+    """
+    Google consent URL for `request`'s browser session. Its signed state
+    names the requesting user, if authenticated, so the callback (which
+    arrives without the API token) knows whose Profile gets the tokens.
+    """
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_config(get_google_client_config(), scopes=SCOPES)
     flow.redirect_uri = settings.GOOGLE_OAUTH2_REDIRECT_URI
-    auth_url, state = flow.authorization_url(access_type='offline', prompt='consent')
+    user_id = request.user.pk if request.user.is_authenticated else None
+    state = signing.dumps({'user': user_id, 'nonce': get_random_string(32)}, salt=OAUTH_STATE_SALT)
+    auth_url, state = flow.authorization_url(access_type='offline', prompt='consent', state=state)
     request.session['oauth_state'] = state
-    return redirect(auth_url)
+    request.session['oauth_code_verifier'] = flow.code_verifier
+    return auth_url
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def gmail_auth_init(request):
+    return redirect(gmail_authorization_url(request))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def gmail_auth_url(request):
+    """Consent URL bound to the logged-in user; the frontend navigates to it"""
+    return Response({'url': gmail_authorization_url(request)})
+
+
+def oauth_state(request):
+    """
+    The signed payload of the callback's state if gmail_authorization_url
+    issued it to this same browser session, else None
+    """
+    state = request.GET.get('state')
+    if not state or state != request.session.get('oauth_state'):
+        return None
+    try:
+        payload = signing.loads(state, salt=OAUTH_STATE_SALT, max_age=OAUTH_STATE_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return payload if isinstance(payload, dict) else None
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def gmail_auth_callback(request):
-    state = request.session.get('oauth_state')
-    flow = Flow.from_client_config(get_google_client_config(), scopes=SCOPES, state=state)
+    from google_auth_oauthlib.flow import Flow
+
+    payload = oauth_state(request)
+    user_id = payload.get('user') if payload else None
+    if payload is None or (user_id is not None and request.user.is_authenticated and request.user.pk != user_id):
+        return Response({'error': 'Invalid or expired OAuth state'}, status=403)
+    state = request.session.pop('oauth_state')
+    flow = Flow.from_client_config(get_google_client_config(), scopes=SCOPES, state=state,
+                                   code_verifier=request.session.pop('oauth_code_verifier', None))
     flow.redirect_uri = settings.GOOGLE_OAUTH2_REDIRECT_URI
     flow.fetch_token(authorization_response=request.build_absolute_uri())
 
@@ -68,6 +130,12 @@ def gmail_auth_callback(request):
     request.session['client_id'] = creds.client_id
     request.session['client_secret'] = creds.client_secret
     request.session['scopes'] = creds.scopes
+    # Keep the tokens on the profile too, for background sync (sync_gmail),
+    # when the flow was started by a known user (see gmail_auth_url)
+    user = User.objects.filter(pk=user_id, is_active=True).first() if user_id is not None else None
+    if user is not None:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        store_credentials(profile, creds)
 
     frontend_url = getattr(settings, "FRONTEND_URL", "http://localhost:3000")
     return redirect(f"{frontend_url}/dashboard?gmail=connected")
@@ -76,24 +144,23 @@ def gmail_auth_callback(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def gmail_conversations(request):
-    """Fetch last 10 emails from Gmail for logged-in user"""
-    try:
-        creds = Credentials(
-            token=request.session.get('gmail_token'),
-            refresh_token=request.session.get('refresh_token'),
-            token_uri=request.session.get('token_uri'),
-            client_id=request.session.get('client_id'),
-            client_secret=request.session.get('client_secret'),
-            scopes=request.session.get('scopes'),
-        )
-        service = build('gmail', 'v1', credentials=creds)
-        results = service.users().messages().list(userId='me', maxResults=10).execute()
-        messages = results.get('messages', [])
+    """Last 10 emails of the logged-in user; from the synced copy once sync_gmail has run"""
+    profile = Profile.objects.filter(user=request.user).only('gmail_history_id').first()
+    if profile is not None and profile.gmail_history_id:
+        rows = EmailMessage.objects.filter(owner=request.user).values_list(
+            'gmail_id', 'thread_id', 'sender', 'subject', 'snippet', 'internal_date',
+        )[:10]
+        return Response({'messages': [
+            {'id': gmail_id, 'thread_id': thread_id, 'sender': sender, 'subject': subject,
+             'snippet': snippet, 'date': date}
+            for gmail_id, thread_id, sender, subject, snippet, date in rows
+        ]})
 
-        snippets = []
-        for msg in messages:
-            full_msg = service.users().messages().get(userId='me', id=msg['id'], format='metadata').execute()
-            snippets.append({'id': msg['id'], 'snippet': full_msg.get('snippet', '')})
+    try:
+        service = get_gmail_service(request)
+        # One list call plus one batch request for the gets
+        fetched = fetch_recent(service, max_results=10, format='metadata')
+        snippets = [{'id': msg['id'], 'snippet': msg.get('snippet', '')} for msg in fetched.messages]
 
         return Response({'messages': snippets})
 
@@ -102,22 +169,59 @@ def gmail_conversations(request):
 
 
 # ---------------- CRM APIs ---------------- #
+def high_priority_queryset(user):
+    # Served by the partial index crm_lead_open_hot_idx; keep the filter in sync with its condition
+    return Lead.objects.filter(
+        customer__owner=user,
+        score__gte=80
+    ).exclude(status__in=['won', 'lost']).select_related('customer', 'updated_by')
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def high_priority_leads(request):
     """Leads with score >= 80 for current user, excluding won/lost"""
-    leads = Lead.objects.filter(
-        customer__owner=request.user,
-        score__gte=80
-    ).exclude(status__in=['won', 'lost'])
-    serializer = LeadSerializer(leads, many=True)
-    return Response(serializer.data)
+    def serialize():
+        return LeadSerializer(high_priority_queryset(request.user), many=True).data
+
+    # Cached per user until one of their leads or customers changes (crm.caching)
+    data = cached_for_owner(
+        request.user.pk, 'high-priority-leads', serialize,
+        timeout=getattr(settings, 'HIGH_PRIORITY_CACHE_TIMEOUT', 300),
+    )
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_summary(request):
+    """Counts behind the dashboard's quick stats and status chart, without listing any rows"""
+    def summarize():
+        leads = Lead.objects.filter(customer__owner=request.user)
+        by_status = dict(leads.order_by().values_list('status').annotate(count=Count('pk')))
+        return {
+            'total_leads': sum(by_status.values()),
+            'total_customers': Customer.objects.filter(owner=request.user).count(),
+            'won_leads': by_status.get(Lead.STATUS_WON, 0),
+            'high_score_leads': leads.filter(score__gte=80).count(),
+            'status_counts': by_status,
+        }
+
+    # Same per-owner invalidation as the high-priority list
+    data = cached_for_owner(
+        request.user.pk, 'dashboard-summary', summarize,
+        timeout=getattr(settings, 'HIGH_PRIORITY_CACHE_TIMEOUT', 300),
+    )
+    return Response(data)
 
 
 # ---------------- ViewSets ---------------- #
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseFieldsetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [filters.SearchFilter]
+    search_fields = ['name', 'description']
     queryset = Product.objects.all().order_by('-created_at')
 
     def get_queryset(self):
@@ -125,9 +229,16 @@ class ProductViewSet(viewsets.ModelViewSet):
         return self.queryset
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(CustomerBulkMixin, ExportMixin, SparseFieldsetMixin, ConditionalGetMixin, FastListMixin,
+                      viewsets.ModelViewSet):
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    export_columns = CUSTOMER_COLUMNS
+    export_filename = 'customers'
+    # ?search= narrows pickers and the list to matching customers, page by page
+    filter_backends = [filters.SearchFilter]
+    search_fields = ['name', 'email', 'phone', 'company']
     queryset = Customer.objects.all().order_by('-created_at')
 
     def get_queryset(self):
@@ -137,14 +248,57 @@ class CustomerViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class LeadViewSet(viewsets.ModelViewSet):
+class LeadViewSet(LeadBulkMixin, ExportMixin, SparseFieldsetMixin, ConditionalGetMixin, FastListMixin,
+                  viewsets.ModelViewSet):
     serializer_class = LeadSerializer
     permission_classes = [IsAuthenticated]
-    queryset = Lead.objects.all().order_by('-created_at')
+    pagination_class = CreatedAtCursorPagination
+    export_columns = LEAD_COLUMNS
+    export_filename = 'leads'
+    expandable_fields = ('customer',)
+    # The cursor, plus what score refreshing and cache invalidation read
+    sparse_required_fields = (
+        'created_at', 'customer', 'status', 'sentiment_score', 'score', 'score_model_version', 'enrichment_status',
+    )
+    fast_list_lookups = ('created_at', 'score_model_version', 'enrichment_status')
+    # LeadSerializer nests the customer and reads updated_by.username
+    queryset = Lead.objects.select_related('customer', 'updated_by').order_by('-created_at')
+
+    filter_backends = [filters.SearchFilter]
+    search_fields = ['title', 'customer__name']
 
     def get_queryset(self):
         return self.queryset.filter(customer__owner=self.request.user)
 
+    def filter_queryset(self, queryset):
+        # ?status= and ?sentiment= filter on the server, so paged lists stay complete
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        if params.get('sentiment'):
+            queryset = queryset.filter(sentiment__iexact=params['sentiment'])
+        return queryset
+
+    def fast_list_page_ok(self, plan, rows):
+        # Pages with stale stored scores take the serializer path, which re-scores and saves them
+        version = current_model_version()
+        return all(
+            row.score_model_version == version or row.enrichment_status == Lead.ENRICHMENT_PENDING
+            for row in rows
+        )
+
+    def etag_querysets(self):
+        # Leads embed their customer, so customer edits must change the ETag too
+        return super().etag_querysets() + [Customer.objects.filter(owner=self.request.user)]
+
+    def etag_extra(self):
+        # Reads re-score leads whose stored score came from another model version
+        return current_model_version()
+
+    def object_etag_parts(self, instance):
+        return (instance.pk, instance.updated_at, instance.customer.updated_at)
+
     def perform_create(self, serializer):
         serializer.save(updated_by=self.request.user)
 
@@ -152,6 +306,22 @@ class LeadViewSet(viewsets.ModelViewSet):
         serializer.save(updated_by=self.request.user)
 
 
+# ---------------- Delta Sync ---------------- #
+class SyncView(APIView):
+    """Leads, customers and products changed or deleted since ?since=<token>"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = decode_token(since)
+            except (ValueError, OverflowError, OSError):
+                raise ValidationError({'since': 'Invalid sync token.'})
+        return Response(sync_payload(request.user, since or None, now, context={'request': request}))
+
+
 # ---------------- Current User ---------------- #
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
@@ -174,13 +344,8 @@ def test_fetch_emails(request):
     """Fetch and parse last 5 emails from Gmail"""
     try:
         service = get_gmail_service(request)
-        results = service.users().messages().list(userId='me', labelIds=['INBOX'], maxResults=5).execute()
-        messages = results.get('messages', [])
-
-        emails = []
-        for msg in messages:
-            msg_data = service.users().messages().get(userId='me', id=msg['id']).execute()
-            emails.append(parse_message(msg_data))
+        fetched = fetch_recent(service, max_results=5, label_ids=['INBOX'])
+        emails = [parse_message(msg_data) for msg_data in fetched.messages]
 
         return JsonResponse(emails, safe=False)
     except Exception as e:
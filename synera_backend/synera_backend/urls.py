@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 from crm import views
-from crm.views import CurrentUserView, CustomerViewSet, LeadViewSet, ProductViewSet, RegistrationView
+from crm.views import CurrentUserView, CustomerViewSet, LeadViewSet, ProductViewSet, RegistrationView, SyncView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
@@ -18,6 +18,7 @@ urlpatterns = [
 
     # API routes (Customers, Leads, Products, etc.)
     path('api/', include(router.urls)),
+    path('api/sync/', SyncView.as_view(), name='sync'),
 
     path('api/gmail-test/', views.test_fetch_emails, name='test_fetch_emails'),
 
@@ -38,11 +39,15 @@ urlpatterns = [
 
     # Gmail integration
     path('gmail-auth/', views.gmail_auth_init),
+    path('api/gmail/auth-url/', views.gmail_auth_url, name='gmail-auth-url'),
     path('api/gmail/callback/', views.gmail_auth_callback, name='gmail-callback'),
     path('api/gmail/conversations/', views.gmail_conversations, name='gmail-conversations'),
 
     # Custom features
     path('high-priority-leads/', views.high_priority_leads, name='high_priority_leads'),
+    # Where the frontend (api base URL) polls it
+    path('api/high-priority-leads/', views.high_priority_leads, name='api_high_priority_leads'),
+    path('api/dashboard/', views.dashboard_summary, name='dashboard_summary'),
 
     path('registration/', RegistrationView.as_view(), name='registration'),
 